@@ -1,6 +1,3 @@
-# --- Стандартные библиотеки ---
-import asyncio
-
 # --- Сторонние библиотеки ---
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
@@ -9,7 +6,7 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
 
 # --- Внутренние модули ---
-from services.config import get_target_display_local, PURCHASE_COOLDOWN
+from services.config import get_target_display_local
 from services.menu import update_menu
 from services.gifts_bot import get_filtered_gifts
 from services.buy_bot import buy_gift
@@ -308,7 +305,6 @@ async def confirm_purchase(call: CallbackQuery, state: FSMContext):
             break
 
         bought += 1
-        await asyncio.sleep(PURCHASE_COOLDOWN)
 
     if bought == qty:
         await call.message.answer(f"✅ Покупка <b>{gift_display}</b> успешно завершена!\n"
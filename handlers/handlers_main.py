@@ -2,12 +2,11 @@
 from aiogram import F
 from aiogram.filters import CommandStart
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message
-from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, save_config, format_config_summary, get_target_display, ALLOWED_USER_IDS
-from services.menu import update_menu, config_action_keyboard 
+from services.config import get_valid_config, save_config, new_profile_id, format_config_summary, get_target_display, ALLOWED_USER_IDS
+from services.menu import update_menu, edit_menu
 from services.balance import refresh_balance
 from services.buy_bot import buy_gift
 from middlewares.access_control import show_guest_menu
@@ -157,22 +156,17 @@ def register_main_handlers(dp, bot, version):
         Сброс счетчиков купленных подарков и статусов выполнения по всем профилям.
         """
         config = await get_valid_config(call.from_user.id)
-        # Сбросить счетчики во всех профилях
+        # Сбросить счетчики во всех профилях. Новый ID отсекает покупки, записанные
+        # в журнал до сброса: они не доприменяются к сохраняемому конфигу
         for profile in config["PROFILES"]:
+            profile["ID"] = new_profile_id()
             profile["BOUGHT"] = 0
             profile["SPENT"] = 0
             profile["DONE"] = False
         config["ACTIVE"] = False
-        await save_config(config)
+        await save_config(config, notify=True)
         info = format_config_summary(config, call.from_user.id)
-        try:
-            await call.message.edit_text(
-                info,
-                reply_markup=config_action_keyboard(config["ACTIVE"])
-            )
-        except TelegramBadRequest as e:
-            if "message is not modified" not in str(e):
-                raise
+        await edit_menu(call.bot, call.message.chat.id, call.message.message_id, info, config["ACTIVE"])
         await call.answer("Счётчик покупок сброшен.")
 
 
@@ -183,12 +177,9 @@ def register_main_handlers(dp, bot, version):
         """
         config = await get_valid_config(call.from_user.id)
         config["ACTIVE"] = not config.get("ACTIVE", False)
-        await save_config(config)
+        await save_config(config, notify=True)
         info = format_config_summary(config, call.from_user.id)
-        await call.message.edit_text(
-            info,
-            reply_markup=config_action_keyboard(config["ACTIVE"])
-        )
+        await edit_menu(call.bot, call.message.chat.id, call.message.message_id, info, config["ACTIVE"])
         await call.answer("Статус обновлён")
 
 
@@ -222,5 +213,5 @@ def register_main_handlers(dp, bot, version):
             f'✅ Баланс успешно пополнен.',
             message_effect_id="5104841245755180586"
         )
-        balance = await refresh_balance(bot)
+        balance = await refresh_balance(bot, force=True)
         await update_menu(bot=bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
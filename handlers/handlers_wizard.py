@@ -14,6 +14,7 @@ from services.config import get_valid_config, get_target_display, save_config
 from services.menu import update_menu, payment_keyboard
 from services.balance import refresh_balance, refund_all_star_payments
 from services.config import CURRENCY, MAX_PROFILES, ALLOWED_USER_IDS, add_profile, remove_profile, update_profile
+from services.peers import get_bot_chat, schedule_profile_warmup
 from services.userbot import is_userbot_active, userbot_send_self, delete_userbot_session, start_userbot, continue_userbot_signin, finish_userbot_signin
 from middlewares.access_control import show_guest_menu
 from utils.misc import now_str, is_valid_profile_name, PHONE_REGEX, API_HASH_REGEX
@@ -181,7 +182,7 @@ async def userbot_enable_handler(call: CallbackQuery):
     bot_username = bot_user.username
     config = await get_valid_config(user_id)
     config["USERBOT"]["ENABLED"] = True
-    await save_config(config)
+    await save_config(config, notify=True)
 
     await call.answer()
 
@@ -212,7 +213,7 @@ async def userbot_disable_handler(call: CallbackQuery):
     bot_username = bot_user.username
     config = await get_valid_config(user_id)
     config["USERBOT"]["ENABLED"] = False
-    await save_config(config)
+    await save_config(config, notify=True)
 
     await call.answer()
 
@@ -581,7 +582,7 @@ async def on_profile_name_entered(message: Message, state: FSMContext):
         return
 
     profiles[idx]["NAME"] = name
-    await save_config(config)
+    await save_config(config, notify=True)
     await message.answer(f"✅ Имя профиля успешно изменено на: <b>{name}</b>")
 
     # Вернуться к меню профилей (вызывайте свою функцию профилей)
@@ -847,7 +848,7 @@ async def step_edit_max_price(message: Message, state: FSMContext):
         config = await get_valid_config(message.from_user.id)
         config["PROFILES"][idx]["MIN_PRICE"] = data["MIN_PRICE"]
         config["PROFILES"][idx]["MAX_PRICE"] = value
-        await save_config(config)
+        await save_config(config, notify=True)
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
@@ -926,7 +927,7 @@ async def step_edit_max_supply(message: Message, state: FSMContext):
         config = await get_valid_config(message.from_user.id)
         config["PROFILES"][idx]["MIN_SUPPLY"] = data["MIN_SUPPLY"]
         config["PROFILES"][idx]["MAX_SUPPLY"] = value
-        await save_config(config)
+        await save_config(config, notify=True)
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
@@ -965,7 +966,7 @@ async def step_edit_limit(message: Message, state: FSMContext):
         
         config = await get_valid_config(message.from_user.id)
         config["PROFILES"][idx]["LIMIT"] = value
-        await save_config(config)
+        await save_config(config, notify=True)
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
@@ -1004,7 +1005,7 @@ async def step_edit_count(message: Message, state: FSMContext):
         
         config = await get_valid_config(message.from_user.id)
         config["PROFILES"][idx]["COUNT"] = value
-        await save_config(config)
+        await save_config(config, notify=True)
 
         try:
             await message.bot.delete_message(message.chat.id, data["message_id"])
@@ -1062,7 +1063,8 @@ async def step_edit_user_id(message: Message, state: FSMContext):
     config["PROFILES"][idx]["TARGET_USER_ID"] = target_user
     config["PROFILES"][idx]["TARGET_CHAT_ID"] = target_chat
     config["PROFILES"][idx]["TARGET_TYPE"] = target_type
-    await save_config(config)
+    await save_config(config, notify=True)
+    schedule_profile_warmup(message.bot, config["PROFILES"][idx])
 
     try:
         await message.bot.delete_message(message.chat.id, data["message_id"])
@@ -1110,11 +1112,13 @@ async def save_sender_and_finish(call: CallbackQuery, state: FSMContext, sender:
 
     if idx is None:
         await add_profile(config, profile_data)
+        schedule_profile_warmup(call.bot, profile_data)
         msg = "✅ <b>Новый профиль</b> создан."
         await call.message.edit_text(msg)
         await profiles_menu(call.message, call.from_user.id)
     else:
         await update_profile(config, idx, profile_data)
+        schedule_profile_warmup(call.bot, profile_data)
         msg = f"✅ <b>Профиль {idx + 1}</b> обновлён."
         await call.message.edit_text(msg)
         await call.message.answer(
@@ -1268,7 +1272,7 @@ async def on_profile_delete_final(call: CallbackQuery):
                      "🚦 Статус изменён на 🔴 (неактивен)." if len(config["PROFILES"]) == 1 else "")
     if len(config["PROFILES"]) == 1:
         config["ACTIVE"] = False
-        await save_config(config)
+        await save_config(config, notify=True)
     await remove_profile(config, idx, call.from_user.id)
     await call.message.edit_text(f"✅ <b>Профиль {idx + 1}</b> удалён.{deafult_added}", reply_markup=None)
     await profiles_menu(call.message, call.from_user.id)
@@ -1563,7 +1567,7 @@ async def refund_input(message: Message, state: FSMContext):
             telegram_payment_charge_id=txn_id
         )
         await message.answer("✅ Возврат успешно выполнен.")
-        balance = await refresh_balance(message.bot)
+        balance = await refresh_balance(message.bot, force=True)
         await update_menu(bot=message.bot, chat_id=message.chat.id, user_id=message.from_user.id, message_id=message.message_id)
     except Exception as e:
         await message.answer(f"🚫 Ошибка при возврате:\n<code>{e}</code>")
@@ -1674,7 +1678,7 @@ async def withdraw_all_confirmed(call: CallbackQuery):
     else:
         await call.message.answer("🚫 Звёзд для возврата не найдено.")
 
-    balance = await refresh_balance(call.bot)
+    balance = await refresh_balance(call.bot, force=True)
     await update_menu(bot=call.bot, chat_id=call.message.chat.id, user_id=call.from_user.id, message_id=call.message.message_id)
 
 
@@ -1750,22 +1754,23 @@ async def try_cancel(message: Message, state: FSMContext) -> bool:
 async def get_chat_type(bot: Bot, username: str):
     """
     Определяет тип Telegram-объекта по username для каналов.
+    Результат bot.get_chat кешируется (services.peers), повторный запрос к API не выполняется.
     """
     if not username.startswith("@"):
         username = "@" + username
     try:
-        chat = await bot.get_chat(username)
-        if chat.type == "private":
-            if getattr(chat, "is_bot", False):
+        chat = await get_bot_chat(bot, username)
+        if chat["type"] == "private":
+            if chat["is_bot"]:
                 return "bot"
             else:
                 return "user"
-        elif chat.type == "channel":
+        elif chat["type"] == "channel":
             return "channel"
-        elif chat.type in ("group", "supergroup"):
+        elif chat["type"] in ("group", "supergroup"):
             return "group"
         else:
-            return chat.type  # на всякий случай
+            return chat["type"]  # на всякий случай
     except TelegramAPIError as e:
         logger.error(f"TelegramAPIError при получении юзернейма канала: {e}")
         return "unknown"
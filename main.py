@@ -15,20 +15,31 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from services.config import (
     ensure_config,
     save_config,
+    flush_config,
     get_valid_config,
     get_target_display,
     migrate_config_if_needed,
     add_allowed_user,
     DEFAULT_CONFIG,
     VERSION,
-    PURCHASE_COOLDOWN
+    DEV_MODE,
+    WORKER_WAKE_TIMEOUT
 )
 from services.menu import update_menu
-from services.balance import refresh_balance
-from services.gifts_manager import get_best_gift_list, userbot_gifts_updater
-from services.buy_bot import buy_gift
-from services.buy_userbot import buy_gift_userbot
-from services.userbot import try_start_userbot_from_config
+from services.balance import refresh_balance, balance_reconciler
+from services.gifts_manager import bot_gifts_poller, userbot_gifts_updater
+from services.catalog import get_merged_catalog
+from services.catalog_events import wait_for_changes, add_event_listener
+from services.purchase import execute_profile_purchases, on_catalog_events
+from services.planner import plan_purchases
+from services.balance_ledger import get_available_balances
+from services.userbot import try_start_userbot_from_config, start_userbot_pool
+from services.peers import warm_peer_cache
+from services.userbot_supervisor import userbot_supervisor
+from services.http_session import get_aiohttp_session, http_keepalive
+from services.proxy_pool import proxy_prober
+from services.webhook import run_webhook
+from services.ledger import replay_ledger, compact_ledger, ledger_compactor
 from handlers.handlers_wizard import register_wizard_handlers
 from handlers.handlers_catalog import register_catalog_handlers
 from handlers.handlers_main import register_main_handlers
@@ -39,6 +50,10 @@ from middlewares.rate_limit import RateLimitMiddleware
 load_dotenv(override=False)
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 USER_ID = int(os.getenv("TELEGRAM_USER_ID"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Если задан — обновления принимаются через webhook вместо polling
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 default_config = DEFAULT_CONFIG(USER_ID)
 ALLOWED_USER_IDS = []
 ALLOWED_USER_IDS.append(USER_ID)
@@ -48,171 +63,145 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+def format_profile_report(profile_index: int, profile: dict, purchases: list[dict], done: bool) -> list[str]:
+    """
+    Формирует строки отчёта по профилю: получатель, потраченная сумма и купленные подарки.
+
+    :param profile_index: Индекс профиля в конфиге
+    :param profile: Профиль после покупок
+    :param purchases: Список покупок {"id", "price"}
+    :param done: True — профиль завершён, False — выполнен частично
+    :return: Список строк отчёта
+    """
+    target_display = get_target_display(profile, USER_ID)
+    title = f"┌✅ <b>Профиль {profile_index+1}</b>" if done else f"┌⚠️ <b>Профиль {profile_index+1}</b> (частично)"
+    summary_lines = [
+        f"\n{title}\n"
+        f"├👤 <b>Получатель:</b> {target_display}\n"
+        f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {profile.get('LIMIT', 0):,} ★\n"
+        f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {profile['COUNT']}:"
+    ]
+    gift_summary = {}
+    for p in purchases:
+        key = p["id"]
+        if key not in gift_summary:
+            gift_summary[key] = {"price": p["price"], "count": 0}
+        gift_summary[key]["count"] += 1
+
+    gift_items = list(gift_summary.items())
+    for idx, (gid, data) in enumerate(gift_items):
+        prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
+        summary_lines.append(
+            f"{prefix} {data['price']:,} ★ × {data['count']}"
+        )
+    return summary_lines
+
+
+async def process_profile(bot, profile_index: int, profile: dict, planned: list) -> dict:
+    """
+    Выполняет план покупок одного профиля.
+    Запускается отдельной задачей, параллельно с другими профилями.
+
+    :param bot: Экземпляр бота
+    :param profile_index: Индекс профиля в конфиге
+    :param profile: Копия профиля (изменяется на месте: BOUGHT, SPENT)
+    :param planned: Покупки профиля из общего плана (plan_purchases)
+    :return: {"lines": строки отчёта, "progress": был ли прогресс, "all_ok": не было неудачных покупок}
+    """
+    result = {"lines": [], "progress": False, "all_ok": True}
+    COUNT = profile["COUNT"]
+    LIMIT = profile.get("LIMIT", 0)
+
+    before_bought = profile["BOUGHT"]
+    before_spent = profile["SPENT"]
+
+    # Покупки выполняются параллельно (до PURCHASE_CONCURRENCY одновременно)
+    purchases, result["all_ok"] = await execute_profile_purchases(bot, USER_ID, profile, planned)
+
+    made_local_progress = (profile["BOUGHT"] > before_bought) or (profile["SPENT"] > before_spent)
+
+    # Профиль полностью выполнен: либо по количеству, либо по лимиту
+    if profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT:
+        # Перечитываем конфиг перед записью: другие профили могли сохранить свои изменения
+        config = await get_valid_config(USER_ID)
+        config["PROFILES"][profile_index]["DONE"] = True
+        await save_config(config)
+
+        result["lines"] = format_profile_report(profile_index, profile, purchases, done=True)
+        result["progress"] = True
+        logger.info(f"Профиль #{profile_index+1} завершён")
+    # Если куплено не всё — баланс/лимит/подарки кончились
+    elif made_local_progress:
+        result["lines"] = format_profile_report(profile_index, profile, purchases, done=False)
+        result["progress"] = True
+        logger.warning(f"Профиль #{profile_index+1} не завершён")
+
+    return result
+
+
 async def gift_purchase_worker(bot):
     """
     Фоновый воркер для покупки подарков по профилям.
     Теперь учитывает параметр LIMIT — максимальную сумму звёзд, которую можно потратить на профиль.
-    Если лимит исчерпан — профиль считается завершённым и воркер переходит к следующему.
+    Если лимит исчерпан — профиль считается завершённым.
+    Перед покупками строится общий план (plan_purchases) по снимку каталога и свободным балансам;
+    затем профили плана выполняются параллельно, каждый в своей задаче,
+    ошибка одного профиля не прерывает остальные.
+    Задачи профилей живут один проход, а не постоянно: план распределяет остатки подарков
+    и балансы между всеми профилями по одному снимку, поэтому следующий план строится
+    только после завершения всех покупок текущего.
+    Просыпается только по событиям каталога (новый подарок, изменение остатка, распродажа)
+    или при изменении конфига; каталог опрашивает bot_gifts_poller.
     """
     await refresh_balance(bot)
     while True:
+        events = await wait_for_changes(timeout=WORKER_WAKE_TIMEOUT)
         try:
             config = await get_valid_config(USER_ID)
 
             if not config["ACTIVE"]:
-                await asyncio.sleep(1)
                 continue
 
+            if events:
+                logger.debug(f"Событий каталога: {len(events)}")
+
             message = None
             report_message_lines = []
             progress_made = False  # Был ли прогресс по профилям на этом проходе
             any_success = True
-
-            for profile_index, profile in enumerate(config["PROFILES"]):
-                # Пропускаем завершённые профили
-                if profile.get("DONE"):
+            snapshot = get_merged_catalog()  # Снимок каталога, общий для всех профилей на этом проходе
+
+            # План покупок строится целиком до первого send_gift: остатки подарков и балансы
+            # отправителей распределяются между всеми профилями сразу
+            balances = None if DEV_MODE else get_available_balances(config)
+            plan = plan_purchases(snapshot, config, balances)
+            if plan.unfunded:
+                logger.warning(f"Не хватает баланса для профилей: {', '.join(f'#{i+1}' for i in plan.unfunded)}")
+                any_success = False
+
+            profile_indexes = list(plan.items)
+            results = await asyncio.gather(
+                *(process_profile(bot, i, config["PROFILES"][i], plan.items[i]) for i in profile_indexes),
+                return_exceptions=True
+            )
+
+            # Отчёт собирается в порядке профилей, независимо от порядка завершения задач
+            for profile_index, result in zip(profile_indexes, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Ошибка при обработке профиля #{profile_index+1}: {result}")
+                    any_success = False
                     continue
-                # Пропускаем профили с выключенным юзерботом
-                sender = profile.get("SENDER", "bot")
-                if sender == "userbot":
-                    userbot_config = config.get("USERBOT", {})
-                    if not userbot_config.get("ENABLED", False):
-                        continue
-
-                COUNT = profile["COUNT"]
-                LIMIT = profile.get("LIMIT", 0)
-                TARGET_USER_ID = profile["TARGET_USER_ID"]
-                TARGET_CHAT_ID = profile["TARGET_CHAT_ID"]
-
-                filtered_gifts = await get_best_gift_list(bot, profile)
+                if not result["all_ok"]:
+                    any_success = False
+                if result["progress"]:
+                    progress_made = True
+                    report_message_lines += result["lines"]
 
-                if not filtered_gifts:
-                    continue
+            if progress_made:
+                await refresh_balance(bot, force=True)
 
-                purchases = []
-                before_bought = profile["BOUGHT"]
-                before_spent = profile["SPENT"]
-
-                for gift in filtered_gifts:
-                    gift_id = gift["id"]
-                    gift_price = gift["price"]
-                    gift_total_count = gift["supply"]
-                    sticker_file_id = gift["sticker_file_id"]
-
-                    # Проверяем лимит перед каждой покупкой
-                    while (profile["BOUGHT"] < COUNT and
-                           profile["SPENT"] + gift_price <= LIMIT):
-
-                        sender = profile.get("SENDER", "bot")
-                        if sender == "bot":
-                            success = await buy_gift(
-                                bot=bot,
-                                env_user_id=USER_ID,
-                                gift_id=gift_id,
-                                user_id=TARGET_USER_ID,
-                                chat_id=TARGET_CHAT_ID,
-                                gift_price=gift_price,
-                                file_id=sticker_file_id
-                            )
-                        elif sender == "userbot":
-                            userbot_config = config.get("USERBOT", {})
-                            success = await buy_gift_userbot(
-                                session_user_id=USER_ID,
-                                gift_id=gift_id,
-                                target_user_id=TARGET_USER_ID,
-                                target_chat_id=TARGET_CHAT_ID,
-                                gift_price=gift_price,
-                                file_id=sticker_file_id
-                            )
-                        else:
-                            logger.warning(f"Неизвестный отправитель SENDER={sender} в профиле {profile_index}")
-                            success = False
-
-                        if not success:
-                            any_success = False
-                            break  # Не удалось купить — пробуем следующий подарок
-
-                        config = await get_valid_config(USER_ID)
-                        profile = config["PROFILES"][profile_index]
-                        profile["BOUGHT"] += 1
-                        profile["SPENT"] += gift_price
-                        purchases.append({"id": gift_id, "price": gift_price})
-                        await save_config(config)
-                        await asyncio.sleep(PURCHASE_COOLDOWN)
-
-                        # Проверяем: не достигли ли лимит после покупки
-                        if profile["SPENT"] >= LIMIT:
-                            break
-
-                    if profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT:
-                        break  # Достигли лимит либо по количеству, либо по сумме
-
-                after_bought = profile["BOUGHT"]
-                after_spent = profile["SPENT"]
-                made_local_progress = (after_bought > before_bought) or (after_spent > before_spent)
-
-                # Профиль полностью выполнен: либо по количеству, либо по лимиту
-                if (profile["BOUGHT"] >= COUNT or profile["SPENT"] >= LIMIT) and not profile["DONE"]:
-                    config = await get_valid_config(USER_ID)
-                    profile = config["PROFILES"][profile_index]
-                    profile["DONE"] = True
-                    await save_config(config)
-
-                    target_display = get_target_display(profile, USER_ID)
-                    summary_lines = [
-                        f"\n┌✅ <b>Профиль {profile_index+1}</b>\n"
-                        f"├👤 <b>Получатель:</b> {target_display}\n"
-                        f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
-                        f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
-                    ]
-                    gift_summary = {}
-                    for p in purchases:
-                        key = p["id"]
-                        if key not in gift_summary:
-                            gift_summary[key] = {"price": p["price"], "count": 0}
-                        gift_summary[key]["count"] += 1
-
-                    gift_items = list(gift_summary.items())
-                    for idx, (gid, data) in enumerate(gift_items):
-                        prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
-                        summary_lines.append(
-                            f"{prefix} {data['price']:,} ★ × {data['count']}"
-                        )
-                    report_message_lines += summary_lines
-
-                    logger.info(f"Профиль #{profile_index+1} завершён")
-                    progress_made = True
-                    await refresh_balance(bot)
-                    continue  # К следующему профилю
-
-                # Если ничего не куплено — баланс/лимит/подарки кончились
-                if (profile["BOUGHT"] < COUNT or profile["SPENT"] < LIMIT) and not profile["DONE"] and made_local_progress:
-                    target_display = get_target_display(profile, USER_ID)
-                    summary_lines = [
-                        f"\n┌⚠️ <b>Профиль {profile_index+1}</b> (частично)\n"
-                        f"├👤 <b>Получатель:</b> {target_display}\n"
-                        f"├💸 <b>Потрачено:</b> {profile['SPENT']:,} / {LIMIT:,} ★\n"
-                        f"└🎁 <b>Куплено </b>{profile['BOUGHT']} из {COUNT}:"
-                    ]
-                    gift_summary = {}
-                    for p in purchases:
-                        key = p["id"]
-                        if key not in gift_summary:
-                            gift_summary[key] = {"price": p["price"], "count": 0}
-                        gift_summary[key]["count"] += 1
-
-                    gift_items = list(gift_summary.items())
-                    for idx, (gid, data) in enumerate(gift_items):
-                        prefix = "   └" if idx == len(gift_items) - 1 else "   ├"
-                        summary_lines.append(
-                            f"{prefix} {data['price']:,} ★ × {data['count']}"
-                        )
-                    report_message_lines += summary_lines
-
-                    logger.warning(f"Профиль #{profile_index+1} не завершён")
-                    progress_made = True
-                    await refresh_balance(bot)
-                    continue  # К следующему профилю
+            # Перечитываем конфиг: балансы и счётчики могли измениться через журнал покупок
+            config = await get_valid_config(USER_ID)
 
             if not any_success and not progress_made:
                 logger.warning(
@@ -252,24 +241,26 @@ async def gift_purchase_worker(bot):
         except Exception as e:
             logger.error(f"Ошибка в gift_purchase_worker: {e}")
 
-        await asyncio.sleep(0.5)
-
 
 async def main() -> None:
     """
     Асинхронная точка входа в приложение.
 
     - Мигрирует и проверяет конфигурационный файл (config.json)
-    - Создаёт HTTP-сессию и объект бота
+    - Восстанавливает несохранённые покупки из журнала (ledger.bin)
+    - Создаёт HTTP-сессию с пулом постоянных соединений (через самый быстрый прокси из PROXIES) и объект бота
     - Подключает middleware (ограничения и доступ)
     - Регистрирует хендлеры
-    - Запускает userbot (если он настроен)
-    - Запускает фоновые задачи (покупки, обновление кеша подарков)
-    - Запускает polling через aiogram Dispatcher
+    - Запускает userbot (если он настроен) и дополнительные сессии пула
+    - Запускает фоновые задачи (покупки, опрос каталога бота и юзербота, уплотнение журнала, сверка балансов,
+      прогрев кеша получателей, проверка соединений юзерботов, прогрев соединений Bot API, проверка прокси)
+    - Принимает обновления через webhook (если задан WEBHOOK_URL) или через polling aiogram Dispatcher
+    - При остановке сбрасывает на диск отложенные изменения конфига
     """
     logger.info("Бот запущен!")
     await migrate_config_if_needed(USER_ID)
     await ensure_config(USER_ID)
+    await replay_ledger(USER_ID)
 
     session = await get_aiohttp_session(USER_ID)
     bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
@@ -295,10 +286,29 @@ async def main() -> None:
 
     # Запуск userbot, если сессия уже существует
     await try_start_userbot_from_config(USER_ID)
+    await start_userbot_pool(USER_ID)
 
+    add_event_listener(on_catalog_events)  # Формы оплаты запрашиваются сразу при появлении подарка
     asyncio.create_task(gift_purchase_worker(bot))
+    asyncio.create_task(bot_gifts_poller(bot, USER_ID))
     asyncio.create_task(userbot_gifts_updater(USER_ID))
-    await dp.start_polling(bot)
+    asyncio.create_task(ledger_compactor())
+    asyncio.create_task(balance_reconciler(bot))
+    asyncio.create_task(warm_peer_cache(bot, USER_ID))
+    asyncio.create_task(userbot_supervisor())
+    asyncio.create_task(http_keepalive(bot))
+    asyncio.create_task(proxy_prober(bot))
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(dp, bot, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET)
+        else:
+            # getUpdates не работает, пока установлен webhook (например, после запуска в режиме webhook)
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        # Переносим журнал покупок и отложенные изменения конфига на диск перед остановкой
+        await compact_ledger()
+        await flush_config()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
@@ -1,9 +1,16 @@
 # --- Стандартные библиотеки ---
-from itertools import combinations
+import asyncio
 import logging
+import time
+from typing import Optional
 
 # --- Внутренние модули ---
-from services.config import load_config, save_config
+from services.config import load_config, save_config, BALANCE_RECONCILE_INTERVAL, BALANCE_CACHE_TTL
+from services.ledger import record_balance_change
+from services.balance_ledger import get_balance_ledger
+from services.refund_planner import plan_refund
+from services.star_transactions import star_transactions
+from services.refunds import refund_transactions
 from services.userbot import get_userbot_stars_balance
 
 # --- Сторонние библиотеки ---
@@ -24,88 +31,126 @@ async def get_stars_balance(bot) -> int:
 async def get_stars_balance_by_transactions(bot) -> int:
     """
     Получает суммарный баланс звёзд по всем транзакциям пользователя через API бота (устаревший метод).
+    С API догружаются только новые транзакции, остальные берутся из локальной истории.
     """
-    offset = 0
-    limit = 100
-    balance = 0
+    await star_transactions.sync(bot)
+    return star_transactions.balance
 
-    while True:
-        get_transactions = await bot.get_star_transactions(offset=offset, limit=limit)
-        transactions = get_transactions.transactions
-
-        if not transactions:
-            break
 
-        for transaction in transactions:
-            source = transaction.source
-            amount = transaction.amount
-            if source is not None:
-                balance += amount
-            else:
-                balance -= amount
+# Последний полученный баланс бота и время начала запроса, который его получил
+_cached_balance: Optional[int] = None
+_cached_at: Optional[float] = None
+# Выполняющийся запрос балансов, общий для всех одновременных вызовов refresh_balance
+_refresh_task: Optional[asyncio.Task] = None
+_refresh_started = 0.0
 
-        offset += limit
 
-    return balance
+async def _get_userbot_balance_safe(has_session: bool) -> Optional[int]:
+    """
+    Баланс юзербота; 0 — если сессия не настроена, None — если запрос не удался.
+    """
+    if not has_session:
+        logger.info("Userbot-сессия неактивна или не настроена.")
+        return 0
+    try:
+        return await get_userbot_balance()
+    except Exception as e:
+        logger.error(f"Не удалось получить баланс userbot: {e}")
+        return None
 
 
-async def refresh_balance(bot) -> int:
+async def _fetch_balances(bot) -> int:
     """
-    Обновляет и сохраняет баланс звёзд в конфиге, возвращает актуальное значение.
+    Запрашивает балансы бота и юзербота одновременно, сверяет балансы в памяти
+    и сохраняет конфиг, только если значения изменились.
     """
-    # Загрузка конфига
-    config = await load_config()
-    userbot_data = config.get("USERBOT", {})
-
-    # Баланс userbot-а (если сессия существует)
-    has_session = (
+    global _cached_balance, _cached_at
+    started = time.monotonic()
+    userbot_data = (await load_config()).get("USERBOT", {})
+    has_session = bool(
         userbot_data.get("API_ID")
         and userbot_data.get("API_HASH")
         and userbot_data.get("PHONE")
     )
-    if has_session:
-        try:
-            userbot_balance = await get_userbot_balance()
-            config["USERBOT"]["BALANCE"] = userbot_balance
-        except Exception as e:
-            config["USERBOT"]["BALANCE"] = 0
-            logger.error(f"Не удалось получить баланс userbot: {e}")
+    bot_ledger, userbot_ledger = get_balance_ledger("bot"), get_balance_ledger("userbot")
+    commits_before = (bot_ledger.commits, userbot_ledger.commits)
+    balance, userbot_balance = await asyncio.gather(
+        get_stars_balance(bot),
+        _get_userbot_balance_safe(has_session)
+    )
+    bot_ledger.reconcile(balance, commits_before[0])
+    if userbot_balance is not None:
+        userbot_ledger.reconcile(userbot_balance, commits_before[1])
     else:
-        logger.info("Userbot-сессия неактивна или не настроена.")
-        config["USERBOT"]["BALANCE"] = 0
+        userbot_balance = 0
 
-    # Баланс основного бота
-    balance = await get_stars_balance(bot)
-    config["BALANCE"] = balance
+    # Конфиг перечитывается после запросов: за время ожидания его могли изменить покупки
+    config = await load_config()
+    if config.get("BALANCE") != balance or config["USERBOT"].get("BALANCE") != userbot_balance:
+        config["BALANCE"] = balance
+        config["USERBOT"]["BALANCE"] = userbot_balance
+        await save_config(config)
 
-    # Сохраняем всё
-    await save_config(config)
+    _cached_balance, _cached_at = balance, started
     return balance
 
 
+async def refresh_balance(bot, force: bool = False) -> int:
+    """
+    Обновляет и сохраняет баланс звёзд в конфиге, возвращает актуальное значение.
+    Заодно сверяет с API балансы в памяти, из которых резервируются звёзды под покупки.
+
+    - В течение BALANCE_CACHE_TTL возвращается последний полученный баланс без запросов к API.
+    - Одновременные вызовы ждут один общий запрос.
+    - force=True — баланс запрашивается заново запросом, начатым не раньше вызова
+      (после пополнения, возврата или покупок).
+    """
+    global _refresh_task, _refresh_started
+    requested_at = time.monotonic()
+    while True:
+        if not force and _cached_at is not None and requested_at - _cached_at < BALANCE_CACHE_TTL:
+            return _cached_balance
+        task = _refresh_task
+        if task is None or task.done():
+            _refresh_started = time.monotonic()
+            task = _refresh_task = asyncio.create_task(_fetch_balances(bot))
+        if not force or _refresh_started >= requested_at:
+            return await asyncio.shield(task)
+        # Запрос начат до вызова и может не учитывать последние изменения — дожидаемся его и запрашиваем снова
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            pass
+
+
 async def change_balance(delta: int) -> int:
     """
     Изменяет баланс звёзд в конфиге на указанное значение delta, не допуская отрицательных значений.
+    Изменение записывается в журнал покупок, а не полной перезаписью config.json.
     """
-    config = await load_config()
-    config["BALANCE"] = max(0, config.get("BALANCE", 0) + delta)
-    balance = config["BALANCE"]
-    await save_config(config)
-    return balance
+    config = await record_balance_change(delta, sender="bot")
+    return config["BALANCE"]
 
 
 async def change_balance_userbot(delta: int) -> int:
     """
     Изменяет баланс звёзд юзербота в конфиге на указанное значение delta, не допуская отрицательных значений.
+    Изменение записывается в журнал покупок, а не полной перезаписью config.json.
     """
-    config = await load_config()
-    userbot = config.get("USERBOT", {})
-    current = userbot.get("BALANCE", 0)
-    new_balance = max(0, current + delta)
+    config = await record_balance_change(delta, sender="userbot")
+    return config["USERBOT"]["BALANCE"]
 
-    config["USERBOT"]["BALANCE"] = new_balance
-    await save_config(config)
-    return new_balance
+
+async def balance_reconciler(bot, interval: int = BALANCE_RECONCILE_INTERVAL):
+    """
+    Фоновая задача: периодически сверяет балансы бота и юзербота с API.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_balance(bot, force=True)
+        except Exception as e:
+            logger.error(f"Ошибка в balance_reconciler: {e}")
 
 
 async def refund_all_star_payments(bot, username, user_id, message_func=None):
@@ -113,81 +158,36 @@ async def refund_all_star_payments(bot, username, user_id, message_func=None):
     Возвращает звёзды только по депозитам без возврата, совершённым указанным username.
     Подбирает оптимальную комбинацию для вывода максимально возможной суммы.
     При необходимости сообщает пользователю о дальнейших действиях.
+    В results — итог по каждой транзакции (services.refunds.RefundResult).
     """
-    balance = await refresh_balance(bot)
+    balance = await refresh_balance(bot, force=True)
     if balance <= 0:
         return {"refunded": 0, "count": 0, "txn_ids": [], "left": 0}
 
-    # Получаем все транзакции
-    offset = 0
-    limit = 100
-    all_txns = []
-    while True:
-        res = await bot.get_star_transactions(offset=offset, limit=limit)
-        txns = res.transactions
-        if not txns:
-            break
-        all_txns.extend(txns)
-        offset += limit
-
-    # Фильтруем депозиты без возврата и только с нужным username
-    deposits = [
-        t for t in all_txns
-        if t.source is not None
-        and getattr(t.source, "user", None)
-        and getattr(t.source.user, "username", None) == username
-    ]
-    refunded_ids = {t.id for t in all_txns if t.source is None}
-    unrefunded_deposits = [t for t in deposits if t.id not in refunded_ids]
-
-    n = len(unrefunded_deposits)
-    best_combo = []
-    best_sum = 0
-
-    # Ищем идеальную комбинацию или greedy
-    if n <= 18:
-        for r in range(1, n+1):
-            for combo in combinations(unrefunded_deposits, r):
-                s = sum(t.amount for t in combo)
-                if s <= balance and s > best_sum:
-                    best_combo = combo
-                    best_sum = s
-                if best_sum == balance:
-                    break
-            if best_sum == balance:
-                break
+    # Догружаем новые транзакции и берём депозиты пользователя без возврата из локальной истории
+    await star_transactions.sync(bot)
+    if username:
+        unrefunded_deposits = star_transactions.unrefunded_deposits(username=username)
     else:
-        unrefunded_deposits.sort(key=lambda t: t.amount, reverse=True)
-        curr_sum = 0
-        best_combo = []
-        for t in unrefunded_deposits:
-            if curr_sum + t.amount <= balance:
-                best_combo.append(t)
-                curr_sum += t.amount
-        best_sum = curr_sum
+        unrefunded_deposits = star_transactions.unrefunded_deposits(user_id=user_id)
+
+    # Точный подбор депозитов с максимальной суммой не больше баланса
+    chosen = plan_refund([t.amount for t in unrefunded_deposits], balance)
+    best_combo = [unrefunded_deposits[i] for i in chosen]
+    best_sum = sum(t.amount for t in best_combo)
 
     if not best_combo:
         return {"refunded": 0, "count": 0, "txn_ids": [], "left": balance}
 
-    # Делаем возвраты только по выбранным транзакциям
-    total_refunded = 0
-    refund_ids = []
-    for txn in best_combo:
-        txn_id = getattr(txn, "id", None)
-        if not txn_id:
-            continue
-        try:
-            await bot.refund_star_payment(
-                user_id=user_id,
-                telegram_payment_charge_id=txn_id
-            )
-            total_refunded += txn.amount
-            refund_ids.append(txn_id)
-        except Exception as e:
-            if message_func:
-                await message_func(f"🚫 Ошибка при возврате ★{txn.amount}")
+    # Делаем возвраты только по выбранным транзакциям (параллельно, с повтором временных ошибок)
+    results = await refund_transactions(bot, user_id, best_combo)
+    refund_ids = [r.txn_id for r in results if r.ok]
+    total_refunded = sum(r.amount for r in results if r.ok)
+    failed = [r for r in results if not r.ok]
+    if failed and message_func:
+        await message_func(f"🚫 Ошибка при возврате: транзакций {len(failed)} на ★{sum(r.amount for r in failed)}")
 
-    left = balance - best_sum
+    left = balance - total_refunded
 
     # Находим транзакцию, которой хватит чтобы покрыть остаток
     # Берём минимальную сумму среди транзакций, где amount > min_needed
@@ -198,7 +198,8 @@ async def refund_all_star_payments(bot, username, user_id, message_func=None):
         best = min(bigger, key=lambda t: t.amount)
         return {"amount": best.amount, "id": getattr(best, "id", None)}
 
-    unused_deposits = [t for t in unrefunded_deposits if t not in best_combo]
+    refunded_set = set(refund_ids)
+    unused_deposits = [t for t in unrefunded_deposits if t.id not in refunded_set]
     next_possible = None
     if left > 0 and unused_deposits:
         next_possible = find_next_possible_deposit(unused_deposits, left)
@@ -208,7 +209,8 @@ async def refund_all_star_payments(bot, username, user_id, message_func=None):
         "count": len(refund_ids),
         "txn_ids": refund_ids,
         "left": left,
-        "next_deposit": next_possible
+        "next_deposit": next_possible,
+        "results": results
     }
 
 
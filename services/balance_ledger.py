@@ -0,0 +1,118 @@
+# --- Стандартные библиотеки ---
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceLedger:
+    """
+    Баланс звёзд одного отправителя в памяти с резервированием под покупки.
+
+    - reserve() перед отправкой запроса забирает сумму из доступного остатка.
+    - commit() после успешной покупки списывает зарезервированную сумму с баланса.
+    - release() после неудачной покупки возвращает резерв в доступный остаток.
+    - reconcile() сверяет баланс с фактическим значением из API, если на сервере
+      не может быть списаний, которых ещё нет в памяти (см. reconcile).
+    Операции синхронные, поэтому между await их не прерывают другие покупки.
+    """
+
+    def __init__(self, name: str):
+        """
+        :param name: Имя отправителя для логов
+        """
+        self.name = name
+        self.balance: Optional[int] = None  # None — баланс ещё ни разу не сверялся
+        self.reserved = 0
+        self.commits = 0  # Число успешных покупок, списанных в памяти
+
+    @property
+    def available(self) -> int:
+        """
+        Баланс за вычетом зарезервированных сумм.
+        """
+        return (self.balance or 0) - self.reserved
+
+    def is_loaded(self) -> bool:
+        """
+        True, если баланс уже известен.
+        """
+        return self.balance is not None
+
+    def reserve(self, amount: int) -> bool:
+        """
+        Резервирует amount звёзд под покупку.
+
+        :return: True, если звёзд достаточно и сумма зарезервирована
+        """
+        if self.available < amount:
+            return False
+        self.reserved += amount
+        return True
+
+    def commit(self, amount: int) -> int:
+        """
+        Списывает ранее зарезервированную сумму после успешной покупки.
+
+        :return: Новый баланс
+        """
+        self.reserved = max(0, self.reserved - amount)
+        self.balance = max(0, (self.balance or 0) - amount)
+        self.commits += 1
+        return self.balance
+
+    def release(self, amount: int):
+        """
+        Снимает резерв после неудачной покупки.
+        """
+        self.reserved = max(0, self.reserved - amount)
+
+    def reconcile(self, actual: int, commits_before: Optional[int] = None) -> bool:
+        """
+        Приводит баланс к фактическому значению из API.
+
+        Сверка пропускается, пока есть резервы: покупка могла уже пройти на сервере
+        (и войти в actual), а её commit() списал бы сумму второй раз. Так же пропускается
+        сверка, если за время запроса баланса в памяти были списаны покупки
+        (commits_before — значение commits перед запросом): actual может их ещё не учитывать.
+        Первая загрузка баланса выполняется всегда.
+
+        :return: True, если баланс сверен
+        """
+        if self.balance is not None:
+            if self.reserved or (commits_before is not None and commits_before != self.commits):
+                logger.debug(f"Сверка баланса ({self.name}) пропущена: есть незавершённые покупки")
+                return False
+            if self.balance != actual:
+                logger.info(f"Баланс ({self.name}) сверен: {self.balance} → {actual}")
+        self.balance = actual
+        return True
+
+
+# Отдельный баланс для бота и для юзербота
+_balance_ledgers = {
+    "bot": BalanceLedger("bot"),
+    "userbot": BalanceLedger("userbot"),
+}
+
+
+def get_balance_ledger(sender: str) -> BalanceLedger:
+    """
+    Возвращает баланс отправителя ("bot" или "userbot").
+    """
+    return _balance_ledgers[sender]
+
+
+def get_available_balances(config: dict) -> dict[str, int]:
+    """
+    Свободные (не зарезервированные) балансы бота и юзербота.
+    Если баланс отправителя ещё не сверялся с API — берётся значение из конфига.
+    """
+    balances = {
+        "bot": config.get("BALANCE", 0),
+        "userbot": config.get("USERBOT", {}).get("BALANCE", 0),
+    }
+    for sender, ledger in _balance_ledgers.items():
+        if ledger.is_loaded():
+            balances[sender] = ledger.available
+    return balances
@@ -9,6 +9,9 @@ from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramR
 # --- Внутренние модули ---
 from services.config import get_valid_config, save_config, DEV_MODE
 from services.balance import change_balance
+from services.rate_limiter import get_purchase_limiter
+from services.balance_ledger import get_balance_ledger
+from services.peers import get_cached_bot_chat_id
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +39,10 @@ async def buy_gift(
         file_id: ID файла (не используется в этой версии бота).
         retries: Количество попыток при ошибках.
 
+    Частота запросов ограничивается общим для бота token bucket,
+    скорость которого подстраивается по TelegramRetryAfter.
+    Стоимость подарка резервируется в балансе бота в памяти и списывается только после успешной покупки.
+
     Возвращает:
         True, если покупка успешна, иначе False.
     """
@@ -45,46 +52,64 @@ async def buy_gift(
         logger.info(f"[ТЕСТ] ({result}) Покупка подарка {gift_id} за {gift_price} (имитация, баланс не трогаем)")
         return result
     
-    # Обычная логика
-    config = await get_valid_config(env_user_id)
-    balance = config["BALANCE"]
-    if balance < gift_price:
-        logger.error(f"Недостаточно звёзд для покупки подарка {gift_id} (требуется: {gift_price}, доступно: {balance})")
-        
+    # Обычная логика: звёзды резервируются в балансе в памяти, без чтения конфига на каждую покупку
+    ledger = get_balance_ledger("bot")
+    if not ledger.is_loaded():
         config = await get_valid_config(env_user_id)
-        config["ACTIVE"] = False
-        await save_config(config)
+        ledger.reconcile(config["BALANCE"])
+    if not ledger.reserve(gift_price):
+        if ledger.balance < gift_price:
+            logger.error(f"Недостаточно звёзд для покупки подарка {gift_id} (требуется: {gift_price}, доступно: {ledger.balance})")
 
+            config = await get_valid_config(env_user_id)
+            config["ACTIVE"] = False
+            await save_config(config)
+        else:
+            logger.warning(f"Звёзды зарезервированы другими покупками, подарок {gift_id} пропущен (требуется: {gift_price}, свободно: {ledger.available})")
         return False
-    
-    for attempt in range(1, retries + 1):
-        try:
-            if user_id is not None and chat_id is None:
-                result = await bot.send_gift(gift_id=gift_id, user_id=user_id)
-            elif user_id is None and chat_id is not None:
-                result = await bot.send_gift(gift_id=gift_id, chat_id=chat_id)
-            else:
-                logger.warning("Указаны оба параметра — user_id и chat_id. Прерываем.")
-                break
 
-            if result:
-                new_balance = await change_balance(int(-gift_price))
-                logger.info(f"Успешная покупка подарка {gift_id} за {gift_price} звёзд. Остаток: {new_balance}")
-                return True
+    # Username канала заменяется на числовой ID из кеша получателей, если он уже известен
+    chat_id = await get_cached_bot_chat_id(bot, chat_id)
+
+    limiter = get_purchase_limiter("bot")
+    committed = False
+    try:
+        for attempt in range(1, retries + 1):
+            await limiter.acquire()
+            try:
+                if user_id is not None and chat_id is None:
+                    result = await bot.send_gift(gift_id=gift_id, user_id=user_id)
+                elif user_id is None and chat_id is not None:
+                    result = await bot.send_gift(gift_id=gift_id, chat_id=chat_id)
+                else:
+                    logger.warning("Указаны оба параметра — user_id и chat_id. Прерываем.")
+                    break
+
+                if result:
+                    limiter.on_success()
+                    new_balance = ledger.commit(gift_price)
+                    committed = True
+                    await change_balance(int(-gift_price))
+                    logger.info(f"Успешная покупка подарка {gift_id} за {gift_price} звёзд. Остаток: {new_balance}")
+                    return True
             
-            logger.error(f"Попытка {attempt}/{retries}: Не удалось купить подарок {gift_id}. Повтор...")
+                logger.error(f"Попытка {attempt}/{retries}: Не удалось купить подарок {gift_id}. Повтор...")
 
-        except TelegramRetryAfter as e:
-            logger.error(f"Flood wait: ждём {e.retry_after} секунд")
-            await asyncio.sleep(e.retry_after)
+            except TelegramRetryAfter as e:
+                logger.error(f"Flood wait: ждём {e.retry_after} секунд")
+                limiter.on_flood(e.retry_after)
 
-        except TelegramNetworkError as e:
-            logger.error(f"Попытка {attempt}/{retries}: Сетевая ошибка: {e}. Повтор через {2**attempt} секунд...")
-            await asyncio.sleep(2**attempt)
+            except TelegramNetworkError as e:
+                logger.error(f"Попытка {attempt}/{retries}: Сетевая ошибка: {e}. Повтор через {2**attempt} секунд...")
+                await asyncio.sleep(2**attempt)
 
-        except TelegramAPIError as e:
-            logger.error(f"Ошибка Telegram API: {e}")
-            break
+            except TelegramAPIError as e:
+                logger.error(f"Ошибка Telegram API: {e}")
+                break
 
-    logger.error(f"Не удалось купить подарок {gift_id} после {retries} попыток.")
-    return False
\ No newline at end of file
+        logger.error(f"Не удалось купить подарок {gift_id} после {retries} попыток.")
+        return False
+    finally:
+        # Покупка не состоялась — возвращаем резерв в доступный баланс
+        if not committed:
+            ledger.release(gift_price)
@@ -4,12 +4,13 @@ import logging
 import random
 
 # --- Внутренние модули ---
-from services.config import get_valid_config, save_config, DEV_MODE
+from services.config import get_valid_config, save_config, DEV_MODE, USERBOT_MAX_FLOOD_WAIT
 from services.balance import change_balance_userbot
-from services.userbot import get_userbot_client
+from services.userbot_pool import select_purchase_member, all_members_blocked, min_flood_remaining
+from services.balance_ledger import get_balance_ledger
+from services.payment_forms import send_star_gift, has_payment_form
+from services.peers import get_recipient
 
-from pyrogram import Client
-from pyrogram.types import Message
 from pyrogram.errors import (
     FloodWait,
     BadRequest,
@@ -42,77 +43,119 @@ async def buy_gift_userbot(
     :param retries: Количество попыток
     :param add_test_purchases: Включает случайные покупки в режиме разработки
     :return: True, если покупка успешна
+
+    Покупка выполняется через сессию пула юзерботов, у которой хватает баланса и флуд-штраф
+    был раньше всех (сессии с заранее полученной формой оплаты — в первую очередь);
+    после FloodWait следующая попытка идёт через другую сессию. Если все сессии под
+    флуд-ограничением дольше USERBOT_MAX_FLOOD_WAIT, покупка сразу завершается неудачей.
+    Частота запросов ограничивается token bucket сессии, скорость которого подстраивается по FloodWait.
+    Стоимость подарка резервируется в балансе юзербота в памяти и списывается только после успешной покупки.
+    Оплата использует заранее полученные формы (services.payment_forms), если они есть.
     """
     if add_test_purchases or DEV_MODE:
         result = random.choice([True, True, True, False])
         logger.info(f"[ТЕСТ] ({result}) Покупка подарка {gift_id} за {gift_price} (userbot, имитация)")
         return result
 
-    config = await get_valid_config(session_user_id)
-    userbot_config = config.get("USERBOT", {})
-    userbot_balance = userbot_config.get("BALANCE", 0)
-
-    if userbot_balance < gift_price:
-        logger.error(f"Недостаточно звёзд для покупки подарка {gift_id} (требуется: {gift_price}, доступно: {userbot_balance})")
-        
+    # Звёзды резервируются в балансе юзербота в памяти, без чтения конфига на каждую покупку
+    ledger = get_balance_ledger("userbot")
+    if not ledger.is_loaded():
         config = await get_valid_config(session_user_id)
-        config["USERBOT"]["ENABLED"] = False
-        await save_config(config)
-
+        ledger.reconcile(config.get("USERBOT", {}).get("BALANCE", 0))
+    if not ledger.reserve(gift_price):
+        if ledger.balance < gift_price:
+            logger.error(f"Недостаточно звёзд для покупки подарка {gift_id} (требуется: {gift_price}, доступно: {ledger.balance})")
+
+            config = await get_valid_config(session_user_id)
+            config["USERBOT"]["ENABLED"] = False
+            await save_config(config)
+        else:
+            logger.warning(f"Звёзды зарезервированы другими покупками, подарок {gift_id} пропущен (требуется: {gift_price}, свободно: {ledger.available})")
         return False
 
-    client: Client = await get_userbot_client(session_user_id)
-    if not client:
-        logger.error("Не удалось получить объект клиента userbot.")
+    recipient = get_recipient(target_user_id, target_chat_id)
+    if recipient is None:
+        logger.warning("Указаны оба параметра — target_user_id и target_chat_id. Прерываем.")
+        ledger.release(gift_price)
         return False
 
-    for attempt in range(1, retries + 1):
-        try:
-            logger.debug(f"Попытка {attempt}/{retries} покупки подарка юзерботом...")
-
-            if target_user_id and not target_chat_id:
-                result_send: Message = await client.send_gift(gift_id=int(gift_id), 
-                                                         chat_id=int(target_user_id), 
-                                                         is_private=True)
-            elif target_chat_id and not target_user_id:
-                result_send: Message = await client.send_gift(gift_id=int(gift_id), 
-                                                         chat_id=target_chat_id, 
-                                                         is_private=True)
-            else:
-                logger.warning("Указаны оба параметра — target_user_id и target_chat_id. Прерываем.")
-                break
-
-            new_balance = await change_balance_userbot(-gift_price)
-            logger.info(f"Успешная покупка подарка {gift_id} за {gift_price} звёзд. Остаток: {new_balance}")
-            return True
+    committed = False
+    member = None
+    try:
+        for attempt in range(1, retries + 1):
+            # Сессия пула: со свободным балансом и самым давним флуд-штрафом
+            if member is None:
+                if all_members_blocked():
+                    wait = min_flood_remaining()
+                    if wait > USERBOT_MAX_FLOOD_WAIT:
+                        # Не держим резерв и слот покупки часами — подарок будет куплен в следующем проходе
+                        logger.error(f"Все сессии юзербота под флуд-ограничением ещё {wait} сек, подарок {gift_id} пропущен.")
+                        return False
+                    await asyncio.sleep(wait)
+                member = select_purchase_member(
+                    gift_price,
+                    prefer=lambda m: has_payment_form(m.client, gift_id, recipient)
+                )
+                if member is None:
+                    logger.error(f"Нет сессии юзербота с достаточным балансом для покупки подарка {gift_id}.")
+                    return False
+
+            await member.limiter.acquire()
+            try:
+                logger.debug(f"Попытка {attempt}/{retries} покупки подарка юзерботом {member.name}...")
+
+                # Если форма оплаты получена заранее — остаётся один запрос вместо двух.
+                # Пока запрос идёт, proxy_pool не переподключает сессию
+                member.in_flight += 1
+                try:
+                    await send_star_gift(member.client, gift_id, recipient, hide_name=True)
+                finally:
+                    member.in_flight -= 1
+
+                member.limiter.on_success()
+                member.commit(gift_price)
+                new_balance = ledger.commit(gift_price)
+                committed = True
+                await change_balance_userbot(-gift_price)
+                logger.info(f"Успешная покупка подарка {gift_id} за {gift_price} звёзд ({member.name}). Остаток: {new_balance}")
+                return True
         
-        except FloodWait as e:
-            logger.error(f"Flood wait: ждём {e.retry_after} секунд")
-            await asyncio.sleep(e.value)
-
-        except BadRequest as e:
-            if "BALANCE_TOO_LOW" in str(e) or "not enough" in str(e).lower():
-                logger.error(f"Недостаточно звёзд: {e}")
+            except FloodWait as e:
+                logger.error(f"Flood wait ({member.name}): ждём {e.value} секунд")
+                member.on_flood(e.value)
+                # Следующая попытка — через другую сессию пула, если она свободна
+                member.release(gift_price)
+                member = None
+
+            except BadRequest as e:
+                if "BALANCE_TOO_LOW" in str(e) or "not enough" in str(e).lower():
+                    logger.error(f"Недостаточно звёзд: {e}")
+                    return False
+                logger.error(f"(BadRequest) Критическая ошибка: {e}")
                 return False
-            logger.error(f"(BadRequest) Критическая ошибка: {e}")
-            return False
 
-        except Forbidden as e:
-            logger.error(f"(Forbidden) Критическая ошибка: {e}")
-            return False
+            except Forbidden as e:
+                logger.error(f"(Forbidden) Критическая ошибка: {e}")
+                return False
         
-        except AuthKeyUnregistered as e:
-            logger.error(f"(AuthKeyUnregistered) Критическая ошибка: {e}")
-            return False
+            except AuthKeyUnregistered as e:
+                logger.error(f"(AuthKeyUnregistered) Критическая ошибка: {e}")
+                return False
 
-        except RPCError as e:
-            logger.error(f"RPC ошибка: {e}")
-            await asyncio.sleep(2 ** attempt)
+            except RPCError as e:
+                logger.error(f"RPC ошибка: {e}")
+                await asyncio.sleep(2 ** attempt)
 
-        except Exception as e:
-            delay = 2 ** attempt
-            logger.error(f"[{attempt}/{retries}] Ошибка userbot при покупке: {e}. Повтор через {delay} сек...")
-            await asyncio.sleep(delay)
+            except Exception as e:
+                delay = 2 ** attempt
+                logger.error(f"[{attempt}/{retries}] Ошибка userbot при покупке: {e}. Повтор через {delay} сек...")
+                await asyncio.sleep(delay)
 
-    logger.error(f"Не удалось купить подарок {gift_id} после {retries} попыток.")
-    return False
+        logger.error(f"Не удалось купить подарок {gift_id} после {retries} попыток.")
+        return False
+    finally:
+        # Покупка не состоялась — возвращаем резерв в доступный баланс
+        if not committed:
+            ledger.release(gift_price)
+            if member is not None:
+                member.release(gift_price)
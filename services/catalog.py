@@ -0,0 +1,170 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+
+# --- Сторонние библиотеки ---
+from aiogram.exceptions import TelegramRetryAfter
+
+# --- Внутренние модули ---
+from services.config import BOT_CATALOG_TTL, CATALOG_MAX_AGE
+from services.gifts_bot import get_bot_gifts, filter_gifts
+from services.polling import bot_poll_scheduler
+from services.catalog_events import diff_catalog, publish_events
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога подарков на момент запроса.
+    Один снимок разделяется всеми профилями в рамках прохода воркера.
+    """
+    gifts: tuple = ()
+    fetched_at: float = 0.0
+    source: str = "bot"
+
+    @classmethod
+    def from_gifts(cls, gifts: list[dict], source: str = "bot", fetched_at: Optional[float] = None) -> "CatalogSnapshot":
+        """
+        Создаёт снимок из списка нормализованных подарков (словари замораживаются).
+        """
+        return cls(
+            gifts=tuple(MappingProxyType(dict(g)) for g in gifts),
+            fetched_at=fetched_at if fetched_at is not None else time.time(),
+            source=source
+        )
+
+    def age(self) -> float:
+        """
+        Возраст снимка в секундах.
+        """
+        return time.time() - self.fetched_at
+
+    def signature(self) -> frozenset:
+        """
+        Отпечаток снимка для обнаружения изменений: набор пар (id, left).
+        """
+        return frozenset((str(g["id"]), g.get("left")) for g in self.gifts)
+
+    def filter(self, min_price, max_price, min_supply, max_supply, unlimited=False) -> list[dict]:
+        """
+        Фильтрует подарки снимка. Возвращает изменяемые копии, отсортированные по цене по убыванию.
+        """
+        return filter_gifts(self.gifts, min_price, max_price, min_supply, max_supply, unlimited)
+
+    def filter_by_profile(self, profile: dict) -> list[dict]:
+        """
+        Фильтрует подарки снимка по параметрам профиля.
+        """
+        return self.filter(
+            profile["MIN_PRICE"],
+            profile["MAX_PRICE"],
+            profile["MIN_SUPPLY"],
+            profile["MAX_SUPPLY"]
+        )
+
+
+_bot_snapshot: Optional[CatalogSnapshot] = None
+_bot_lock = asyncio.Lock()
+
+# Общий каталог всех источников: id подарка (строка) -> подарок с полями source и updated_at
+_merged_gifts: dict[str, dict] = {}
+_source_updated_at: dict[str, float] = {"bot": 0.0, "userbot": 0.0}
+# Готовность источников (для юзербота — по данным userbot_supervisor)
+_source_ready: dict[str, bool] = {"bot": True, "userbot": True}
+
+
+def set_source_ready(source: str, ready: bool):
+    """
+    Отмечает источник готовым или неготовым. Данные неготового источника
+    не попадают в общий каталог, не дожидаясь истечения CATALOG_MAX_AGE.
+    """
+    _source_ready[source] = ready
+
+
+def merge_catalog(snapshot: CatalogSnapshot):
+    """
+    Вливает снимок одного источника в общий каталог.
+    Для каждого подарка остаются данные (left/supply) из самого свежего источника.
+    Подарки, пропавшие из каталога источника, который обновлял их последним, удаляются.
+    Изменения публикуются в очередь событий каталога. Сравнивается то, что видно в
+    get_merged_catalog: подарок, данные о котором устарели (например, пока бот был выключен
+    и каталог не опрашивался), при обновлении снова порождает событие GiftAdded.
+
+    :param snapshot: Полный снимок каталога источника ("bot" или "userbot")
+    """
+    source = snapshot.source
+    fetched_at = snapshot.fetched_at
+    if fetched_at < _source_updated_at.get(source, 0.0):
+        return  # Запоздавший ответ — уже есть данные новее
+    _source_updated_at[source] = fetched_at
+    before = {key: gift.get("left") for key, gift in _visible_gifts().items()}
+
+    seen = set()
+    for gift in snapshot.gifts:
+        # Bot API и MTProto возвращают id в разных типах
+        key = str(gift["id"])
+        seen.add(key)
+        current = _merged_gifts.get(key)
+        if current is None or fetched_at >= current["updated_at"]:
+            _merged_gifts[key] = dict(gift, id=key, source=source, updated_at=fetched_at)
+
+    for key in [k for k, g in _merged_gifts.items() if g["source"] == source and k not in seen]:
+        del _merged_gifts[key]
+
+    publish_events(diff_catalog(before, _visible_gifts(), source))
+
+
+def _visible_gifts(max_age: float = CATALOG_MAX_AGE) -> dict[str, dict]:
+    """
+    Подарки общего каталога со свежими данными от готовых источников.
+    """
+    now = time.time()
+    return {
+        key: g for key, g in _merged_gifts.items()
+        if now - g["updated_at"] < max_age and _source_ready.get(g["source"], True)
+    }
+
+
+def get_merged_catalog(max_age: float = CATALOG_MAX_AGE) -> CatalogSnapshot:
+    """
+    Возвращает снимок общего каталога. Подарки, данные о которых старше max_age
+    или получены от неготового источника, не включаются.
+
+    :param max_age: Максимальный возраст данных о подарке (в секундах)
+    :return: CatalogSnapshot с source="merged"
+    """
+    gifts = list(_visible_gifts(max_age).values())
+    fetched_at = max(_source_updated_at.values(), default=0.0)
+    return CatalogSnapshot.from_gifts(gifts, source="merged", fetched_at=fetched_at)
+
+
+async def get_bot_catalog(bot, max_age: float = BOT_CATALOG_TTL) -> CatalogSnapshot:
+    """
+    Возвращает снимок каталога бота. Если снимок старше max_age — запрашивает каталог заново.
+    Одновременные вызовы ожидают один общий запрос к API.
+
+    :param bot: Экземпляр бота aiogram
+    :param max_age: Максимальный возраст снимка (в секундах); 0 — всегда запрашивать заново
+    :return: CatalogSnapshot
+    """
+    global _bot_snapshot
+    requested_at = time.time()
+    if _bot_snapshot and _bot_snapshot.age() < max_age:
+        return _bot_snapshot
+    async with _bot_lock:
+        # Снимок мог обновиться, пока ждали блокировку
+        if _bot_snapshot and _bot_snapshot.fetched_at >= requested_at:
+            return _bot_snapshot
+        try:
+            gifts = await get_bot_gifts(bot)
+        except TelegramRetryAfter as e:
+            bot_poll_scheduler.on_flood(e.retry_after)
+            raise
+        previous = _bot_snapshot
+        _bot_snapshot = CatalogSnapshot.from_gifts(gifts, source="bot")
+        bot_poll_scheduler.on_result(previous is None or previous.signature() != _bot_snapshot.signature())
+        merge_catalog(_bot_snapshot)
+    return _bot_snapshot
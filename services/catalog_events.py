@@ -0,0 +1,120 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Mapping, Optional
+
+# --- Внутренние модули ---
+from services.config import config_changed
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogEvent:
+    """
+    Базовое событие изменения каталога.
+    """
+    gift_id: str
+    source: str
+
+
+@dataclass(frozen=True)
+class GiftAdded(CatalogEvent):
+    """
+    В каталоге появился новый подарок.
+    """
+    price: int
+    supply: Optional[int]
+    left: Optional[int]
+
+
+@dataclass(frozen=True)
+class SupplyChanged(CatalogEvent):
+    """
+    Изменился остаток (left) подарка.
+    """
+    previous_left: Optional[int]
+    left: Optional[int]
+
+
+@dataclass(frozen=True)
+class SoldOut(CatalogEvent):
+    """
+    Подарок распродан или пропал из каталога.
+    """
+
+
+catalog_events: asyncio.Queue = asyncio.Queue()
+_listeners: list[Callable[[list["CatalogEvent"]], None]] = []  # Вызываются сразу при публикации событий
+
+
+def add_event_listener(listener: Callable[[list[CatalogEvent]], None]):
+    """
+    Подписывает обработчик на события каталога. Обработчик вызывается синхронно
+    в момент публикации, до того как воркер покупок заберёт события из очереди.
+    """
+    _listeners.append(listener)
+
+
+def diff_catalog(before: Mapping[str, Optional[int]], after: Mapping[str, Mapping], source: str) -> list[CatalogEvent]:
+    """
+    Сравнивает каталог до и после обновления и формирует список событий.
+
+    :param before: id подарка -> left до обновления
+    :param after: id подарка -> подарок после обновления
+    :param source: Источник обновления ("bot" или "userbot")
+    :return: Список событий
+    """
+    events = []
+    for gift_id, gift in after.items():
+        left = gift.get("left")
+        if gift_id not in before:
+            events.append(GiftAdded(gift_id, source, gift.get("price", 0), gift.get("supply"), left))
+        elif before[gift_id] != left:
+            if left == 0:
+                events.append(SoldOut(gift_id, source))
+            else:
+                events.append(SupplyChanged(gift_id, source, before[gift_id], left))
+    for gift_id in before:
+        if gift_id not in after:
+            events.append(SoldOut(gift_id, source))
+    return events
+
+
+def publish_events(events: list[CatalogEvent]):
+    """
+    Публикует события в общую очередь и передаёт их подписчикам.
+    """
+    for event in events:
+        catalog_events.put_nowait(event)
+    if not events:
+        return
+    for listener in _listeners:
+        try:
+            listener(events)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике событий каталога: {e}")
+
+
+async def wait_for_changes(timeout: Optional[float] = None) -> list[CatalogEvent]:
+    """
+    Ожидает событие каталога или изменение конфига (или истечение timeout).
+    Возвращает все накопившиеся события каталога (пустой список — сработал конфиг или таймаут).
+    """
+    if catalog_events.empty() and not config_changed.is_set():
+        waiters = {
+            asyncio.create_task(catalog_events.get()),
+            asyncio.create_task(config_changed.wait())
+        }
+        done, pending = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        events = [task.result() for task in done if isinstance(task.result(), CatalogEvent)]
+    else:
+        events = []
+
+    config_changed.clear()
+    while not catalog_events.empty():
+        events.append(catalog_events.get_nowait())
+    return events
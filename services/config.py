@@ -1,8 +1,11 @@
 # --- Стандартные библиотеки ---
+import asyncio
+import copy
 import json
 import os
 import logging
-from typing import Optional
+import secrets
+from typing import Callable, Optional
 
 # --- Сторонние библиотеки ---
 import aiofiles
@@ -14,16 +17,94 @@ VERSION = '1.3.0'
 CONFIG_PATH = "config.json"
 DEV_MODE = False # Покупка тестовых подарков
 MAX_PROFILES = 3 # Максимальная длина сообщения 4096 символов
-PURCHASE_COOLDOWN = 0.3 # Количество покупок в секунду
+PURCHASE_CONCURRENCY = 3 # Сколько покупок одного отправителя может выполняться одновременно
+PURCHASE_RATE = 3.0 # Начальная скорость покупок на одного отправителя (покупок в секунду)
+PURCHASE_MIN_RATE = 0.5 # Минимальная скорость покупок после флуд-ограничений (покупок в секунду)
+PURCHASE_MAX_RATE = 20.0 # Максимальная скорость покупок (покупок в секунду)
+PURCHASE_BURST = 3 # Сколько покупок можно выполнить подряд без ожидания
+PURCHASE_RATE_INCREASE = 0.5 # Прирост скорости после каждой успешной покупки
+PURCHASE_RATE_DECREASE = 0.5 # Множитель скорости при FloodWait/RetryAfter
+BOT_CATALOG_TTL = 0.5 # Время жизни снимка каталога подарков бота (в секундах)
+BOT_POLL_MIN_INTERVAL = 0.3 # Минимальный интервал опроса каталога через бота (в секундах)
+BOT_POLL_INTERVAL = 0.5 # Обычный интервал опроса каталога через бота (в секундах)
+BOT_POLL_MAX_INTERVAL = 3 # Максимальный интервал опроса каталога через бота при затишье (в секундах)
+USERBOT_POLL_MIN_INTERVAL = 2 # Минимальный интервал опроса каталога через юзербот (в секундах)
 USERBOT_UPDATE_COOLDOWN = 50 # Базовая величина ожидания в секундах для запроса списка подарков через юзербот
+USERBOT_POLL_MAX_INTERVAL = 60 # Максимальный интервал опроса каталога через юзербот при затишье (в секундах)
+POLL_HOT_WINDOW = 120 # Сколько секунд после изменения каталога опрашивать с минимальным интервалом
+POLL_QUIET_AFTER = 900 # Через сколько секунд без изменений каталога начинать увеличивать интервал
+DROP_WINDOWS = [] # Ожидаемые окна выхода подарков (UTC), например [("16:55", "17:30")]
+CATALOG_HEDGED_FETCH = True # Запрашивать каталог у бота и юзербота одновременно
+CATALOG_MAX_AGE = USERBOT_POLL_MAX_INTERVAL + 10 # Максимальный возраст данных о подарке в общем каталоге (в секундах)
+CONFIG_FLUSH_DELAY = 1.0 # Задержка отложенной записи config.json на диск (в секундах)
+WORKER_WAKE_TIMEOUT = 30 # Максимальное время сна воркера покупок без событий (в секундах)
+LEDGER_PATH = "ledger.bin" # Журнал покупок и изменений баланса (append-only)
+LEDGER_FSYNC_DELAY = 0.2 # Окно группировки записей журнала перед fsync (в секундах)
+LEDGER_COMPACT_INTERVAL = 30 # Период переноса журнала в config.json (в секундах)
+BALANCE_RECONCILE_INTERVAL = 60 # Период сверки балансов бота и юзербота с API (в секундах)
+BALANCE_CACHE_TTL = 5 # Сколько секунд refresh_balance отдаёт последний полученный баланс без запроса к API
+USERBOT_MAX_FLOOD_WAIT = 60 # Дольше этого покупка не ждёт снятия флуд-ограничения с сессий пула (в секундах)
+USERBOT_PING_INTERVAL = 30 # Период проверки соединения каждой сессии юзербота (в окнах DROP_WINDOWS — втрое чаще), в секундах
+USERBOT_PING_TIMEOUT = 10 # Таймаут ответа на ping, после которого сессия считается неготовой (в секундах)
+USERBOT_RECONNECT_MIN_DELAY = 2 # Начальная пауза между попытками переподключения сессии (в секундах)
+USERBOT_RECONNECT_MAX_DELAY = 300 # Максимальная пауза между попытками переподключения сессии (в секундах)
+PAYMENT_FORM_TTL = 300 # Время жизни заранее полученной формы оплаты подарка юзерботом (Telegram принимает форму до 10 минут), в секундах
+PAYMENT_FORM_PREFETCH = PURCHASE_CONCURRENCY # Сколько форм оплаты держать наготове для одной пары (подарок, получатель)
+BOT_HTTP_POOL_SIZE = 20 # Максимум одновременных HTTP-соединений с Bot API
+BOT_HTTP_KEEPALIVE_TIMEOUT = 75 # Сколько секунд держать простаивающее соединение с Bot API открытым
+BOT_HTTP_DNS_TTL = 3600 # Время кеширования DNS-ответа для api.telegram.org (в секундах)
+BOT_HTTP_WARM_CONNECTIONS = PURCHASE_CONCURRENCY + 1 # Сколько соединений с Bot API открывать заранее и держать прогретыми
+BOT_HTTP_PING_INTERVAL = 30 # Период keep-alive запросов к Bot API, не дающих соединениям закрыться (в секундах)
+PROXY_PROBE_HOST = "api.telegram.org" # Адрес, до которого измеряется задержка каждого прокси
+PROXY_PROBE_PORT = 443 # Порт для проверки задержки прокси
+PROXY_PROBE_INTERVAL = 30 # Период проверки задержки прокси (в секундах)
+PROXY_PROBE_TIMEOUT = 5 # Таймаут проверки прокси; превышение считается отказом (в секундах)
+PROXY_MAX_FAILURES = 2 # Сколько отказов подряд, чтобы прокси считался нерабочим
+PROXY_SWITCH_MARGIN = 1.5 # Во сколько раз текущий прокси должен быть медленнее лучшего для переключения
+PROXY_SWITCH_COOLDOWN = 600 # Не чаще этого переключаться на более быстрый прокси, пока текущий рабочий (в секундах)
+PROXY_DRAIN_TIMEOUT = 60 # Сколько ждать завершения покупок сессии юзербота перед её переподключением (в секундах)
+WEBHOOK_QUEUE_SIZE = 1000 # Максимум обновлений в очереди webhook; при переполнении Telegram повторит доставку позже
+WEBHOOK_WORKERS = 8 # Сколько обновлений webhook обрабатывается одновременно
+WEBHOOK_MAX_BODY = 1024 * 1024 # Максимальный размер тела запроса webhook (в байтах)
+WEBHOOK_READ_CHUNK = 64 * 1024 # Размер порции при потоковом чтении тела запроса webhook (в байтах)
+WEBHOOK_DRAIN_TIMEOUT = 10 # Сколько ждать обработки оставшихся в очереди обновлений при остановке (в секундах)
+REFUND_DP_MAX_BITS = 1 << 27 # Лимит памяти точного подбора возвратов (в битах), при превышении суммы депозитов масштабируются
+REFUND_MITM_MAX_ITEMS = 36 # До скольких депозитов можно использовать перебор «встреча посередине», если динамика не помещается в лимит
+STAR_TXN_PATH = "star_transactions.json" # Локальная копия истории транзакций звёзд бота
+STAR_TXN_PAGE_SIZE = 100 # Транзакций на страницу get_star_transactions (максимум API)
+REFUND_CONCURRENCY = 5 # Сколько возвратов звёзд выполняется одновременно
+REFUND_RETRIES = 3 # Попыток возврата одной транзакции при временных ошибках (сеть, флуд-ограничение, ошибка сервера)
+PEER_CACHE_PATH = "peers.json" # Кеш получателей подарков (input peer с access_hash, типы чатов)
+PEER_CACHE_TTL = 24 * 60 * 60 # Через сколько секунд запись кеша получателей обновляется в фоне
 ALLOWED_USER_IDS = []
 
+# Хранилище конфигурации в памяти: path -> конфиг.
+# Чтения обслуживаются из памяти, запись на диск выполняется отложенно (write-behind).
+_config_cache: dict[str, dict] = {}
+_validated_paths: set[str] = set()
+_config_versions: dict[str, int] = {}  # Версия конфига в памяти: растёт при каждом изменении
+_flush_tasks: dict[str, asyncio.Task] = {}
+_dirty_paths: set[str] = set()  # Конфиги с изменениями, ещё не записанными на диск
+_write_locks: dict[str, asyncio.Lock] = {}
+# Записи журнала покупок, применённые к конфигу в памяти: path -> [(seq, функция применения)]
+_ledger_records: dict[str, list[tuple[int, Callable[[dict], None]]]] = {}
+_ledger_compacted_seq: dict[str, int] = {}  # LEDGER_SEQ последнего уплотнения журнала
+config_changed = asyncio.Event()  # Устанавливается при изменении конфига пользователем (будит воркер покупок)
+
 def add_allowed_user(user_id):
     ALLOWED_USER_IDS.append(user_id)
 
+def new_profile_id() -> int:
+    """
+    Постоянный идентификатор профиля: записи журнала покупок ссылаются на него,
+    а не на индекс, который сдвигается при удалении профилей.
+    """
+    return secrets.randbits(62)
+
 def DEFAULT_PROFILE(user_id: int) -> dict:
     """Создаёт профиль с дефолтными настройками для указанного пользователя."""
     return {
+        "ID": new_profile_id(),
         "NAME": None,
         "MIN_PRICE": 5000,
         "MAX_PRICE": 10000,
@@ -46,6 +127,8 @@ def DEFAULT_CONFIG(user_id: int) -> dict:
         "BALANCE": 0,
         "ACTIVE": False,
         "LAST_MENU_MESSAGE_ID": None,
+        "LEDGER_SEQ": 0,
+        "PROXIES": [],
         "PROFILES": [DEFAULT_PROFILE(user_id)],
         "USERBOT": {
             "API_ID": None,
@@ -54,12 +137,14 @@ def DEFAULT_CONFIG(user_id: int) -> dict:
             "USER_ID": None,
             "USERNAME": None,
             "BALANCE": 0,
-            "ENABLED": False
+            "ENABLED": False,
+            "POOL": []
         }
     }
 
 # Типы и требования для каждого поля профиля
 PROFILE_TYPES = {
+    "ID": (int, False),
     "NAME": (str, True),
     "MIN_PRICE": (int, False),
     "MAX_PRICE": (int, False),
@@ -81,6 +166,8 @@ CONFIG_TYPES = {
     "BALANCE": (int, False),
     "ACTIVE": (bool, False),
     "LAST_MENU_MESSAGE_ID": (int, True),
+    "LEDGER_SEQ": (int, False),
+    "PROXIES": (list, False),
     "PROFILES": (list, False),
     "USERBOT": (dict, False)
 }
@@ -99,6 +186,8 @@ async def ensure_config(user_id: int, path: str = CONFIG_PATH):
     """
     Гарантирует существование config.json.
     """
+    if path in _config_cache:
+        return
     if not os.path.exists(path):
         async with aiofiles.open(path, mode="w", encoding="utf-8") as f:
             await f.write(json.dumps(DEFAULT_CONFIG(user_id), indent=2))
@@ -107,24 +196,171 @@ async def ensure_config(user_id: int, path: str = CONFIG_PATH):
 
 async def load_config(path: str = CONFIG_PATH) -> dict:
     """
-    Загружает конфиг из файла (без валидации). Гарантирует, что файл существует.
+    Загружает конфиг (без валидации). С диска читает только при первом обращении,
+    далее отдаёт копию из памяти. Гарантирует, что файл существует.
     """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Файл {path} не найден. Используйте ensure_config.")
-    async with aiofiles.open(path, mode="r", encoding="utf-8") as f:
-        data = await f.read()
-        return json.loads(data)
+    if path not in _config_cache:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Файл {path} не найден. Используйте ensure_config.")
+        async with aiofiles.open(path, mode="r", encoding="utf-8") as f:
+            data = await f.read()
+        _config_cache[path] = json.loads(data)
+    return copy.deepcopy(_config_cache[path])
+
+
+def get_config_version(path: str = CONFIG_PATH) -> int:
+    """
+    Возвращает версию конфига в памяти. Версия увеличивается при каждом сохранении,
+    поэтому по ней можно кешировать всё, что вычисляется из конфига.
+    """
+    return _config_versions.get(path, 0)
+
+
+class StaleConfigError(RuntimeError):
+    """
+    Конфиг загружен слишком давно: записи журнала после него уже забыты, и объединить изменения нельзя.
+    """
+
+
+def add_ledger_record(seq: int, apply: Callable[[dict], None], path: str = CONFIG_PATH):
+    """
+    Запоминает запись журнала покупок, только что применённую к конфигу в памяти.
+    По этим записям save_config дополняет конфиг, загруженный до них.
+    """
+    _ledger_records.setdefault(path, []).append((seq, apply))
+
+
+def forget_ledger_records(applied_seq: int, path: str = CONFIG_PATH):
+    """
+    Вызывается после переноса журнала в config.json. Записи, перенесённые предыдущим
+    уплотнением, забываются; перенесённые текущим хранятся ещё один цикл — для конфигов,
+    загруженных незадолго до уплотнения.
+    """
+    keep_after = _ledger_compacted_seq.get(path, 0)
+    _ledger_records[path] = [r for r in _ledger_records.get(path, []) if r[0] > keep_after]
+    _ledger_compacted_seq[path] = applied_seq
+
+
+def _merge_ledger_records(config: dict, current_seq: int, path: str):
+    """
+    Доприменяет к устаревшему конфигу записи журнала, появившиеся после его загрузки.
+    """
+    loaded_seq = config.get("LEDGER_SEQ", 0)
+    missing = [(seq, apply) for seq, apply in _ledger_records.get(path, []) if loaded_seq < seq <= current_seq]
+    if len(missing) != current_seq - loaded_seq:
+        raise StaleConfigError(
+            f"Конфиг {path} загружен до записи журнала {loaded_seq + 1}, текущая — {current_seq}"
+        )
+    for _, apply in missing:
+        apply(config)
+    config["LEDGER_SEQ"] = current_seq
+    logger.debug(f"К сохраняемому конфигу доприменены записи журнала {loaded_seq + 1}..{current_seq}")
 
 
-async def save_config(config: dict, path: str = CONFIG_PATH):
+async def save_config(config: dict, path: str = CONFIG_PATH, persist: bool = True, notify: bool = False):
+    """
+    Сохраняет конфиг в память и планирует отложенную запись в файл.
+    Если конфиг был загружен до последних записей журнала покупок (LEDGER_SEQ меньше текущего),
+    эти записи применяются к нему повторно, чтобы не потерять покупки и изменения баланса.
+
+    :param persist: Если False — только обновляет память (сохранность обеспечивает журнал покупок)
+    :param notify: Изменение сделано пользователем — разбудить воркер покупок (собственные
+                   сохранения воркера и служебные записи его не будят)
+    :raises StaleConfigError: Если нужные записи журнала уже забыты
     """
-    Сохраняет конфиг в файл.
+    new_config = copy.deepcopy(config)
+    cached = _config_cache.get(path)
+    if cached is not None and cached.get("LEDGER_SEQ", 0) > new_config.get("LEDGER_SEQ", 0):
+        _merge_ledger_records(new_config, cached["LEDGER_SEQ"], path)
+    _config_cache[path] = new_config
+    _validated_paths.discard(path)
+    _config_versions[path] = _config_versions.get(path, 0) + 1
+    if notify:
+        config_changed.set()
+    if not persist:
+        return
+    _dirty_paths.add(path)
+    task = _flush_tasks.get(path)
+    if task is None or task.done():
+        _flush_tasks[path] = asyncio.create_task(_delayed_flush(path))
+
+
+async def _delayed_flush(path: str):
     """
-    async with aiofiles.open(path, mode="w", encoding="utf-8") as f:
+    Ждёт CONFIG_FLUSH_DELAY и записывает накопленные изменения одним действием.
+    Задача остаётся в _flush_tasks до конца записи; изменения, сделанные во время записи,
+    и неудачная запись приводят к повторной записи через CONFIG_FLUSH_DELAY.
+    """
+    try:
+        while path in _dirty_paths:
+            await asyncio.sleep(CONFIG_FLUSH_DELAY)
+            # Отмена задачи (flush_config при остановке) не прерывает уже начатую запись
+            await asyncio.shield(_flush_now(path))
+    finally:
+        if _flush_tasks.get(path) is asyncio.current_task():
+            _flush_tasks.pop(path, None)
+
+
+async def _flush_now(path: str) -> bool:
+    """
+    Записывает конфиг на диск, если в нём есть незаписанные изменения.
+    Записи одного файла выполняются по очереди.
+
+    :return: False, если запись не удалась (изменения остаются незаписанными)
+    """
+    async with _write_locks.setdefault(path, asyncio.Lock()):
+        if path not in _dirty_paths:
+            return True
+        _dirty_paths.discard(path)
+        try:
+            await _write_config(path)
+        except Exception as e:
+            _dirty_paths.add(path)
+            logger.error(f"Не удалось сохранить конфигурацию {path}: {e}. Повтор через {CONFIG_FLUSH_DELAY} сек")
+            return False
+        return True
+
+
+async def _write_config(path: str):
+    """
+    Атомарно записывает конфиг из памяти в файл (через временный файл).
+    """
+    config = _config_cache.get(path)
+    if config is None:
+        return
+    tmp_path = f"{path}.tmp"
+    async with aiofiles.open(tmp_path, mode="w", encoding="utf-8") as f:
         await f.write(json.dumps(config, indent=2))
+    os.replace(tmp_path, path)
     logger.info(f"Конфигурация сохранена.")
 
 
+async def flush_config(path: Optional[str] = None):
+    """
+    Немедленно записывает на диск все отложенные изменения конфига (например, при остановке).
+    Если запись уже идёт — дожидается её.
+    """
+    paths = [path] if path else list(set(_flush_tasks) | _dirty_paths)
+    for p in paths:
+        task = _flush_tasks.pop(p, None)
+        if task is not None and not task.done():
+            task.cancel()
+        await _flush_now(p)
+
+
+def _forget_config(path: str):
+    """
+    Сбрасывает копию конфига в памяти, чтобы следующее чтение пошло с диска.
+    """
+    task = _flush_tasks.pop(path, None)
+    if task and not task.done():
+        task.cancel()
+    _config_cache.pop(path, None)
+    _validated_paths.discard(path)
+    _dirty_paths.discard(path)
+    _config_versions[path] = _config_versions.get(path, 0) + 1
+
+
 async def validate_profile(profile: dict, user_id: Optional[int] = None) -> dict:
     """
     Валидирует один профиль.
@@ -174,15 +410,19 @@ async def validate_config(config: dict, user_id: int) -> dict:
 
 async def get_valid_config(user_id: int, path: str = CONFIG_PATH) -> dict:
     """
-    Загружает, валидирует и при необходимости обновляет config.json.
+    Возвращает валидный конфиг. Валидация выполняется только после изменений,
+    повторные чтения обслуживаются из памяти без обращения к диску.
     """
+    if path in _validated_paths:
+        return copy.deepcopy(_config_cache[path])
     await ensure_config(user_id, path)
     config = await load_config(path)
     validated = await validate_config(config, user_id)
     # Если валидированная версия отличается, сохранить
     if validated != config:
         await save_config(validated, path)
-    return validated
+    _validated_paths.add(path)
+    return copy.deepcopy(_config_cache[path])
 
 
 async def migrate_config_if_needed(user_id: int, path: str = CONFIG_PATH):
@@ -199,6 +439,7 @@ async def migrate_config_if_needed(user_id: int, path: str = CONFIG_PATH):
             config = json.loads(data)
     except Exception:
         logger.error(f"Конфиг {path} повреждён.")
+        _forget_config(path)
         os.remove(path)
         logger.error(f"Повреждённый конфиг {path} удалён.")
         return
@@ -234,6 +475,7 @@ async def migrate_config_if_needed(user_id: int, path: str = CONFIG_PATH):
 
     async with aiofiles.open(path, "w", encoding="utf-8") as f:
         await f.write(json.dumps(new_config, ensure_ascii=False, indent=2))
+    _forget_config(path)
     logger.info(f"Конфиг {path} мигрирован в новый формат.")
 
 
@@ -254,9 +496,10 @@ async def add_profile(config: dict, profile: dict, save: bool = True) -> dict:
     """
     Добавляет новый профиль в конфиг.
     """
+    profile.setdefault("ID", new_profile_id())
     config.setdefault("PROFILES", []).append(profile)
     if save:
-        await save_config(config)
+        await save_config(config, notify=True)
     return config
 
 
@@ -266,9 +509,10 @@ async def update_profile(config: dict, index: int, new_profile: dict, save: bool
     """
     if "PROFILES" not in config or index >= len(config["PROFILES"]):
         raise IndexError("Профиль не найден")
+    new_profile.setdefault("ID", config["PROFILES"][index].get("ID", new_profile_id()))
     config["PROFILES"][index] = new_profile
     if save:
-        await save_config(config)
+        await save_config(config, notify=True)
     return config
 
 
@@ -283,7 +527,7 @@ async def remove_profile(config: dict, index: int, user_id: int, save: bool = Tr
         # Добавить дефолтный если удалили все
         config["PROFILES"].append(DEFAULT_PROFILE(user_id))
     if save:
-        await save_config(config)
+        await save_config(config, notify=True)
     return config
 
 
@@ -19,6 +19,52 @@ def normalize_gift(gift) -> dict:
     }
 
 
+def filter_gifts(
+    gifts: list[dict],
+    min_price,
+    max_price,
+    min_supply,
+    max_supply,
+    unlimited=False
+) -> list[dict]:
+    """
+    Фильтрует нормализованные подарки по цене и supply, сортирует по цене по убыванию.
+
+    :param gifts: Список нормализованных подарков.
+    :param unlimited: Если True — игнорировать supply при фильтрации.
+    :return: Новый список словарей с подходящими подарками.
+    """
+    filtered = []
+    for gift in gifts:
+        price_ok = min_price <= gift["price"] <= max_price
+        # Логика по unlimited
+        if unlimited:
+            supply_ok = True
+        else:
+            supply = gift["supply"] or 0
+            supply_ok = min_supply <= supply <= max_supply
+        if price_ok and supply_ok:
+            filtered.append(dict(gift))
+    filtered.sort(key=lambda g: g["price"], reverse=True)
+    return filtered
+
+
+async def get_bot_gifts(bot, add_test_gifts=False, test_gifts_count=5) -> list[dict]:
+    """
+    Получает полный каталог подарков из API бота в нормализованном виде (без фильтрации).
+
+    :param bot: Экземпляр бота aiogram.
+    :param add_test_gifts: Добавлять тестовые подарки в конец списка.
+    :param test_gifts_count: Количество тестовых подарков.
+    :return: Список словарей с параметрами подарков.
+    """
+    api_gifts = await bot.get_available_gifts()
+    gifts = [normalize_gift(gift) for gift in api_gifts.gifts]
+    if add_test_gifts or DEV_MODE:
+        gifts += generate_test_gifts(test_gifts_count)
+    return gifts
+
+
 async def get_filtered_gifts(
     bot, 
     min_price, 
@@ -42,32 +88,5 @@ async def get_filtered_gifts(
     :param test_gifts_count: Количество тестовых подарков.
     :return: Список словарей с параметрами подарков, отсортированный по цене по убыванию.
     """
-    # Получаем, нормализуем и фильтруем подарки из маркета
-    api_gifts = await bot.get_available_gifts()
-    filtered = []
-    for gift in api_gifts.gifts:
-        price_ok = min_price <= gift.star_count <= max_price
-        # Логика по unlimited
-        if unlimited:
-            supply_ok = True
-        else:
-            supply = gift.total_count or 0
-            supply_ok = min_supply <= supply <= max_supply
-        if price_ok and supply_ok:
-            filtered.append(gift)
-    normalized = [normalize_gift(gift) for gift in filtered]
-
-    # Получаем и фильтруем тестовые подарки отдельно
-    test_gifts = []
-    if add_test_gifts or DEV_MODE:
-        test_gifts = generate_test_gifts(test_gifts_count)
-        test_gifts = [
-            gift for gift in test_gifts
-            if min_price <= gift["price"] <= max_price and (
-                unlimited or min_supply <= gift["supply"] <= max_supply
-            )
-        ]
-
-    all_gifts = normalized + test_gifts
-    all_gifts .sort(key=lambda g: g["price"], reverse=True)
-    return all_gifts 
+    gifts = await get_bot_gifts(bot, add_test_gifts, test_gifts_count)
+    return filter_gifts(gifts, min_price, max_price, min_supply, max_supply, unlimited)
@@ -1,97 +1,207 @@
 # --- Стандартные библиотеки ---
 import time
-import random
 import asyncio
 import logging
+from functools import partial
+
+# --- Сторонние библиотеки ---
+from pyrogram.errors import FloodWait
 
 # --- Внутренние модули ---
-from services.config import USERBOT_UPDATE_COOLDOWN
-from services.gifts_bot import get_filtered_gifts
+from services.config import CATALOG_HEDGED_FETCH, get_valid_config
+from services.polling import bot_poll_scheduler, userbot_poll_scheduler
+from services.catalog import CatalogSnapshot, get_bot_catalog, merge_catalog, get_merged_catalog
 from services.gifts_userbot import get_userbot_filtered_gifts
+from services.userbot import is_userbot_active
+from services.userbot_pool import all_members_blocked, is_pool_ready
 
 logger = logging.getLogger(__name__)
 
 userbot_all_gifts: list[dict] = []
 last_update_userbot: float = 0
 
-async def userbot_gifts_updater(user_id: int, base_interval: int = USERBOT_UPDATE_COOLDOWN):
+_userbot_fetch_task: asyncio.Task | None = None  # Текущий запрос каталога через юзербота
+_background_tasks: set[asyncio.Task] = set()  # Запросы, которые дозавершаются в фоне
+_known_gift_ids: set[str] = set()  # Подарки, уже замеченные хотя бы одним источником
+_userbot_signature: frozenset | None = None  # Отпечаток последнего каталога юзербота
+
+
+async def refresh_userbot_gifts(user_id: int) -> CatalogSnapshot:
+    """
+    Запрашивает полный каталог через юзербота, обновляет кеш userbot_all_gifts
+    и вливает результат в общий каталог.
+
+    :param user_id: Telegram ID владельца userbot-сессии
+    :return: CatalogSnapshot с подарками юзербота
+    """
+    global userbot_all_gifts, last_update_userbot, _userbot_signature
+    try:
+        userbot_all_gifts = await get_userbot_filtered_gifts(
+            user_id,
+            min_price=1,
+            max_price=10000000,
+            min_supply=1,
+            max_supply=100000000,
+            unlimited=False
+        )
+    except FloodWait as e:
+        # Пока в пуле есть свободные сессии, опрос продолжается через них
+        if all_members_blocked():
+            userbot_poll_scheduler.on_flood(e.value)
+        raise
+    last_update_userbot = time.time()
+    snapshot = CatalogSnapshot.from_gifts(userbot_all_gifts, source="userbot", fetched_at=last_update_userbot)
+    signature = snapshot.signature()
+    userbot_poll_scheduler.on_result(signature != _userbot_signature)
+    _userbot_signature = signature
+    merge_catalog(snapshot)
+    return snapshot
+
+async def userbot_gifts_updater(user_id: int):
     """
     Запускает фоновую задачу для регулярного обновления кеша подарков от юзербота.
+    Интервал подбирает userbot_poll_scheduler: чаще после изменений каталога и в окнах
+    DROP_WINDOWS, реже при затишье и после FloodWait.
 
     :param user_id: Telegram ID владельца userbot-сессии
-    :param base_interval: Минимальный интервал обновления (в секундах); 
-                          фактическая пауза будет от base_interval до base_interval + 10
     """
-    global userbot_all_gifts, last_update_userbot
     while True:
         try:
-            userbot_all_gifts = await get_userbot_filtered_gifts(
-                user_id,
-                min_price=1,
-                max_price=10000000,
-                min_supply=1,
-                max_supply=100000000,
-                unlimited=False
-            )
-            last_update_userbot = time.time()
+            # Опрос общий с hedged-режимом: если он уже опросил юзербота недавно, этот проход пропускается
+            task = _start_userbot_fetch(user_id)
+            if task:
+                await task
         except Exception as e:
             logger.error(f"Ошибка в userbot_gifts_updater: {e}")
-        delay = random.randint(base_interval, base_interval + 10)
-        await asyncio.sleep(delay)
+        # Не чаще минимального интервала, даже если опрос не удался и срок не сдвинулся
+        await asyncio.sleep(max(userbot_poll_scheduler.until_due(), userbot_poll_scheduler.min_interval))
 
 
-def is_userbot_cache_fresh(max_age: int = USERBOT_UPDATE_COOLDOWN + 10) -> bool:
+async def bot_gifts_poller(bot, user_id: int):
     """
-    Проверяет, актуален ли кеш userbot.
+    Фоновая задача опроса каталога через бота (в режиме hedged — одновременно с юзерботом).
+    Изменения вливаются в общий каталог и порождают события для воркера покупок.
+    Пока покупки выключены, каталог не опрашивается.
 
-    :param max_age: Максимальное допустимое время с последнего обновления (в секундах)
-    :return: True, если кеш свежий
+    :param bot: Объект aiogram-бота
+    :param user_id: Telegram ID владельца бота и userbot-сессии
     """
-    return time.time() - last_update_userbot < max_age
+    while True:
+        try:
+            config = await get_valid_config(user_id)
+            if not config["ACTIVE"]:
+                await asyncio.sleep(1)
+                continue
+            await get_catalog_snapshot(bot, user_id)
+        except Exception as e:
+            logger.error(f"Ошибка в bot_gifts_poller: {e}")
+        await asyncio.sleep(bot_poll_scheduler.next_delay())
 
 
-def filter_gifts_by_profile(gifts: list[dict], profile: dict) -> list[dict]:
+def _has_new_gifts(snapshot: CatalogSnapshot) -> bool:
     """
-    Фильтрует список подарков по параметрам конкретного профиля.
+    Проверяет, есть ли в снимке подарки, которых ещё не видел ни один источник.
+    """
+    return any(str(gift["id"]) not in _known_gift_ids for gift in snapshot.gifts)
+
 
-    :param gifts: Список всех доступных подарков (словари)
-    :param profile: Словарь с параметрами профиля (ценовой диапазон, лимиты)
-    :return: Отфильтрованный список подарков, подходящих под профиль
+def _start_userbot_fetch(user_id: int) -> asyncio.Task | None:
+    """
+    Запускает запрос каталога через юзербота, если он не выполняется, подошёл срок по адаптивному
+    интервалу userbot_poll_scheduler и в пуле есть готовая сессия (соединения восстанавливает
+    userbot_supervisor). Незавершённый запрос переиспользуется.
     """
-    return [
-        g for g in gifts
-        if profile["MIN_PRICE"] <= g.get("price", 0) <= profile["MAX_PRICE"]
-        and profile["MIN_SUPPLY"] <= g.get("supply", 0) <= profile["MAX_SUPPLY"]
-    ]
+    global _userbot_fetch_task
+    if _userbot_fetch_task and not _userbot_fetch_task.done():
+        return _userbot_fetch_task
+    if not userbot_poll_scheduler.due() or not is_pool_ready():
+        return None
+    _userbot_fetch_task = asyncio.create_task(refresh_userbot_gifts(user_id))
+    return _userbot_fetch_task
 
 
-async def get_best_gift_list(bot, profile: dict) -> list[dict]:
+def _on_straggler_done(source: str, task: asyncio.Task):
     """
-    Возвращает наиболее полный список подарков — либо от бота, либо от userbot,
-    в зависимости от того, где подарков больше, при условии фильтрации под профиль.
+    Обрабатывает ответ источника, который не дождались в get_hedged_catalog.
+    Снимок уже влит в общий каталог (merge_catalog публикует события и будит воркер покупок);
+    здесь его подарки отмечаются известными, чтобы следующий проход не принял их за новые.
+    """
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error(f"Ошибка получения списка подарков ({source}, фоновый запрос): {error}")
+        return
+    snapshot = task.result()
+    if _has_new_gifts(snapshot):
+        logger.info(f"Запоздавший ответ {source} принёс новые подарки, воркер получит события каталога")
+    _known_gift_ids.update(str(gift["id"]) for gift in snapshot.gifts)
+
+
+async def get_hedged_catalog(bot, user_id: int) -> CatalogSnapshot:
+    """
+    Запрашивает каталог у бота и юзербота одновременно и возвращает результат, как только
+    ответил бот (или раньше — если юзербот первым сообщил о новом подарке). Частота опроса
+    бота не зависит от задержки юзербота: его запрос завершается в фоне, вливается в общий
+    каталог (с публикацией событий каталога) и обновляет множество известных подарков.
+    При первом запуске ожидаются оба источника.
 
     :param bot: Объект aiogram-бота
     :param user_id: Telegram ID владельца userbot-сессии
-    :param profile: Словарь с параметрами профиля (фильтрация по цене, количеству и т.д.)
-    :return: Отфильтрованный список подарков (в виде list[dict])
+    :return: Снимок общего каталога (см. get_merged_catalog)
+    """
+    tasks = {asyncio.create_task(get_bot_catalog(bot)): "bot"}
+    userbot_task = _start_userbot_fetch(user_id)
+    if userbot_task:
+        tasks[userbot_task] = "userbot"
+
+    # Первый запуск: известных подарков ещё нет, ждём оба источника
+    baseline = not _known_gift_ids
+    results: dict[str, CatalogSnapshot] = {}
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            source = tasks[task]
+            try:
+                results[source] = task.result()
+            except Exception as e:
+                logger.error(f"Ошибка получения списка подарков ({source}): {e}")
+        if baseline or not pending:
+            continue
+        if any(_has_new_gifts(s) for s in results.values()):
+            logger.info(f"Новый подарок обнаружен через: {', '.join(results)}")
+        elif not any(tasks[t] == "bot" for t in done):
+            continue  # Ответил только юзербот и без новых подарков — ждём бота
+        for task in pending:
+            # Запрос юзербота переиспользуется следующими проходами — обработчик добавляется один раз
+            if task not in _background_tasks:
+                _background_tasks.add(task)
+                task.add_done_callback(partial(_on_straggler_done, tasks[task]))
+        break
+
+    # Ответы источников уже влиты в общий каталог; не ответивший источник представлен прошлыми данными
+    merged = get_merged_catalog()
+    _known_gift_ids.update(str(gift["id"]) for gift in merged.gifts)
+    return merged
+
+
+async def get_catalog_snapshot(bot, user_id: int | None = None) -> CatalogSnapshot:
     """
-    global userbot_all_gifts
+    Получает снимок каталога для текущего прохода воркера.
+    В режиме CATALOG_HEDGED_FETCH при активном юзерботе каталог запрашивается у обоих источников.
+    При ошибке возвращает пустой снимок.
 
+    :param bot: Объект aiogram-бота
+    :param user_id: Telegram ID владельца userbot-сессии
+    :return: CatalogSnapshot
+    """
     try:
-        gifts_bot = await get_filtered_gifts(
-            bot,
-            profile["MIN_PRICE"],
-            profile["MAX_PRICE"],
-            profile["MIN_SUPPLY"],
-            profile["MAX_SUPPLY"]
-        )
+        if CATALOG_HEDGED_FETCH and user_id is not None and is_userbot_active(user_id):
+            return await get_hedged_catalog(bot, user_id)
+        await get_bot_catalog(bot)
+        return get_merged_catalog()
     except Exception as e:
         logger.error(f"Ошибка получения списка подарков от бота: {e}")
-        gifts_bot = []
-
-    gifts_userbot = filter_gifts_by_profile(userbot_all_gifts, profile)
-
-    if is_userbot_cache_fresh() and len(gifts_userbot) > len(gifts_bot):
-        return gifts_userbot
-    
-    return gifts_bot
+        return CatalogSnapshot()
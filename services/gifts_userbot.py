@@ -2,15 +2,22 @@
 import logging
 
 # --- Сторонние библиотеки ---
+from pyrogram import raw, types
 from pyrogram.types import Gift
+from pyrogram.errors import FloodWait
 
 # --- Внутренние модули ---
 from utils.mockdata import generate_test_gifts
 from services.config import DEV_MODE, get_valid_config
-from services.userbot import get_userbot_client, is_userbot_active
+from services.userbot import is_userbot_active
+from services.userbot_pool import next_poll_member, min_flood_remaining
 
 logger = logging.getLogger(__name__)
 
+# Последний полученный каталог: hash для payments.getStarGifts и разобранные подарки
+_catalog_hash: int = 0
+_catalog_entries: list[tuple[Gift, dict]] = []
+
 def normalize_gift(gift: Gift) -> dict:
     """
     Преобразует объект Gift из Pyrogram в словарь с ключевыми характеристиками подарка.
@@ -25,6 +32,32 @@ def normalize_gift(gift: Gift) -> dict:
     }
 
 
+async def fetch_userbot_catalog(userbot) -> list[tuple[Gift, dict]]:
+    """
+    Запрашивает каталог через payments.getStarGifts с hash предыдущего ответа.
+    Если каталог не изменился (starGiftsNotModified), возвращает закешированный результат
+    без разбора и нормализации.
+
+    :param userbot: Запущенный Pyrogram Client
+    :return: Список пар (Gift, нормализованный словарь)
+    """
+    global _catalog_hash, _catalog_entries
+    r = await userbot.invoke(raw.functions.payments.GetStarGifts(hash=_catalog_hash))
+    if isinstance(r, raw.types.payments.StarGiftsNotModified):
+        return _catalog_entries
+
+    entries = []
+    for star_gift in r.gifts:
+        gift = await types.Gift._parse_regular(userbot, star_gift)
+        if gift is None:
+            continue
+        entries.append((gift, normalize_gift(gift)))
+    _catalog_hash = r.hash
+    _catalog_entries = entries
+    logger.debug(f"Каталог юзербота обновлён: {len(entries)} подарков (hash={r.hash})")
+    return entries
+
+
 async def get_userbot_filtered_gifts(
     user_id: int = None,
     min_price: int = 1,
@@ -36,8 +69,10 @@ async def get_userbot_filtered_gifts(
     test_gifts_count: int = 5
 ) -> list[dict]:
     """
-    Получает список подарков через Pyrogram userbot и фильтрует их по заданным параметрам.
+    Получает список подарков через Pyrogram userbot (hash-условным запросом) и фильтрует их по заданным параметрам.
+    Запрос выполняет следующая по кругу сессия пула юзерботов.
     Возвращает пустой список, если сессия не активна или отключена в конфиге.
+    FloodWait пробрасывается вызывающему коду.
     """
     if not is_userbot_active(user_id):
         return []
@@ -50,14 +85,24 @@ async def get_userbot_filtered_gifts(
         if not userbot_config.get("ENABLED", False):
             return []
         
-        userbot = await get_userbot_client(user_id)
-        gifts: list[Gift] = await userbot.get_available_gifts()
+        # Опросы распределяются по сессиям пула по кругу
+        member = next_poll_member()
+        if member is None:
+            raise FloodWait(value=min_flood_remaining())
+        try:
+            entries = await fetch_userbot_catalog(member.client)
+        except FloodWait as e:
+            member.on_flood(e.value)
+            raise
+    except FloodWait:
+        # Пробрасываем, чтобы планировщик опроса увеличил интервал
+        raise
     except Exception as e:
         logger.error(f"Ошибка получения подарков от userbot: {e}")
         return []
     
     filtered = []
-    for gift in gifts:
+    for gift, normalized in entries:
         price = gift.price or 0
         supply = gift.total_amount or 0
 
@@ -70,7 +115,7 @@ async def get_userbot_filtered_gifts(
             supply_ok = True
 
         if price_ok and supply_ok:
-            filtered.append(normalize_gift(gift))
+            filtered.append(dict(normalized))
 
     if add_test_gifts or DEV_MODE:
         test_gifts = generate_test_gifts(test_gifts_count)
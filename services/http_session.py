@@ -0,0 +1,160 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import ssl
+
+# --- Сторонние библиотеки ---
+import certifi
+from aiohttp import ClientSession
+from aiogram.client.session.aiohttp import AiohttpSession
+
+# --- Внутренние модули ---
+from services.config import (
+    BOT_HTTP_POOL_SIZE,
+    BOT_HTTP_KEEPALIVE_TIMEOUT,
+    BOT_HTTP_DNS_TTL,
+    BOT_HTTP_WARM_CONNECTIONS,
+    BOT_HTTP_PING_INTERVAL,
+    get_valid_config
+)
+from services.proxy_pool import init_proxy_pool
+
+logger = logging.getLogger(__name__)
+
+
+class PooledAiohttpSession(AiohttpSession):
+    """
+    HTTP-сессия aiogram с настроенным пулом соединений к Bot API.
+
+    - Размер пула, время жизни простаивающих соединений и кеш DNS задаются в конфиге
+      и применяются одинаково для прямого соединения и для прокси.
+    - prewarm() заранее открывает несколько соединений (TCP + TLS, а при прокси — и SOCKS),
+      чтобы покупки шли по уже установленным соединениям.
+    - set_proxy() (и присваивание proxy) переключает прокси, не обрывая текущие запросы:
+      старая сессия закрывается после их завершения.
+    """
+
+    def __init__(
+        self,
+        proxy=None,
+        limit: int = BOT_HTTP_POOL_SIZE,
+        keepalive_timeout: float = BOT_HTTP_KEEPALIVE_TIMEOUT,
+        dns_ttl: int = BOT_HTTP_DNS_TTL,
+        **kwargs
+    ):
+        """
+        :param proxy: Прокси для Bot API (как в AiohttpSession)
+        :param limit: Максимум одновременных соединений
+        :param keepalive_timeout: Сколько секунд держать простаивающее соединение
+        :param dns_ttl: Время кеширования DNS (в секундах)
+        """
+        # Настройки нужны до super().__init__: при прокси он сразу вызывает _setup_proxy_connector
+        self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self._pool_settings = {
+            "limit": limit,
+            "keepalive_timeout": keepalive_timeout,
+            "use_dns_cache": True,
+            "ttl_dns_cache": dns_ttl
+        }
+        super().__init__(proxy=proxy, limit=limit, **kwargs)
+        self._connector_init = self._pool_connector_init(self._connector_init)
+        self._in_flight: dict[ClientSession, int] = {}  # Число выполняющихся запросов в каждой сессии
+        self._closing: set[asyncio.Task] = set()  # Закрытие сессий, оставшихся от прежнего прокси
+
+    def _pool_connector_init(self, connector_init: dict) -> dict:
+        """
+        Дополняет параметры коннектора (прямого или прокси) SSL-контекстом и настройками пула.
+        """
+        return {**connector_init, "ssl": self._ssl_context, **self._pool_settings}
+
+    def _setup_proxy_connector(self, proxy):
+        # aiogram заменяет параметры коннектора целиком параметрами прокси — возвращаем настройки пула
+        super()._setup_proxy_connector(proxy)
+        self._connector_init = self._pool_connector_init(self._connector_init)
+
+    @AiohttpSession.proxy.setter
+    def proxy(self, proxy):
+        self.set_proxy(proxy)
+
+    def set_proxy(self, proxy):
+        """
+        Переключает сессию на другой прокси с теми же настройками пула.
+        Следующие запросы идут через новую сессию, а старая закрывается,
+        когда завершатся отправленные через неё запросы (например, покупки).
+        """
+        self._setup_proxy_connector(proxy)
+        old_session, self._session = self._session, None
+        if old_session is not None and not old_session.closed:
+            task = asyncio.create_task(self._close_when_idle(old_session))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _close_when_idle(self, session: ClientSession):
+        """
+        Закрывает сессию после завершения её запросов (но не позже таймаута запроса).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while self._in_flight.get(session) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        await session.close()
+
+    async def make_request(self, bot, method, timeout=None):
+        # create_session без переключения прокси не приостанавливается, поэтому
+        # super().make_request использует ту же сессию, что учтена здесь
+        session = await self.create_session()
+        self._in_flight[session] = self._in_flight.get(session, 0) + 1
+        try:
+            return await super().make_request(bot, method, timeout)
+        finally:
+            self._in_flight[session] -= 1
+            if not self._in_flight[session]:
+                del self._in_flight[session]
+
+    async def close(self):
+        await super().close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    async def prewarm(self, bot, connections: int = BOT_HTTP_WARM_CONNECTIONS) -> int:
+        """
+        Открывает (или освежает) connections соединений параллельными лёгкими запросами getMe.
+
+        :return: Число успешных запросов
+        """
+        results = await asyncio.gather(*(bot.get_me() for _ in range(connections)), return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"Прогрев соединений Bot API: ошибок {len(failed)} из {connections} ({failed[0]})")
+        return connections - len(failed)
+
+
+async def get_aiohttp_session(user_id: int) -> PooledAiohttpSession:
+    """
+    Создаёт HTTP-сессию для бота с пулом постоянных соединений.
+    Если в конфиге заданы PROXIES — трафик идёт через самый быстрый из них.
+
+    :param user_id: ID владельца бота
+    :return: PooledAiohttpSession
+    """
+    config = await get_valid_config(user_id)
+    proxy_url = await init_proxy_pool(config.get("PROXIES", []))
+    return PooledAiohttpSession(proxy=proxy_url)
+
+
+async def http_keepalive(bot, interval: int = BOT_HTTP_PING_INTERVAL):
+    """
+    Фоновая задача: открывает соединения с Bot API при запуске и периодически
+    освежает их, чтобы они не закрывались по таймауту простоя
+    (интервал должен быть меньше BOT_HTTP_KEEPALIVE_TIMEOUT).
+    """
+    session = bot.session
+    if not isinstance(session, PooledAiohttpSession):
+        return
+    while True:
+        try:
+            warmed = await session.prewarm(bot)
+            logger.debug(f"Соединений Bot API прогрето: {warmed}")
+        except Exception as e:
+            logger.error(f"Ошибка в http_keepalive: {e}")
+        await asyncio.sleep(interval)
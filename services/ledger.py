@@ -0,0 +1,216 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import os
+import struct
+import zlib
+
+# --- Внутренние модули ---
+from services.config import (
+    load_config,
+    save_config,
+    flush_config,
+    get_valid_config,
+    add_ledger_record,
+    forget_ledger_records,
+    LEDGER_PATH,
+    LEDGER_FSYNC_DELAY,
+    LEDGER_COMPACT_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+# Типы записей журнала
+RECORD_PURCHASE = 1          # Покупка по профилю: BOUGHT += count, SPENT += stars
+RECORD_BALANCE_BOT = 2       # Изменение баланса бота на stars
+RECORD_BALANCE_USERBOT = 3   # Изменение баланса юзербота на stars
+
+# Запись фиксированного размера: seq, тип, ID профиля, количество, звёзды + crc32
+_RECORD = struct.Struct("<QBqiq")
+_CRC = struct.Struct("<I")
+RECORD_SIZE = _RECORD.size + _CRC.size
+
+_buffer = bytearray()  # Записи, ещё не сброшенные на диск
+_sync_task: asyncio.Task | None = None
+_records_since_compact = 0
+_lock = asyncio.Lock()
+
+
+def _apply_record(config: dict, kind: int, profile_id: int, count: int, stars: int):
+    """
+    Применяет одну запись журнала к конфигу (в памяти).
+    Покупка по удалённому профилю (или по профилю, счётчики которого сброшены
+    вместе с ID) отбрасывается.
+    """
+    if kind == RECORD_PURCHASE:
+        profile = next((p for p in config.get("PROFILES", []) if p.get("ID") == profile_id), None)
+        if profile is not None:
+            profile["BOUGHT"] = profile.get("BOUGHT", 0) + count
+            profile["SPENT"] = profile.get("SPENT", 0) + stars
+        else:
+            logger.info(f"Запись журнала по удалённому профилю {profile_id} отброшена")
+    elif kind == RECORD_BALANCE_BOT:
+        config["BALANCE"] = max(0, config.get("BALANCE", 0) + stars)
+    elif kind == RECORD_BALANCE_USERBOT:
+        userbot = config.setdefault("USERBOT", {})
+        userbot["BALANCE"] = max(0, userbot.get("BALANCE", 0) + stars)
+
+
+def _pack_record(seq: int, kind: int, profile_id: int, count: int, stars: int) -> bytes:
+    """
+    Упаковывает запись журнала в байты фиксированной длины.
+    """
+    packed = _RECORD.pack(seq, kind, profile_id, count, stars)
+    return packed + _CRC.pack(zlib.crc32(packed))
+
+
+def _read_records(path: str) -> list[tuple]:
+    """
+    Читает журнал и возвращает список корректных записей.
+    Чтение останавливается на первой повреждённой (недописанной) записи.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        chunk = data[offset:offset + _RECORD.size]
+        (crc,) = _CRC.unpack_from(data, offset + _RECORD.size)
+        if zlib.crc32(chunk) != crc:
+            logger.warning(f"Журнал {path} повреждён на смещении {offset}, хвост отброшен.")
+            break
+        records.append(_RECORD.unpack(chunk))
+    return records
+
+
+def _append_file(path: str, data: bytes):
+    """
+    Дописывает данные в конец журнала и выполняет fsync.
+    """
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _truncate_file(path: str, applied_seq: int):
+    """
+    Удаляет из журнала записи, уже перенесённые в config.json.
+    """
+    tail = [r for r in _read_records(path) if r[0] > applied_seq]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for record in tail:
+            f.write(_pack_record(*record))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+async def _append(kind: int, profile_id: int = -1, count: int = 0, stars: int = 0) -> dict:
+    """
+    Применяет запись к конфигу в памяти и ставит её в очередь на дозапись в журнал.
+    Возвращает обновлённый конфиг.
+    """
+    global _sync_task, _records_since_compact
+    config = await load_config()
+    seq = config.get("LEDGER_SEQ", 0) + 1
+    _apply_record(config, kind, profile_id, count, stars)
+    config["LEDGER_SEQ"] = seq
+    await save_config(config, persist=False)
+    add_ledger_record(seq, lambda c: _apply_record(c, kind, profile_id, count, stars))
+
+    _buffer.extend(_pack_record(seq, kind, profile_id, count, stars))
+    _records_since_compact += 1
+    if _sync_task is None or _sync_task.done():
+        _sync_task = asyncio.create_task(_delayed_sync())
+    return config
+
+
+async def _delayed_sync():
+    """
+    Группирует записи за LEDGER_FSYNC_DELAY и сбрасывает их на диск одним fsync.
+    """
+    await asyncio.sleep(LEDGER_FSYNC_DELAY)
+    await sync_ledger()
+
+
+async def sync_ledger(path: str = LEDGER_PATH):
+    """
+    Немедленно дописывает накопленные записи в файл журнала.
+    """
+    async with _lock:
+        if not _buffer:
+            return
+        data = bytes(_buffer)
+        _buffer.clear()
+        await asyncio.to_thread(_append_file, path, data)
+
+
+async def record_purchase(profile_id: int, gift_price: int, count: int = 1) -> dict:
+    """
+    Фиксирует покупку по профилю (по его ID): увеличивает BOUGHT и SPENT.
+    """
+    return await _append(RECORD_PURCHASE, profile_id, count, gift_price)
+
+
+async def record_balance_change(delta: int, sender: str = "bot") -> dict:
+    """
+    Фиксирует изменение баланса бота или юзербота на delta звёзд.
+    """
+    kind = RECORD_BALANCE_USERBOT if sender == "userbot" else RECORD_BALANCE_BOT
+    return await _append(kind, stars=delta)
+
+
+async def compact_ledger(path: str = LEDGER_PATH):
+    """
+    Переносит состояние журнала в config.json и удаляет перенесённые записи из журнала.
+    """
+    global _records_since_compact
+    await sync_ledger(path)
+    async with _lock:
+        config = await load_config()
+        applied_seq = config.get("LEDGER_SEQ", 0)
+        _records_since_compact = 0
+        await save_config(config)
+        await flush_config()
+        await asyncio.to_thread(_truncate_file, path, applied_seq)
+        forget_ledger_records(applied_seq)
+    logger.info(f"Журнал покупок перенесён в конфиг (seq={applied_seq}).")
+
+
+async def replay_ledger(user_id: int, path: str = LEDGER_PATH):
+    """
+    При запуске применяет к конфигу записи журнала, не попавшие в config.json, и уплотняет журнал.
+    """
+    if not os.path.exists(path):
+        return
+    config = await get_valid_config(user_id)
+    applied_seq = config.get("LEDGER_SEQ", 0)
+    records = await asyncio.to_thread(_read_records, path)
+    replayed = 0
+    for seq, kind, profile_id, count, stars in records:
+        if seq <= applied_seq:
+            continue
+        _apply_record(config, kind, profile_id, count, stars)
+        config["LEDGER_SEQ"] = seq
+        replayed += 1
+    await save_config(config)
+    if replayed:
+        logger.info(f"Восстановлено записей из журнала покупок: {replayed}")
+    await compact_ledger(path)
+
+
+async def ledger_compactor(interval: int = LEDGER_COMPACT_INTERVAL):
+    """
+    Фоновая задача: периодически уплотняет журнал, если в нём появились новые записи.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if not _records_since_compact:
+            continue
+        try:
+            await compact_ledger()
+        except Exception as e:
+            logger.error(f"Ошибка в ledger_compactor: {e}")
@@ -1,26 +1,70 @@
+# --- Стандартные библиотеки ---
+import logging
+from typing import Optional
+
 # --- Сторонние библиотеки ---
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 # --- Внутренние библиотеки ---
-from services.config import load_config, save_config, get_valid_config, format_config_summary
+from services.config import load_config, save_config, get_valid_config, get_config_version, format_config_summary
+
+logger = logging.getLogger(__name__)
+
+# Текст меню по версии конфига: (версия, user_id, текст, ACTIVE)
+_rendered_menu: Optional[tuple[int, int, str, bool]] = None
+# Что показано в каждом сообщении меню: (chat_id, message_id) -> (текст, ACTIVE)
+_shown_menus: dict[tuple[int, int], tuple[str, bool]] = {}
+# Копия LAST_MENU_MESSAGE_ID из конфига, чтобы не читать конфиг при каждом обновлении меню
+_last_menu_message_id: Optional[int] = None
+_last_menu_loaded = False
+
 
 async def update_last_menu_message_id(message_id: int):
     """
     Сохраняет id последнего сообщения с меню в конфиг.
     """
+    global _last_menu_message_id, _last_menu_loaded
+    _last_menu_message_id, _last_menu_loaded = message_id, True
     config = await load_config()
+    if config.get("LAST_MENU_MESSAGE_ID") == message_id:
+        return
     config["LAST_MENU_MESSAGE_ID"] = message_id
     await save_config(config)
 
 
 async def get_last_menu_message_id():
     """
-    Возвращает id последнего отправленного сообщения меню.
+    Возвращает id последнего отправленного сообщения меню (конфиг читается только при первом обращении).
     """
-    config = await load_config()
-    return config.get("LAST_MENU_MESSAGE_ID")
+    global _last_menu_message_id, _last_menu_loaded
+    if not _last_menu_loaded:
+        config = await load_config()
+        _last_menu_message_id, _last_menu_loaded = config.get("LAST_MENU_MESSAGE_ID"), True
+    return _last_menu_message_id
+
+
+async def render_menu(user_id: int) -> tuple[str, bool]:
+    """
+    Возвращает текст главного меню и статус ACTIVE. Текст пересчитывается (и конфиг читается)
+    только если конфиг изменился с прошлого вызова.
+    """
+    global _rendered_menu
+    if _rendered_menu and _rendered_menu[:2] == (get_config_version(), user_id):
+        return _rendered_menu[2], _rendered_menu[3]
+    config = await get_valid_config(user_id)
+    text, active = format_config_summary(config, user_id), bool(config.get("ACTIVE"))
+    _rendered_menu = (get_config_version(), user_id, text, active)
+    return text, active
+
+
+def remember_menu(chat_id: int, message_id: int, text: str, active: bool):
+    """
+    Запоминает содержимое сообщения меню (для сообщений, отредактированных в обход edit_menu/send_menu).
+    """
+    _shown_menus.clear()  # Актуально только последнее меню
+    _shown_menus[(chat_id, message_id)] = (text, bool(active))
 
 
 def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
@@ -50,11 +94,42 @@ def config_action_keyboard(active: bool) -> InlineKeyboardMarkup:
 
 async def update_menu(bot, chat_id: int, user_id: int, message_id: int):
     """
-    Обновляет меню в чате: удаляет предыдущее и отправляет новое.
+    Обновляет меню в чате.
+
+    - Если действие выполнено из самого меню (message_id — последнее меню), оно редактируется на месте,
+      а если текст и клавиатура не изменились — запрос к API не отправляется.
+    - Иначе предыдущее меню удаляется и отправляется новое (внизу чата).
     """
-    config = await get_valid_config(user_id)
+    text, active = await render_menu(user_id)
+    last_menu_message_id = await get_last_menu_message_id()
+    if last_menu_message_id and last_menu_message_id == message_id:
+        if _shown_menus.get((chat_id, message_id)) == (text, active):
+            return
+        if await edit_menu(bot, chat_id, message_id, text, active):
+            return
     await delete_menu(bot=bot, chat_id=chat_id, current_message_id=message_id)
-    await send_menu(bot=bot, chat_id=chat_id, config=config, text=format_config_summary(config, user_id))
+    await send_menu(bot=bot, chat_id=chat_id, text=text, active=active)
+
+
+async def edit_menu(bot, chat_id: int, message_id: int, text: str, active: bool) -> bool:
+    """
+    Редактирует сообщение меню на месте.
+
+    :return: True, если сообщение показывает актуальное меню; False — если отредактировать нельзя
+    """
+    try:
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            reply_markup=config_action_keyboard(active)
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logger.debug(f"Меню {message_id} не отредактировано: {e}")
+            return False
+    remember_menu(chat_id, message_id, text, active)
+    return True
 
 
 async def delete_menu(bot, chat_id: int, current_message_id: int = None):
@@ -78,15 +153,16 @@ async def delete_menu(bot, chat_id: int, current_message_id: int = None):
                 raise
 
 
-async def send_menu(bot, chat_id: int, config: dict, text: str) -> int:
+async def send_menu(bot, chat_id: int, text: str, active: bool) -> int:
     """
     Отправляет новое меню в чат и обновляет id последнего сообщения.
     """
     sent = await bot.send_message(
         chat_id=chat_id,
         text=text,
-        reply_markup=config_action_keyboard(config.get("ACTIVE"))
+        reply_markup=config_action_keyboard(active)
     )
+    remember_menu(chat_id, sent.message_id, text, active)
     await update_last_menu_message_id(sent.message_id)
     return sent.message_id
 
@@ -0,0 +1,134 @@
+# --- Стандартные библиотеки ---
+from collections import deque
+import asyncio
+import logging
+import time
+from typing import Optional
+
+# --- Сторонние библиотеки ---
+from pyrogram import Client, raw
+from pyrogram.errors import FloodWait, FormExpired, FormIdExpired
+
+# --- Внутренние модули ---
+from services.config import PAYMENT_FORM_TTL, PAYMENT_FORM_PREFETCH
+from services.peers import resolve_input_peer
+
+logger = logging.getLogger(__name__)
+
+# Заранее полученные формы оплаты: (сессия, подарок, получатель, скрыть имя) -> очередь (form_id, invoice, время получения).
+# Форма одноразовая: при покупке она извлекается из очереди.
+_forms: dict[tuple, deque] = {}
+_refills: dict[tuple, asyncio.Task] = {}
+
+
+def _form_key(client: Client, gift_id, recipient, hide_name: bool) -> tuple:
+    return (client.name, int(gift_id), str(recipient), bool(hide_name))
+
+
+def _take_form(key: tuple) -> Optional[tuple]:
+    """
+    Извлекает свежую форму из кеша, отбрасывая устаревшие.
+    """
+    forms = _forms.get(key)
+    now = time.monotonic()
+    while forms:
+        form_id, invoice, fetched_at = forms.popleft()
+        if now - fetched_at < PAYMENT_FORM_TTL:
+            return form_id, invoice
+    return None
+
+
+def has_payment_form(client: Client, gift_id, recipient, hide_name: bool = True) -> bool:
+    """
+    True, если для сессии есть свежая заранее полученная форма оплаты или она сейчас загружается.
+    """
+    key = _form_key(client, gift_id, recipient, hide_name)
+    task = _refills.get(key)
+    if task is not None and not task.done():
+        return True
+    now = time.monotonic()
+    return any(now - fetched_at < PAYMENT_FORM_TTL for _, _, fetched_at in _forms.get(key, ()))
+
+
+async def fetch_payment_form(client: Client, gift_id, recipient, hide_name: bool = True) -> tuple:
+    """
+    Запрашивает форму оплаты подарка (payments.getPaymentForm).
+    Получатель берётся из кеша получателей, без повторного разрешения username.
+
+    :return: (form_id, invoice)
+    """
+    invoice = raw.types.InputInvoiceStarGift(
+        peer=await resolve_input_peer(client, recipient),
+        gift_id=int(gift_id),
+        hide_name=hide_name
+    )
+    form = await client.invoke(raw.functions.payments.GetPaymentForm(invoice=invoice))
+    return form.form_id, invoice
+
+
+async def _refill(client: Client, key: tuple, gift_id, recipient, hide_name: bool, count: int):
+    """
+    Дозаполняет кеш форм для пары (подарок, получатель) до count свежих форм.
+    """
+    now = time.monotonic()
+    forms = _forms.setdefault(key, deque())
+    while forms and now - forms[0][2] >= PAYMENT_FORM_TTL:
+        forms.popleft()
+    missing = min(count, PAYMENT_FORM_PREFETCH) - len(forms)
+    if missing <= 0:
+        return
+    results = await asyncio.gather(
+        *(fetch_payment_form(client, gift_id, recipient, hide_name) for _ in range(missing)),
+        return_exceptions=True
+    )
+    fetched_at = time.monotonic()
+    for result in results:
+        if isinstance(result, FloodWait):
+            logger.warning(f"Форма оплаты подарка {gift_id}: флуд-ограничение {result.value} сек")
+        elif isinstance(result, Exception):
+            logger.warning(f"Не удалось заранее получить форму оплаты подарка {gift_id}: {result}")
+        else:
+            forms.append((*result, fetched_at))
+
+
+def prefetch_payment_forms(client: Client, gift_id, recipient, count: int = 1, hide_name: bool = True) -> asyncio.Task:
+    """
+    Запускает в фоне получение форм оплаты для пары (подарок, получатель), чтобы при покупке
+    оставался один запрос (payments.sendStarsForm). Повторный вызов во время загрузки
+    возвращает уже запущенную задачу.
+
+    :param count: Сколько покупок ожидается (форм держится не больше PAYMENT_FORM_PREFETCH)
+    :return: Задача дозаполнения кеша
+    """
+    key = _form_key(client, gift_id, recipient, hide_name)
+    task = _refills.get(key)
+    if task is None or task.done():
+        task = asyncio.create_task(_refill(client, key, gift_id, recipient, hide_name, count))
+        _refills[key] = task
+    return task
+
+
+async def send_star_gift(client: Client, gift_id, recipient, hide_name: bool = True):
+    """
+    Покупает подарок за звёзды. Использует заранее полученную форму оплаты, если она уже есть,
+    иначе запрашивает форму сразу перед оплатой (не дожидаясь идущей предзагрузки —
+    её формы достанутся следующим покупкам).
+    Если сохранённая форма устарела — запрашивает новую и повторяет оплату один раз.
+
+    :return: Ответ payments.sendStarsForm
+    """
+    key = _form_key(client, gift_id, recipient, hide_name)
+    form = _take_form(key)
+    cached = form is not None
+    if form is None:
+        form = await fetch_payment_form(client, gift_id, recipient, hide_name)
+
+    form_id, invoice = form
+    try:
+        return await client.invoke(raw.functions.payments.SendStarsForm(form_id=form_id, invoice=invoice))
+    except (FormExpired, FormIdExpired):
+        if not cached:
+            raise
+        logger.info(f"Сохранённая форма оплаты подарка {gift_id} устарела, запрашиваем новую")
+        form_id, invoice = await fetch_payment_form(client, gift_id, recipient, hide_name)
+        return await client.invoke(raw.functions.payments.SendStarsForm(form_id=form_id, invoice=invoice))
@@ -0,0 +1,246 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional, Union
+
+# --- Сторонние библиотеки ---
+import aiofiles
+from pyrogram import Client, raw
+
+# --- Внутренние модули ---
+from services.config import get_valid_config, PEER_CACHE_PATH, PEER_CACHE_TTL
+from services.userbot_pool import get_members
+
+logger = logging.getLogger(__name__)
+
+# Кеш получателей: ключ -> запись с полем resolved_at.
+# "userbot:<сессия>:<получатель>" — input peer юзербота, "bot:<username>" — результат bot.get_chat.
+_peers: Optional[dict[str, dict]] = None
+_load_lock = asyncio.Lock()
+_save_lock = asyncio.Lock()
+_refresh_tasks: dict[str, asyncio.Task] = {}  # Фоновые обновления устаревших записей по ключу
+_warmup_tasks: set[asyncio.Task] = set()  # Фоновые разрешения получателей сохранённых профилей
+
+
+def get_recipient(target_user_id, target_chat_id) -> Optional[Union[int, str]]:
+    """
+    Возвращает получателя подарка: ID пользователя или username/ID канала.
+    None — если не указан ни один получатель или указаны оба.
+    """
+    if target_user_id and not target_chat_id:
+        return int(target_user_id)
+    if target_chat_id and not target_user_id:
+        return target_chat_id
+    return None
+
+
+async def _load_peers() -> dict[str, dict]:
+    """
+    Загружает кеш получателей с диска при первом обращении.
+    """
+    global _peers
+    if _peers is not None:
+        return _peers
+    async with _load_lock:
+        if _peers is None:
+            peers = {}
+            if os.path.exists(PEER_CACHE_PATH):
+                try:
+                    async with aiofiles.open(PEER_CACHE_PATH, mode="r", encoding="utf-8") as f:
+                        peers = json.loads(await f.read())
+                except Exception as e:
+                    logger.error(f"Не удалось прочитать кеш получателей: {e}")
+            _peers = peers
+    return _peers
+
+
+async def _save_peers():
+    """
+    Атомарно записывает кеш получателей на диск (через временный файл).
+    """
+    async with _save_lock:
+        tmp_path = f"{PEER_CACHE_PATH}.tmp"
+        async with aiofiles.open(tmp_path, mode="w", encoding="utf-8") as f:
+            await f.write(json.dumps(await _load_peers(), indent=2))
+        os.replace(tmp_path, PEER_CACHE_PATH)
+
+
+async def _get_entry(key: str, refresh: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+    """
+    Возвращает запись кеша. Устаревшая запись (старше PEER_CACHE_TTL) тоже возвращается,
+    а refresh запускается в фоне — покупка не ждёт повторного разрешения получателя.
+    """
+    entry = (await _load_peers()).get(key)
+    if entry and time.time() - entry.get("resolved_at", 0) >= PEER_CACHE_TTL:
+        _schedule_refresh(key, refresh)
+    return entry
+
+
+async def _put_entry(key: str, entry: dict):
+    (await _load_peers())[key] = dict(entry, resolved_at=time.time())
+    await _save_peers()
+
+
+def _schedule_refresh(key: str, refresh: Callable[[], Awaitable[Optional[dict]]]):
+    """
+    Запускает фоновое обновление записи (не более одного на ключ одновременно).
+    При ошибке остаётся прежняя запись, повтор — при следующем обращении.
+    """
+    task = _refresh_tasks.get(key)
+    if task is not None and not task.done():
+        return
+
+    async def run():
+        try:
+            entry = await refresh()
+            if entry:
+                await _put_entry(key, entry)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить запись кеша получателей {key}: {e}")
+        finally:
+            _refresh_tasks.pop(key, None)
+
+    _refresh_tasks[key] = asyncio.create_task(run())
+
+
+def _normalize(recipient) -> str:
+    """
+    Ключ получателя: username без учёта регистра, ID как есть.
+    """
+    return str(recipient).lower()
+
+
+def _peer_to_entry(peer) -> Optional[dict]:
+    if isinstance(peer, raw.types.InputPeerUser):
+        return {"type": "user", "id": peer.user_id, "access_hash": peer.access_hash}
+    if isinstance(peer, raw.types.InputPeerChannel):
+        return {"type": "channel", "id": peer.channel_id, "access_hash": peer.access_hash}
+    if isinstance(peer, raw.types.InputPeerChat):
+        return {"type": "chat", "id": peer.chat_id}
+    if isinstance(peer, raw.types.InputPeerSelf):
+        return {"type": "self"}
+    return None  # Прочие типы (например, peer из сообщения) не кешируются
+
+
+def _entry_to_peer(entry: dict):
+    peer_type = entry["type"]
+    if peer_type == "user":
+        return raw.types.InputPeerUser(user_id=entry["id"], access_hash=entry["access_hash"])
+    if peer_type == "channel":
+        return raw.types.InputPeerChannel(channel_id=entry["id"], access_hash=entry["access_hash"])
+    if peer_type == "chat":
+        return raw.types.InputPeerChat(chat_id=entry["id"])
+    return raw.types.InputPeerSelf()
+
+
+async def resolve_input_peer(client: Client, recipient):
+    """
+    Возвращает input peer получателя для юзербота. Username разрешается через API
+    только при первом обращении, далее peer с access_hash берётся из кеша
+    (после истечения PEER_CACHE_TTL запись обновляется в фоне).
+
+    :param client: Клиент юзербота
+    :param recipient: ID пользователя или username/ID канала
+    :return: raw.base.InputPeer
+    """
+    key = f"userbot:{client.name}:{_normalize(recipient)}"
+
+    async def refresh():
+        return _peer_to_entry(await client.resolve_peer(recipient))
+
+    entry = await _get_entry(key, refresh)
+    if entry:
+        return _entry_to_peer(entry)
+    peer = await client.resolve_peer(recipient)
+    entry = _peer_to_entry(peer)
+    if entry:
+        await _put_entry(key, entry)
+    return peer
+
+
+async def get_bot_chat(bot, chat_id) -> dict:
+    """
+    Возвращает сведения о чате через bot.get_chat, с кешем на диске.
+    Ошибки API не кешируются и пробрасываются вызывающему.
+
+    :return: {"id": ..., "type": ..., "is_bot": ...}
+    """
+    key = f"bot:{_normalize(chat_id)}"
+    entry = await _get_entry(key, lambda: _fetch_bot_chat(bot, chat_id))
+    if entry:
+        return entry
+    entry = await _fetch_bot_chat(bot, chat_id)
+    await _put_entry(key, entry)
+    return entry
+
+
+async def _fetch_bot_chat(bot, chat_id) -> dict:
+    chat = await bot.get_chat(chat_id)
+    return {
+        "id": chat.id,
+        "type": str(getattr(chat.type, "value", chat.type)),
+        "is_bot": bool(getattr(chat, "is_bot", False))
+    }
+
+
+async def get_cached_bot_chat_id(bot, chat_id):
+    """
+    Возвращает числовой ID чата из кеша вместо username (без ожидания запросов к API).
+    Если чата нет в кеше — возвращает chat_id без изменений.
+    """
+    if not isinstance(chat_id, str):
+        return chat_id
+    entry = await _get_entry(f"bot:{_normalize(chat_id)}", lambda: _fetch_bot_chat(bot, chat_id))
+    return entry["id"] if entry else chat_id
+
+
+async def warm_profile_recipient(bot, profile: dict) -> int:
+    """
+    Разрешает получателя одного профиля: для юзербота — во всех сессиях пула
+    (access_hash у каждого аккаунта свой), для бота — username через bot.get_chat.
+
+    :return: Количество разрешённых записей
+    """
+    recipient = get_recipient(profile.get("TARGET_USER_ID"), profile.get("TARGET_CHAT_ID"))
+    if recipient is None:
+        return 0
+    resolved = 0
+    try:
+        if profile.get("SENDER", "bot") == "userbot":
+            for member in get_members():
+                await resolve_input_peer(member.client, recipient)
+                resolved += 1
+        elif isinstance(recipient, str):
+            await get_bot_chat(bot, recipient)
+            resolved += 1
+    except Exception as e:
+        logger.warning(f"Не удалось разрешить получателя {recipient}: {e}")
+    return resolved
+
+
+def schedule_profile_warmup(bot, profile: dict):
+    """
+    Разрешает получателя сохранённого профиля в фоне, чтобы первая покупка
+    не ждала разрешения username. Вызывается после сохранения профиля в мастере.
+    """
+    task = asyncio.create_task(warm_profile_recipient(bot, dict(profile)))
+    _warmup_tasks.add(task)
+    task.add_done_callback(_warmup_tasks.discard)
+
+
+async def warm_peer_cache(bot, user_id: int):
+    """
+    Заранее разрешает получателей всех незавершённых профилей, чтобы во время покупок
+    не было запросов на разрешение username.
+    """
+    config = await get_valid_config(user_id)
+    resolved = 0
+    for profile in config["PROFILES"]:
+        if profile.get("DONE"):
+            continue
+        resolved += await warm_profile_recipient(bot, profile)
+    if resolved:
+        logger.info(f"Кеш получателей прогрет: {resolved}")
@@ -0,0 +1,129 @@
+# --- Стандартные библиотеки ---
+import logging
+from dataclasses import dataclass, field
+from typing import Mapping, Optional
+
+# --- Внутренние модули ---
+from services.config import DEV_MODE
+from services.catalog import CatalogSnapshot
+from services.userbot_pool import is_pool_ready
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PlannedPurchase:
+    """
+    Запланированная покупка: count экземпляров подарка для профиля.
+    """
+    profile_index: int
+    gift: dict
+    count: int
+
+    @property
+    def stars(self) -> int:
+        """
+        Сумма звёзд на все экземпляры.
+        """
+        return self.gift["price"] * self.count
+
+
+@dataclass
+class PurchasePlan:
+    """
+    План покупок на один проход воркера.
+
+    - items: индекс профиля -> запланированные покупки, в порядке приоритета подарков
+    - unfunded: профили, для которых есть подходящие подарки, но не хватило баланса отправителя
+    """
+    items: dict[int, list[PlannedPurchase]] = field(default_factory=dict)
+    unfunded: list[int] = field(default_factory=list)
+
+    def total_stars(self) -> int:
+        """
+        Общая сумма звёзд по плану.
+        """
+        return sum(p.stars for purchases in self.items.values() for p in purchases)
+
+
+def is_profile_active(profile: dict, config: dict) -> bool:
+    """
+    Участвует ли профиль в покупках: не завершён и, для SENDER=userbot, юзербот включён
+    и в пуле есть готовая сессия.
+    """
+    if profile.get("DONE"):
+        return False
+    if profile.get("SENDER", "bot") == "userbot":
+        return config.get("USERBOT", {}).get("ENABLED", False) and (DEV_MODE or is_pool_ready())
+    return True
+
+
+def plan_purchases(
+    snapshot: CatalogSnapshot,
+    config: dict,
+    balances: Optional[Mapping[str, int]] = None
+) -> PurchasePlan:
+    """
+    Распределяет остатки подарков и балансы отправителей между профилями до отправки запросов.
+
+    Приоритетное распределение: профили рассматриваются в порядке конфига, подарки каждого
+    профиля — от самых дорогих к дешёвым (как при прежней последовательной покупке). Каждому
+    подарку выделяется максимум экземпляров в пределах COUNT и LIMIT профиля, остатка left
+    (общего для всех профилей) и свободного баланса отправителя (общего для профилей
+    с одним SENDER). Время работы — O(профили × подарки).
+
+    :param snapshot: Снимок каталога, общий для всех профилей
+    :param config: Конфиг с профилями
+    :param balances: Свободные балансы {"bot": ..., "userbot": ...}; None — без ограничения (DEV_MODE)
+    :return: PurchasePlan
+    """
+    plan = PurchasePlan()
+    remaining_balance = dict(balances) if balances is not None else None
+    # Сколько экземпляров подарка ещё не распределено (только для лимитированных подарков)
+    remaining_left: dict[str, int] = {}
+
+    for profile_index, profile in enumerate(config["PROFILES"]):
+        if not is_profile_active(profile, config):
+            continue
+        sender = profile.get("SENDER", "bot")
+        count_left = profile["COUNT"] - profile["BOUGHT"]
+        budget_left = profile.get("LIMIT", 0) - profile["SPENT"]
+        had_candidates = False
+        purchases = []
+
+        for gift in snapshot.filter_by_profile(profile):
+            if count_left <= 0 or budget_left <= 0:
+                break
+            price = gift["price"]
+            if price <= 0:
+                continue
+            key = str(gift["id"])
+            count = min(count_left, budget_left // price)
+            if gift.get("supply") and gift.get("left") is not None:
+                count = min(count, remaining_left.setdefault(key, gift["left"]))
+            if count <= 0:
+                continue
+            had_candidates = True
+            if remaining_balance is not None:
+                count = min(count, remaining_balance.get(sender, 0) // price)
+                if count <= 0:
+                    continue
+                remaining_balance[sender] -= count * price
+            if key in remaining_left:
+                remaining_left[key] -= count
+            count_left -= count
+            budget_left -= count * price
+            purchases.append(PlannedPurchase(profile_index, gift, count))
+
+        if purchases:
+            plan.items[profile_index] = purchases
+        elif had_candidates:
+            plan.unfunded.append(profile_index)
+
+    if plan.items:
+        logger.debug(
+            f"План покупок: профилей {len(plan.items)}, "
+            f"подарков {sum(p.count for items in plan.items.values() for p in items)}, "
+            f"звёзд {plan.total_stars()}"
+        )
+    return plan
@@ -0,0 +1,136 @@
+# --- Стандартные библиотеки ---
+from datetime import datetime, timezone
+import logging
+import random
+import time
+
+# --- Внутренние модули ---
+from services.config import (
+    BOT_POLL_MIN_INTERVAL,
+    BOT_POLL_INTERVAL,
+    BOT_POLL_MAX_INTERVAL,
+    USERBOT_POLL_MIN_INTERVAL,
+    USERBOT_UPDATE_COOLDOWN,
+    USERBOT_POLL_MAX_INTERVAL,
+    POLL_HOT_WINDOW,
+    POLL_QUIET_AFTER,
+    DROP_WINDOWS
+)
+
+logger = logging.getLogger(__name__)
+
+
+def in_drop_window(now: datetime | None = None) -> bool:
+    """
+    Проверяет, попадает ли текущее время (UTC) в одно из ожидаемых окон выхода подарков DROP_WINDOWS.
+    Окна задаются парами "ЧЧ:ММ" и могут переходить через полночь.
+    """
+    current = (now or datetime.now(timezone.utc)).strftime("%H:%M")
+    for start, end in DROP_WINDOWS:
+        if start <= end:
+            if start <= current < end:
+                return True
+        elif current >= start or current < end:
+            return True
+    return False
+
+
+class PollScheduler:
+    """
+    Адаптивный интервал опроса каталога для одного источника (бот или юзербот).
+
+    - После изменения каталога и в окнах DROP_WINDOWS опрашивает с минимальным интервалом.
+    - При долгом отсутствии изменений постепенно увеличивает интервал до максимального.
+    - При FloodWait/RetryAfter не опрашивает до конца ожидания и временно не опускается ниже базового интервала.
+    """
+
+    def __init__(self, name: str, min_interval: float, base_interval: float, max_interval: float):
+        """
+        :param name: Имя источника для логов
+        :param min_interval: Минимальный интервал (бюджет запросов источника), в секундах
+        :param base_interval: Обычный интервал, в секундах
+        :param max_interval: Максимальный интервал при долгом затишье, в секундах
+        """
+        self.name = name
+        self._limits = (min_interval, base_interval)
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.interval = base_interval
+        self.last_change = time.monotonic()
+        self.last_poll = 0.0
+        self.blocked_until = 0.0
+        self.penalty_until = 0.0
+
+    def set_parallelism(self, accounts: int):
+        """
+        Учитывает число аккаунтов, по которым распределяются опросы: каждый аккаунт
+        опрашивает с прежним интервалом, поэтому общий интервал делится на их число.
+        """
+        accounts = max(1, accounts)
+        min_interval, base_interval = self._limits
+        self.min_interval = min_interval / accounts
+        self.base_interval = base_interval / accounts
+        self.interval = min(self.interval, self.base_interval)
+
+    def on_result(self, changed: bool):
+        """
+        Учитывает результат опроса: изменился ли каталог.
+        """
+        now = time.monotonic()
+        self.last_poll = now
+        if changed:
+            self.last_change = now
+
+        if changed or now - self.last_change < POLL_HOT_WINDOW or in_drop_window():
+            self.interval = self.min_interval
+        elif now - self.last_change > POLL_QUIET_AFTER:
+            self.interval = min(self.max_interval, max(self.interval, self.base_interval) * 1.5)
+        else:
+            self.interval = self.base_interval
+
+        # После флуд-ограничения некоторое время не опрашиваем чаще базового интервала
+        if now < self.penalty_until:
+            self.interval = max(self.interval, self.base_interval)
+
+    def on_flood(self, retry_after: float):
+        """
+        Учитывает FloodWait/RetryAfter: блокирует опросы на retry_after и увеличивает интервал.
+        """
+        now = time.monotonic()
+        self.last_poll = now
+        self.blocked_until = now + retry_after
+        self.penalty_until = now + max(retry_after * 2, POLL_HOT_WINDOW)
+        self.interval = min(self.max_interval, max(self.base_interval, self.interval * 2))
+        logger.warning(f"Опрос каталога ({self.name}): флуд-ограничение на {retry_after} сек, интервал {self.interval:.1f} сек")
+
+    def is_blocked(self) -> bool:
+        """
+        True, если источник ещё находится под флуд-ограничением.
+        """
+        return time.monotonic() < self.blocked_until
+
+    def due(self) -> bool:
+        """
+        True, если с последнего опроса прошёл текущий адаптивный интервал и источник не под флуд-ограничением.
+        """
+        return not self.is_blocked() and time.monotonic() - self.last_poll >= self.interval
+
+    def until_due(self) -> float:
+        """
+        Сколько секунд осталось до следующего опроса по due() (0 — опрос уже можно выполнять).
+        """
+        now = time.monotonic()
+        return max(0.0, self.last_poll + self.interval - now, self.blocked_until - now)
+
+    def next_delay(self) -> float:
+        """
+        Пауза до следующего опроса (с небольшим случайным разбросом).
+        """
+        delay = self.interval * random.uniform(0.9, 1.1)
+        return max(delay, self.blocked_until - time.monotonic())
+
+
+# Отдельные бюджеты опроса для Bot API и MTProto
+bot_poll_scheduler = PollScheduler("bot", BOT_POLL_MIN_INTERVAL, BOT_POLL_INTERVAL, BOT_POLL_MAX_INTERVAL)
+userbot_poll_scheduler = PollScheduler("userbot", USERBOT_POLL_MIN_INTERVAL, USERBOT_UPDATE_COOLDOWN, USERBOT_POLL_MAX_INTERVAL)
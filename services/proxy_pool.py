@@ -0,0 +1,194 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import time
+from typing import Optional
+
+# --- Сторонние библиотеки ---
+from python_socks.async_.asyncio import Proxy
+
+# --- Внутренние модули ---
+from services.config import (
+    PROXY_PROBE_HOST,
+    PROXY_PROBE_PORT,
+    PROXY_PROBE_INTERVAL,
+    PROXY_PROBE_TIMEOUT,
+    PROXY_MAX_FAILURES,
+    PROXY_SWITCH_MARGIN,
+    PROXY_SWITCH_COOLDOWN,
+    PROXY_DRAIN_TIMEOUT
+)
+from services.userbot_pool import get_members
+from utils.proxy import get_proxy_url, get_userbot_proxy
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyState:
+    """
+    Один SOCKS5-прокси из конфига и результаты его проверок.
+
+    - latency: время установки соединения через прокси до PROXY_PROBE_HOST (по последней успешной проверке)
+    - failures: число неудачных проверок подряд; при PROXY_MAX_FAILURES прокси считается нерабочим
+    """
+
+    def __init__(self, entry: dict):
+        """
+        :param entry: Запись из PROXIES: {"hostname", "port", "username", "password"}
+        """
+        self.entry = entry
+        self.url = get_proxy_url(entry)
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.checked_at = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.entry.get('hostname')}:{self.entry.get('port')}"
+
+    def is_healthy(self) -> bool:
+        """
+        True, если прокси прошёл хотя бы одну проверку и не превысил лимит отказов подряд.
+        """
+        return self.latency is not None and self.failures < PROXY_MAX_FAILURES
+
+
+_proxies: list[ProxyState] = []
+_current: Optional[ProxyState] = None
+_switched_at = 0.0  # Время последнего переключения прокси (time.monotonic)
+
+
+async def probe_proxy(proxy: ProxyState) -> Optional[float]:
+    """
+    Измеряет задержку прокси: время установки TCP-соединения через SOCKS5 до PROXY_PROBE_HOST:PROXY_PROBE_PORT.
+
+    :return: Задержка в секундах или None при ошибке
+    """
+    started = time.monotonic()
+    try:
+        sock = await Proxy.from_url(proxy.url).connect(
+            dest_host=PROXY_PROBE_HOST,
+            dest_port=PROXY_PROBE_PORT,
+            timeout=PROXY_PROBE_TIMEOUT
+        )
+        sock.close()
+    except Exception as e:
+        proxy.failures += 1
+        proxy.checked_at = time.monotonic()
+        logger.debug(f"Прокси {proxy.name}: проверка не прошла ({e!r}), отказов подряд: {proxy.failures}")
+        return None
+    proxy.latency = time.monotonic() - started
+    proxy.failures = 0
+    proxy.checked_at = time.monotonic()
+    return proxy.latency
+
+
+def _pick_best() -> Optional[ProxyState]:
+    """
+    Выбирает прокси для трафика. Нерабочий текущий прокси заменяется сразу; рабочий остаётся,
+    пока он не медленнее лучшего в PROXY_SWITCH_MARGIN раз и с прошлого переключения не прошло
+    PROXY_SWITCH_COOLDOWN (чтобы не переключаться из-за колебаний задержки).
+    """
+    healthy = [p for p in _proxies if p.is_healthy()]
+    if not healthy:
+        return _current
+    best = min(healthy, key=lambda p: p.latency)
+    if _current is not None and _current.is_healthy():
+        if _current.latency <= best.latency * PROXY_SWITCH_MARGIN:
+            return _current
+        if time.monotonic() - _switched_at < PROXY_SWITCH_COOLDOWN:
+            return _current
+    return best
+
+
+async def init_proxy_pool(entries: list[dict]) -> Optional[str]:
+    """
+    Загружает прокси из конфига, проверяет их и выбирает самый быстрый.
+    Без прокси в конфиге трафик идёт напрямую.
+
+    :param entries: Список PROXIES из конфига
+    :return: URL выбранного прокси или None
+    """
+    global _proxies, _current
+    _proxies = [ProxyState(entry) for entry in entries if entry.get("hostname") and entry.get("port")]
+    _current = None
+    if not _proxies:
+        return None
+    await asyncio.gather(*(probe_proxy(p) for p in _proxies))
+    _current = _pick_best()
+    if _current is None:
+        # Ни один прокси не ответил — начинаем с первого, проверки переключат на рабочий
+        _current = _proxies[0]
+        logger.warning(f"Ни один прокси не прошёл проверку, используется {_current.name}")
+    else:
+        logger.info(f"Выбран прокси {_current.name} ({_current.latency * 1000:.0f} мс), всего прокси: {len(_proxies)}")
+    return _current.url
+
+
+def get_current_userbot_proxy() -> Optional[dict]:
+    """
+    Текущий прокси в формате Pyrogram для клиентов юзербота (None — без прокси).
+    """
+    return get_userbot_proxy(_current.entry) if _current else None
+
+
+async def _drain_member(member, timeout: float = PROXY_DRAIN_TIMEOUT):
+    """
+    Ждёт, пока через сессию не останется отправляющихся покупок (не дольше timeout).
+    """
+    deadline = time.monotonic() + timeout
+    while member.in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def _switch_clients(proxy: ProxyState, bot):
+    """
+    Переводит сессию бота и все сессии пула юзерботов на новый прокси.
+    Сессии юзербота переподключаются по одной: сессия перестаёт получать новые покупки,
+    ждёт завершения отправленных и только потом перезапускается, остальные в это время работают.
+    Сессии, которые не удалось перезапустить, остаются неготовыми — их переподключит userbot_supervisor.
+    """
+    # Новые запросы бота идут через новый прокси, начатые дорабатывают на старом соединении
+    bot.session.proxy = proxy.url
+    userbot_proxy = get_userbot_proxy(proxy.entry)
+    for member in get_members():
+        member.client.proxy = userbot_proxy
+        member.ready = False
+        # userbot_supervisor не проверяет сессию, пока она переключается (иначе удачный ping вернёт её в работу)
+        member.next_check = float("inf")
+        await _drain_member(member)
+        try:
+            await member.client.restart()
+        except Exception as e:
+            logger.warning(f"Сессия {member.name}: не удалось переподключиться через прокси {proxy.name}: {e}")
+            continue
+        finally:
+            member.next_check = 0.0
+        member.ready = True
+
+
+async def proxy_prober(bot, interval: int = PROXY_PROBE_INTERVAL):
+    """
+    Фоновая задача: периодически проверяет задержку всех прокси и переключает трафик
+    бота и юзерботов на самый быстрый рабочий прокси, если текущий отказал или заметно медленнее.
+    """
+    global _current, _switched_at
+    if not _proxies:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.gather(*(probe_proxy(p) for p in _proxies))
+            best = _pick_best()
+            if best is None or best is _current:
+                continue
+            previous = _current
+            _current = best
+            _switched_at = time.monotonic()
+            logger.warning(
+                f"Переключение прокси: {previous.name if previous else '-'} → {best.name} "
+                f"({best.latency * 1000:.0f} мс)"
+            )
+            await _switch_clients(best, bot)
+        except Exception as e:
+            logger.error(f"Ошибка в proxy_prober: {e}")
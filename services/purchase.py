@@ -0,0 +1,197 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+
+# --- Внутренние модули ---
+from services.config import PURCHASE_CONCURRENCY, DEV_MODE, load_config
+from services.catalog import get_merged_catalog
+from services.catalog_events import CatalogEvent, GiftAdded, SupplyChanged
+from services.buy_bot import buy_gift
+from services.buy_userbot import buy_gift_userbot
+from services.ledger import record_purchase
+from services.planner import PlannedPurchase
+from services.userbot_pool import select_purchase_member
+from services.payment_forms import prefetch_payment_forms, has_payment_form
+from services.peers import get_recipient
+
+logger = logging.getLogger(__name__)
+
+_prefetch_tasks: set[asyncio.Task] = set()  # Предзагрузка форм, запущенная событиями каталога
+
+# Общее для всех профилей ограничение числа одновременных покупок на отправителя
+_sender_slots = {
+    "bot": asyncio.Semaphore(PURCHASE_CONCURRENCY),
+    "userbot": asyncio.Semaphore(PURCHASE_CONCURRENCY),
+}
+
+
+async def send_one_gift(bot, user_id: int, sender: str, gift: dict, target_user_id, target_chat_id) -> bool:
+    """
+    Выполняет одну покупку подарка через указанного отправителя.
+
+    :param bot: Экземпляр бота
+    :param user_id: ID владельца (конфиг и userbot-сессия)
+    :param sender: "bot" или "userbot"
+    :param gift: Нормализованный подарок
+    :return: True, если покупка успешна
+    """
+    slots = _sender_slots.get(sender)
+    if slots is None:
+        logger.warning(f"Неизвестный отправитель SENDER={sender}")
+        return False
+
+    async with slots:
+        try:
+            if sender == "bot":
+                return await buy_gift(
+                    bot=bot,
+                    env_user_id=user_id,
+                    gift_id=gift["id"],
+                    user_id=target_user_id,
+                    chat_id=target_chat_id,
+                    gift_price=gift["price"],
+                    file_id=gift.get("sticker_file_id")
+                )
+            return await buy_gift_userbot(
+                session_user_id=user_id,
+                gift_id=gift["id"],
+                target_user_id=target_user_id,
+                target_chat_id=target_chat_id,
+                gift_price=gift["price"],
+                file_id=gift.get("sticker_file_id")
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при покупке подарка {gift['id']} ({sender}): {e}")
+            return False
+
+
+async def _get_form_prefetcher(profile: dict):
+    """
+    Для профиля с SENDER=userbot возвращает функцию предзагрузки форм оплаты
+    prefetch(gift, count) для получателя профиля; иначе None.
+    """
+    if DEV_MODE or profile.get("SENDER", "bot") != "userbot":
+        return None
+    recipient = get_recipient(profile["TARGET_USER_ID"], profile["TARGET_CHAT_ID"])
+    if recipient is None:
+        return None
+
+    def prefetch(gift: dict, count: int):
+        # Форма привязана к аккаунту: берём сессию, которую выбрал бы маршрутизатор покупок
+        # (он предпочитает сессии с уже полученными формами, поэтому покупать будет она же)
+        member = select_purchase_member(
+            gift["price"],
+            reserve=False,
+            prefer=lambda m: has_payment_form(m.client, gift["id"], recipient)
+        )
+        if member:
+            prefetch_payment_forms(member.client, gift["id"], recipient, count)
+
+    return prefetch
+
+
+async def prefetch_forms_for_events(events: list[CatalogEvent]):
+    """
+    Запрашивает формы оплаты, как только подарок появился в каталоге или пополнился,
+    для всех активных профилей юзербота, которым он подходит. К моменту покупки форма
+    уже получена, и покупка выполняется одним запросом (payments.sendStarsForm).
+    """
+    gift_ids = {
+        e.gift_id for e in events
+        if isinstance(e, (GiftAdded, SupplyChanged)) and e.left != 0
+    }
+    if not gift_ids:
+        return
+    config = await load_config()
+    if not config.get("ACTIVE"):
+        return
+    snapshot = get_merged_catalog()
+    for profile in config.get("PROFILES", []):
+        count_left = profile.get("COUNT", 0) - profile.get("BOUGHT", 0)
+        if profile.get("DONE") or count_left <= 0:
+            continue
+        prefetch = await _get_form_prefetcher(profile)
+        if prefetch is None:
+            continue
+        for gift in snapshot.filter_by_profile(profile):
+            if str(gift["id"]) in gift_ids:
+                prefetch(gift, min(count_left, PURCHASE_CONCURRENCY))
+
+
+def on_catalog_events(events: list[CatalogEvent]):
+    """
+    Подписчик событий каталога (см. add_event_listener): запускает предзагрузку форм оплаты в фоне.
+    """
+    async def run():
+        try:
+            await prefetch_forms_for_events(events)
+        except Exception as e:
+            logger.error(f"Ошибка предзагрузки форм оплаты по событиям каталога: {e}")
+
+    task = asyncio.create_task(run())
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+
+async def execute_profile_purchases(
+    bot,
+    user_id: int,
+    profile: dict,
+    planned: list[PlannedPurchase],
+    concurrency: int = PURCHASE_CONCURRENCY
+) -> tuple[list[dict], bool]:
+    """
+    Выполняет план покупок одного профиля, держа до concurrency покупок одновременно.
+    Количество экземпляров каждого подарка уже рассчитано планировщиком (plan_purchases)
+    в пределах COUNT, LIMIT, остатка подарка и баланса, поэтому здесь решений не принимается:
+    план только отправляется. Успешные покупки учитываются в журнале (BOUGHT/SPENT)
+    и в переданном словаре profile.
+    Для юзербота формы оплаты всех подарков плана запрашиваются заранее и параллельно,
+    поэтому большинство покупок выполняется одним запросом.
+
+    :param bot: Экземпляр бота
+    :param user_id: ID владельца
+    :param profile: Профиль (изменяется на месте: BOUGHT, SPENT)
+    :param planned: Запланированные покупки профиля, в порядке приоритета
+    :param concurrency: Максимум одновременных покупок
+    :return: (список покупок {"id", "price"}, True если не было ни одной неудачной покупки)
+    """
+    sender = profile.get("SENDER", "bot")
+    target_user_id = profile["TARGET_USER_ID"]
+    target_chat_id = profile["TARGET_CHAT_ID"]
+    purchases = []
+    all_ok = True
+
+    prefetch = await _get_form_prefetcher(profile)
+    if prefetch:
+        for item in planned:
+            prefetch(item.gift, min(item.count, concurrency))
+
+    for item in planned:
+        gift = item.gift
+        launched = 0
+        failed = False
+        in_flight = set()
+        while (launched < item.count and not failed) or in_flight:
+            while launched < item.count and not failed and len(in_flight) < concurrency:
+                if prefetch:
+                    prefetch(gift, item.count - launched)  # Пополняем запас форм для следующих покупок
+                in_flight.add(asyncio.create_task(
+                    send_one_gift(bot, user_id, sender, gift, target_user_id, target_chat_id)
+                ))
+                launched += 1
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.result():
+                    failed = True  # Новые покупки этого подарка не запускаем, ждём уже отправленные
+                    continue
+                # Учёт покупки — одна запись в журнал вместо перезаписи конфига
+                await record_purchase(profile["ID"], gift["price"])
+                profile["BOUGHT"] += 1
+                profile["SPENT"] += gift["price"]
+                purchases.append({"id": gift["id"], "price": gift["price"]})
+
+        if failed:
+            all_ok = False  # Не удалось купить — переходим к следующему подарку плана
+
+    return purchases, all_ok
@@ -0,0 +1,97 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import time
+
+# --- Внутренние модули ---
+from services.config import (
+    PURCHASE_RATE,
+    PURCHASE_MIN_RATE,
+    PURCHASE_MAX_RATE,
+    PURCHASE_BURST,
+    PURCHASE_RATE_INCREASE,
+    PURCHASE_RATE_DECREASE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket с адаптивной скоростью (AIMD) для одного отправителя.
+
+    - Каждый запрос забирает один токен; токены пополняются со скоростью rate в секунду.
+    - Успешный запрос увеличивает rate на PURCHASE_RATE_INCREASE (аддитивно).
+    - FloodWait/RetryAfter умножает rate на PURCHASE_RATE_DECREASE и блокирует выдачу токенов до конца ожидания.
+    """
+
+    def __init__(self, name: str, rate: float, min_rate: float, max_rate: float, burst: int):
+        """
+        :param name: Имя отправителя для логов
+        :param rate: Начальная скорость (запросов в секунду)
+        :param min_rate: Минимальная скорость
+        :param max_rate: Максимальная скорость
+        :param burst: Максимальное число накопленных токенов
+        """
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        """
+        Пополняет токены за время, прошедшее с последнего обновления.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Ожидает и забирает один токен. Ожидающие обслуживаются по очереди.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        """
+        Аддитивно увеличивает скорость после успешного запроса.
+        """
+        self.rate = min(self.max_rate, self.rate + PURCHASE_RATE_INCREASE)
+
+    def on_flood(self, retry_after: float):
+        """
+        Мультипликативно снижает скорость и блокирует запросы на retry_after секунд.
+        """
+        now = time.monotonic()
+        self.rate = max(self.min_rate, self.rate * PURCHASE_RATE_DECREASE)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.tokens = 0.0
+        self.updated = now
+        logger.warning(f"Покупки ({self.name}): флуд-ограничение {retry_after} сек, скорость снижена до {self.rate:.2f}/сек")
+
+
+# Бюджет покупок бота; у каждой сессии юзербота свой бюджет (services.userbot_pool)
+_purchase_limiters = {
+    "bot": TokenBucket("bot", PURCHASE_RATE, PURCHASE_MIN_RATE, PURCHASE_MAX_RATE, PURCHASE_BURST),
+}
+
+
+def get_purchase_limiter(sender: str) -> TokenBucket:
+    """
+    Возвращает ограничитель покупок для отправителя ("bot").
+    """
+    return _purchase_limiters[sender]
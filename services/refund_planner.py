@@ -0,0 +1,135 @@
+# --- Стандартные библиотеки ---
+import logging
+from bisect import bisect_right
+from functools import reduce
+from math import gcd, isqrt
+
+# --- Внутренние модули ---
+from services.config import REFUND_DP_MAX_BITS, REFUND_MITM_MAX_ITEMS
+
+logger = logging.getLogger(__name__)
+
+
+def _dp_checkpoint_step(count: int) -> int:
+    """
+    Шаг контрольных точек динамики: около sqrt(count), чтобы хранить O(sqrt(n)) bitset-ов вместо n.
+    """
+    return max(1, isqrt(count))
+
+
+def _subset_sum_dp(amounts: list[int], capacity: int) -> list[int]:
+    """
+    Точный подбор через битовую динамику: бит s в reachable означает, что сумма s достижима.
+    Для восстановления выбранных элементов хранятся только контрольные bitset-ы (каждые ~sqrt(n) шагов),
+    промежуточные пересчитываются поблочно при обратном проходе.
+    """
+    mask = (1 << (capacity + 1)) - 1
+    step = _dp_checkpoint_step(len(amounts))
+    reachable = 1
+    checkpoints = [reachable]
+    for i, amount in enumerate(amounts, 1):
+        reachable = (reachable | (reachable << amount)) & mask
+        if i % step == 0:
+            checkpoints.append(reachable)
+    best = reachable.bit_length() - 1
+
+    chosen = []
+    s = best
+    for block in range((len(amounts) - 1) // step, -1, -1):
+        start = block * step
+        end = min(start + step, len(amounts))
+        history = [checkpoints[block]]
+        for amount in amounts[start:end - 1]:
+            history.append((history[-1] | (history[-1] << amount)) & mask)
+        for i in range(end - 1, start - 1, -1):
+            if not (history[i - start] >> s) & 1:
+                chosen.append(i)
+                s -= amounts[i]
+    return chosen
+
+
+def _dp_memory_bits(count: int, capacity: int) -> int:
+    """
+    Сколько бит одновременно хранит _subset_sum_dp.
+    """
+    step = _dp_checkpoint_step(count)
+    return (count // step + step + 1) * (capacity + 1)
+
+
+def _half_sums(amounts: list[int]) -> list[int]:
+    """
+    Суммы всех подмножеств: элемент с индексом m — сумма подмножества с битовой маской m.
+    """
+    sums = [0]
+    for amount in amounts:
+        sums += [s + amount for s in sums]
+    return sums
+
+
+def _subset_sum_mitm(amounts: list[int], capacity: int) -> list[int]:
+    """
+    Точный подбор «встречей посередине» для небольшого числа элементов с большими суммами:
+    O(2^(n/2) · n) вместо O(n · capacity).
+    """
+    half = len(amounts) // 2
+    left_sums = _half_sums(amounts[:half])
+    right_sums = _half_sums(amounts[half:])
+    right_order = sorted(range(len(right_sums)), key=right_sums.__getitem__)
+    right_sorted = [right_sums[m] for m in right_order]
+
+    best, best_left, best_right = -1, 0, 0
+    for left_mask, left_sum in enumerate(left_sums):
+        if left_sum > capacity:
+            continue
+        pos = bisect_right(right_sorted, capacity - left_sum) - 1
+        if pos >= 0 and left_sum + right_sorted[pos] > best:
+            best, best_left, best_right = left_sum + right_sorted[pos], left_mask, right_order[pos]
+            if best == capacity:
+                break
+
+    chosen = [i for i in range(half) if best_left >> i & 1]
+    chosen += [half + i for i in range(len(amounts) - half) if best_right >> i & 1]
+    return chosen
+
+
+def plan_refund(amounts: list[int], capacity: int) -> list[int]:
+    """
+    Подбирает депозиты для возврата с максимальной суммой, не превышающей capacity (баланс).
+
+    - Суммы сокращаются на общий делитель, депозиты больше capacity отбрасываются.
+    - Если динамика укладывается в REFUND_DP_MAX_BITS — точный ответ битовой динамикой.
+    - Иначе при числе депозитов не больше REFUND_MITM_MAX_ITEMS — точный ответ «встречей посередине».
+    - Иначе суммы масштабируются (с округлением вверх, поэтому подбор всегда допустим),
+      а остаток добирается жадно от крупных к мелким.
+
+    :param amounts: Суммы депозитов
+    :param capacity: Баланс, который можно вернуть
+    :return: Индексы выбранных депозитов в amounts
+    """
+    candidates = [i for i, amount in enumerate(amounts) if 0 < amount <= capacity]
+    if not candidates:
+        return []
+    if sum(amounts[i] for i in candidates) <= capacity:
+        return candidates
+
+    divisor = reduce(gcd, (amounts[i] for i in candidates))
+    reduced = [amounts[i] // divisor for i in candidates]
+    reduced_capacity = capacity // divisor
+
+    if _dp_memory_bits(len(reduced), reduced_capacity) <= REFUND_DP_MAX_BITS:
+        chosen = _subset_sum_dp(reduced, reduced_capacity)
+    elif len(reduced) <= REFUND_MITM_MAX_ITEMS:
+        chosen = _subset_sum_mitm(reduced, reduced_capacity)
+    else:
+        scale = -(-_dp_memory_bits(len(reduced), reduced_capacity) // REFUND_DP_MAX_BITS)
+        scaled = [-(-amount // scale) for amount in reduced]
+        chosen = _subset_sum_dp(scaled, reduced_capacity // scale)
+        left = reduced_capacity - sum(reduced[i] for i in chosen)
+        taken = set(chosen)
+        for i in sorted(range(len(reduced)), key=reduced.__getitem__, reverse=True):
+            if i not in taken and reduced[i] <= left:
+                chosen.append(i)
+                left -= reduced[i]
+        logger.debug(f"Подбор возвратов: {len(reduced)} депозитов, суммы масштабированы в {scale} раз")
+
+    return sorted(candidates[i] for i in chosen)
@@ -0,0 +1,98 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+# --- Сторонние библиотеки ---
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+# --- Внутренние модули ---
+from services.config import REFUND_CONCURRENCY, REFUND_RETRIES
+from services.rate_limiter import get_purchase_limiter
+from services.star_transactions import StarTxn
+
+logger = logging.getLogger(__name__)
+
+ALREADY_REFUNDED = "CHARGE_ALREADY_REFUNDED"
+
+
+@dataclass
+class RefundResult:
+    """
+    Итог возврата одной транзакции.
+
+    - ok: возврат выполнен
+    - attempts: сколько запросов refund_star_payment было отправлено
+    - error: текст последней ошибки (если возврат не выполнен)
+    """
+    txn_id: str
+    amount: int
+    ok: bool
+    attempts: int
+    error: Optional[str] = None
+
+
+async def refund_one(bot, user_id: int, txn: StarTxn, retries: int = REFUND_RETRIES) -> RefundResult:
+    """
+    Возвращает звёзды по одной транзакции. Временные ошибки (сеть, флуд-ограничение,
+    ошибка сервера Telegram) повторяются, остальные ошибки API завершают попытки сразу.
+    CHARGE_ALREADY_REFUNDED считается успехом: возврат мог пройти в попытке, ответ на которую не дошёл.
+    """
+    limiter = get_purchase_limiter("bot")
+    error = None
+    for attempt in range(1, retries + 1):
+        await limiter.acquire()
+        try:
+            await bot.refund_star_payment(user_id=user_id, telegram_payment_charge_id=txn.id)
+            limiter.on_success()
+            return RefundResult(txn.id, txn.amount, True, attempt)
+        except TelegramRetryAfter as e:
+            error = str(e)
+            limiter.on_flood(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            error = str(e)
+            if attempt == retries:
+                break
+            logger.warning(f"Возврат {txn.id}: попытка {attempt}/{retries} не удалась ({e}), повтор через {2**attempt} сек")
+            await asyncio.sleep(2**attempt)
+        except TelegramAPIError as e:
+            if ALREADY_REFUNDED in str(e):
+                # Предыдущая попытка (например, с истёкшим таймаутом) уже выполнила возврат
+                logger.info(f"Возврат {txn.id} уже выполнен ранее")
+                limiter.on_success()
+                return RefundResult(txn.id, txn.amount, True, attempt)
+            logger.error(f"Возврат {txn.id} отклонён: {e}")
+            return RefundResult(txn.id, txn.amount, False, attempt, str(e))
+        except Exception as e:
+            logger.error(f"Непредвиденная ошибка при возврате {txn.id}: {e}")
+            return RefundResult(txn.id, txn.amount, False, attempt, str(e))
+    logger.error(f"Возврат {txn.id} не выполнен после {retries} попыток: {error}")
+    return RefundResult(txn.id, txn.amount, False, retries, error)
+
+
+async def refund_transactions(
+    bot,
+    user_id: int,
+    txns: list[StarTxn],
+    concurrency: int = REFUND_CONCURRENCY
+) -> list[RefundResult]:
+    """
+    Выполняет возвраты по списку транзакций параллельно (не более concurrency одновременно).
+    Частота запросов ограничивается общим token bucket бота (флуд-ограничения Bot API
+    действуют на бота целиком, поэтому бюджет общий с покупками).
+
+    :return: Результаты в порядке txns
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(txn: StarTxn) -> RefundResult:
+        async with semaphore:
+            return await refund_one(bot, user_id, txn)
+
+    results = await asyncio.gather(*(run(t) for t in txns))
+    refunded = [r for r in results if r.ok]
+    logger.info(
+        f"Возвраты: выполнено {len(refunded)}/{len(results)} на ★{sum(r.amount for r in refunded)}"
+    )
+    return list(results)
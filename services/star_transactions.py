@@ -0,0 +1,191 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+# --- Сторонние библиотеки ---
+import aiofiles
+
+# --- Внутренние модули ---
+from services.config import STAR_TXN_PATH, STAR_TXN_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StarTxn:
+    """
+    Транзакция звёзд бота в локальной истории.
+
+    - incoming: True — поступление (депозит), False — списание (возврат, покупка подарка)
+    - user_id / username: отправитель депозита (для входящих от пользователя)
+    """
+    id: str
+    amount: int
+    date: int
+    incoming: bool
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, txn) -> "StarTxn":
+        user = getattr(txn.source, "user", None) if txn.source is not None else None
+        return cls(
+            id=txn.id,
+            amount=txn.amount,
+            date=int(txn.date.timestamp()) if hasattr(txn.date, "timestamp") else int(txn.date),
+            incoming=txn.source is not None,
+            user_id=user.id if user else None,
+            username=user.username if user else None
+        )
+
+
+def _same_txn(a: StarTxn, b: StarTxn) -> bool:
+    """
+    Совпадают ли транзакции по неизменяемым полям (username отправителя может смениться).
+    """
+    return (a.id, a.amount, a.date, a.incoming) == (b.id, b.amount, b.date, b.incoming)
+
+
+class StarTransactionStore:
+    """
+    Локальная копия истории get_star_transactions с индексами.
+
+    API отдаёт транзакции в хронологическом порядке, поэтому число сохранённых транзакций
+    служит курсором: sync() запрашивает только страницы после него. Последняя сохранённая
+    транзакция запрашивается повторно и сверяется — при расхождении история загружается заново.
+
+    Индексы: по ID и username отправителя депозита, множество id с возвратом
+    (списание с тем же id, что и депозит). История загружается с диска в sync(),
+    поэтому методы поиска отражают состояние после последнего sync().
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Путь к JSON-файлу истории
+        """
+        self.path = path
+        self.bot_id: Optional[int] = None
+        self.transactions: list[StarTxn] = []
+        self.balance = 0
+        self._by_user_id: dict[int, list[StarTxn]] = {}
+        self._by_username: dict[str, list[StarTxn]] = {}
+        self._refunded: set[str] = set()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def _reset(self, bot_id: Optional[int]):
+        self.bot_id = bot_id
+        self.transactions = []
+        self.balance = 0
+        self._by_user_id.clear()
+        self._by_username.clear()
+        self._refunded.clear()
+
+    def _index(self, txn: StarTxn):
+        """
+        Добавляет транзакцию в историю и индексы.
+        """
+        self.transactions.append(txn)
+        if txn.incoming:
+            self.balance += txn.amount
+            if txn.user_id is not None:
+                self._by_user_id.setdefault(txn.user_id, []).append(txn)
+            if txn.username:
+                self._by_username.setdefault(txn.username.lower(), []).append(txn)
+        else:
+            self.balance -= txn.amount
+            self._refunded.add(txn.id)
+
+    async def _load(self):
+        """
+        Загружает историю с диска при первом обращении.
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            async with aiofiles.open(self.path, mode="r", encoding="utf-8") as f:
+                data = json.loads(await f.read())
+            self._reset(data.get("bot_id"))
+            for item in data.get("transactions", []):
+                self._index(StarTxn(**item))
+        except Exception as e:
+            logger.error(f"Не удалось прочитать историю транзакций: {e}")
+            self._reset(None)
+
+    async def _save(self):
+        """
+        Атомарно записывает историю на диск (через временный файл).
+        """
+        data = {"bot_id": self.bot_id, "transactions": [asdict(t) for t in self.transactions]}
+        tmp_path = f"{self.path}.tmp"
+        async with aiofiles.open(tmp_path, mode="w", encoding="utf-8") as f:
+            await f.write(json.dumps(data, ensure_ascii=False))
+        os.replace(tmp_path, self.path)
+
+    async def sync(self, bot) -> int:
+        """
+        Догружает новые транзакции с API (обычно одна страница) и сохраняет историю.
+        Одновременные вызовы выполняются по очереди: второй получит уже загруженную историю.
+
+        :return: Число новых транзакций
+        """
+        async with self._lock:
+            await self._load()
+            if self.bot_id != bot.id:
+                if self.transactions:
+                    logger.warning("История транзакций принадлежит другому боту и будет загружена заново.")
+                self._reset(bot.id)
+
+            added = 0
+            # Перекрытие на одну транзакцию: проверяем, что история на сервере совпадает с сохранённой
+            offset = max(0, len(self.transactions) - 1)
+            overlap = len(self.transactions) > 0
+            while True:
+                res = await bot.get_star_transactions(offset=offset, limit=STAR_TXN_PAGE_SIZE)
+                page = [StarTxn.from_api(t) for t in res.transactions]
+                if overlap:
+                    overlap = False
+                    if not page or not _same_txn(page[0], self.transactions[-1]):
+                        logger.warning("История транзакций на сервере изменилась, загружаем заново.")
+                        self._reset(bot.id)
+                        offset = 0
+                        continue
+                    page = page[1:]
+                    offset += 1
+                for txn in page:
+                    self._index(txn)
+                added += len(page)
+                offset += len(page)
+                if len(res.transactions) < STAR_TXN_PAGE_SIZE:
+                    break
+
+            if added:
+                await self._save()
+                logger.debug(f"История транзакций: новых {added}, всего {len(self.transactions)}")
+            return added
+
+    def deposits_by_user(self, user_id: Optional[int] = None, username: Optional[str] = None) -> list[StarTxn]:
+        """
+        Депозиты пользователя по ID или username (в хронологическом порядке).
+        """
+        if user_id is not None:
+            return list(self._by_user_id.get(user_id, []))
+        if username:
+            return list(self._by_username.get(username.lower(), []))
+        return []
+
+    def unrefunded_deposits(self, user_id: Optional[int] = None, username: Optional[str] = None) -> list[StarTxn]:
+        """
+        Депозиты пользователя, по которым ещё не было возврата.
+        """
+        return [t for t in self.deposits_by_user(user_id, username) if t.id not in self._refunded]
+
+
+star_transactions = StarTransactionStore(STAR_TXN_PATH)
@@ -19,6 +19,8 @@ from pyrogram.errors import (
 
 # --- Внутренние библиотеки ---
 from services.config import get_valid_config, save_config
+from services.proxy_pool import get_current_userbot_proxy
+from services.userbot_pool import register_client, unregister_client, get_members, refresh_pool_balances
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,16 @@ def is_userbot_active(user_id: int) -> bool:
     return bool(info and info.get("client") and info.get("started"))
 
 
+def forget_userbot_client(session_name: str):
+    """
+    Удаляет сессию из пула юзерботов и из запущенных клиентов (например, после отзыва авторизации).
+    """
+    for user_id, info in list(_clients.items()):
+        if getattr(info.get("client"), "name", None) == session_name:
+            del _clients[user_id]
+    unregister_client(session_name)
+
+
 async def try_start_userbot_from_config(user_id: int):
     """
     Проверяет, есть ли валидная userbot-сессия для пользователя, и запускает её.
@@ -92,6 +104,7 @@ async def try_start_userbot_from_config(user_id: int):
                 "client": app,
                 "started": True,
             }
+            register_client(app.name, app, primary=True)
 
             return True
 
@@ -136,13 +149,14 @@ async def _clear_userbot_config(user_id: int):
         "PHONE": None,
         "USER_ID": None,
         "USERNAME": None,
-        "ENABLED": False
+        "ENABLED": False,
+        "POOL": config["USERBOT"].get("POOL", [])
     }
-    await save_config(config)
+    await save_config(config, notify=True)
     logger.info("Данные в конфиге очищены.")
 
 
-async def create_userbot_client(user_id: int, session_name: str, api_id: int, api_hash: str, phone: str, sessions_dir: str, proxy: str) -> Client:
+async def create_userbot_client(user_id: int, session_name: str, api_id: int, api_hash: str, phone: str, sessions_dir: str, proxy: dict) -> Client:
     """
     Создаёт экземпляр Pyrogram Client с предустановленными параметрами для userbot.
     
@@ -151,10 +165,11 @@ async def create_userbot_client(user_id: int, session_name: str, api_id: int, ap
     :param api_hash: api_hash от Telegram
     :param phone: Номер телефона userbot-аккаунта
     :param sessions_dir: Путь к папке, где хранятся сессии
+    :param proxy: Прокси в формате Pyrogram; None — текущий прокси из пула PROXIES (или без прокси)
     :return: Объект Pyrogram Client
     """
     # Настройки прокси
-    proxy_settings = await get_userbot_proxy(user_id)
+    proxy_settings = proxy if proxy is not None else get_current_userbot_proxy()
     return Client(
         name=session_name,
         api_id=api_id,
@@ -280,6 +295,7 @@ async def continue_userbot_signin(message, state):
             "client": app,
             "started": True,
         }
+        register_client(app.name, app, primary=True)
 
         # Сохраняем данные
         config = await get_valid_config(user_id)
@@ -289,7 +305,7 @@ async def continue_userbot_signin(message, state):
         config["USERBOT"]["USER_ID"] = me.id
         config["USERBOT"]["USERNAME"] = me.username
         config["USERBOT"]["ENABLED"] = True
-        await save_config(config)
+        await save_config(config, notify=True)
         
         return True, False, False  # Успешно, пароль не требуется, не retry
     except PhoneCodeInvalid:
@@ -357,6 +373,7 @@ async def finish_userbot_signin(message, state):
             "client": app,
             "started": True,
         }
+        register_client(app.name, app, primary=True)
 
         # Сохраняем данные
         config = await get_valid_config(user_id)
@@ -366,7 +383,7 @@ async def finish_userbot_signin(message, state):
         config["USERBOT"]["USER_ID"] = me.id
         config["USERBOT"]["USERNAME"] = me.username
         config["USERBOT"]["ENABLED"] = True
-        await save_config(config)
+        await save_config(config, notify=True)
         return True, False
     except PasswordHashInvalid:
         attempts += 1
@@ -457,25 +474,50 @@ async def delete_userbot_session(user_id: int) -> bool:
     # Удаляем из памяти
     if user_id in _clients:
         del _clients[user_id]
+    unregister_client(session_name)
 
     return True
 
 
 async def get_userbot_stars_balance() -> int:
     """
-    Получает баланс звёзд через авторизованного юзербота.
+    Получает суммарный баланс звёзд всех авторизованных сессий пула юзерботов.
     """
-    user_id = next(iter(_clients), None)
-    client_info = _clients.get(user_id)
-    if not client_info or not client_info.get("client"):
+    if not get_members():
         logger.error("Userbot не активен или не авторизован.")
         return 0
+    return await refresh_pool_balances()
 
-    app = client_info["client"]
 
-    try:
-        stars = await app.get_stars_balance()
-        return stars
-    except Exception as e:
-        logger.error(f"Ошибка при получении баланса юзербота: {e}")
-        return 0
+async def start_userbot_pool(user_id: int) -> int:
+    """
+    Запускает дополнительные сессии пула из USERBOT.POOL и добавляет их в пул.
+    Каждая запись — {"SESSION", "API_ID", "API_HASH", "PHONE"}; сессия должна быть
+    заранее авторизована (файл sessions/<SESSION>.session), интерактивный вход не выполняется.
+
+    :return: Число запущенных дополнительных сессий
+    """
+    config = await get_valid_config(user_id)
+    started = 0
+    for entry in config.get("USERBOT", {}).get("POOL", []):
+        session_name = entry.get("SESSION")
+        if not session_name or not all(entry.get(k) for k in ("API_ID", "API_HASH", "PHONE")):
+            logger.error(f"Неполная запись пула юзерботов: {session_name}")
+            continue
+        session_path = os.path.join(sessions_dir, f"{session_name}.session")
+        if not os.path.exists(session_path):
+            logger.error(f"Файл сессии {session_name} не найден, сессия пропущена.")
+            continue
+        app = await create_userbot_client(
+            user_id, session_name, entry["API_ID"], entry["API_HASH"], entry["PHONE"], sessions_dir, None
+        )
+        try:
+            await app.start()
+            me = await app.get_me()
+            logger.info(f"Сессия пула {session_name}: {me.first_name} ({me.id})")
+        except Exception as e:
+            logger.error(f"Не удалось запустить сессию пула {session_name}: {e}")
+            continue
+        register_client(session_name, app)
+        started += 1
+    return started
@@ -0,0 +1,221 @@
+# --- Стандартные библиотеки ---
+import logging
+import math
+import time
+from typing import Callable, Optional
+
+# --- Сторонние библиотеки ---
+from pyrogram import Client
+
+# --- Внутренние модули ---
+from services.config import (
+    PURCHASE_RATE,
+    PURCHASE_MIN_RATE,
+    PURCHASE_MAX_RATE,
+    PURCHASE_BURST
+)
+from services.balance_ledger import BalanceLedger
+from services.rate_limiter import TokenBucket
+from services.polling import userbot_poll_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMember:
+    """
+    Один авторизованный аккаунт юзербота в пуле.
+
+    - ledger: баланс звёзд аккаунта с резервированием под покупки
+    - limiter: собственный бюджет покупок аккаунта (FloodWait выдаётся на аккаунт)
+    - flood_until / last_flood: флуд-ограничение аккаунта и время последнего штрафа
+    - ready / rtt: готовность соединения и время отклика по данным userbot_supervisor
+    - in_flight: число покупок, которые сейчас отправляются через сессию
+    """
+
+    def __init__(self, name: str, client: Client, primary: bool = False):
+        """
+        :param name: Имя сессии
+        :param client: Запущенный Pyrogram Client
+        :param primary: True — основная сессия, настроенная через бота
+        """
+        self.name = name
+        self.client = client
+        self.primary = primary
+        self.ledger = BalanceLedger(name)
+        self.limiter = TokenBucket(name, PURCHASE_RATE, PURCHASE_MIN_RATE, PURCHASE_MAX_RATE, PURCHASE_BURST)
+        self.flood_until = 0.0
+        self.last_flood = 0.0
+        self.ready = True
+        self.rtt: Optional[float] = None
+        self.in_flight = 0
+        self.failures = 0
+        self.next_check = 0.0
+
+    def is_available(self) -> bool:
+        """
+        True, если соединение готово и аккаунт не под флуд-ограничением.
+        """
+        return self.ready and not self.is_blocked()
+
+    def is_blocked(self) -> bool:
+        """
+        True, если аккаунт ещё под флуд-ограничением.
+        """
+        return time.monotonic() < self.flood_until
+
+    def on_flood(self, retry_after: float):
+        """
+        Учитывает FloodWait аккаунта: блокирует его на retry_after секунд и снижает скорость покупок.
+        """
+        now = time.monotonic()
+        self.flood_until = max(self.flood_until, now + retry_after)
+        self.last_flood = now
+        self.limiter.on_flood(retry_after)
+
+    def can_afford(self, amount: int) -> bool:
+        """
+        Хватает ли свободного баланса. Если баланс аккаунта ещё не сверялся — считается, что хватает.
+        """
+        return not self.ledger.is_loaded() or self.ledger.available >= amount
+
+    def reserve(self, amount: int) -> bool:
+        """
+        Резервирует amount в балансе аккаунта (если баланс известен).
+        """
+        return not self.ledger.is_loaded() or self.ledger.reserve(amount)
+
+    def commit(self, amount: int):
+        """
+        Списывает резерв после успешной покупки.
+        """
+        if self.ledger.is_loaded():
+            self.ledger.commit(amount)
+
+    def release(self, amount: int):
+        """
+        Снимает резерв после неудачной покупки.
+        """
+        if self.ledger.is_loaded():
+            self.ledger.release(amount)
+
+
+_members: dict[str, PoolMember] = {}
+_poll_cursor = 0
+
+
+def register_client(name: str, client: Client, primary: bool = False) -> PoolMember:
+    """
+    Добавляет запущенную сессию в пул (или заменяет клиент существующей).
+    Интервал опроса каталога юзерботом делится на число аккаунтов.
+    """
+    member = _members.get(name)
+    if member is None:
+        member = PoolMember(name, client, primary)
+        _members[name] = member
+    else:
+        member.client = client
+    userbot_poll_scheduler.set_parallelism(len(_members))
+    logger.info(f"Сессия {name} добавлена в пул юзерботов (всего: {len(_members)})")
+    return member
+
+
+def unregister_client(name: str):
+    """
+    Удаляет сессию из пула.
+    """
+    if _members.pop(name, None):
+        userbot_poll_scheduler.set_parallelism(max(1, len(_members)))
+        logger.info(f"Сессия {name} удалена из пула юзерботов")
+
+
+def get_members() -> list[PoolMember]:
+    """
+    Все сессии пула (основная — первой).
+    """
+    return sorted(_members.values(), key=lambda m: not m.primary)
+
+
+def is_pool_ready() -> bool:
+    """
+    True, если хотя бы одна сессия пула готова к запросам.
+    """
+    return any(m.ready for m in _members.values())
+
+
+def all_members_blocked() -> bool:
+    """
+    True, если в пуле есть готовые сессии, но все они под флуд-ограничением.
+    """
+    ready = [m for m in _members.values() if m.ready]
+    return bool(ready) and all(m.is_blocked() for m in ready)
+
+
+def min_flood_remaining() -> int:
+    """
+    Через сколько секунд освободится первая сессия пула (0 — есть свободная).
+    """
+    now = time.monotonic()
+    remaining = [max(0.0, m.flood_until - now) for m in _members.values() if m.ready]
+    return math.ceil(min(remaining, default=0.0))
+
+
+def next_poll_member() -> Optional[PoolMember]:
+    """
+    Следующая сессия для опроса каталога (по кругу, пропуская неготовые сессии и сессии под флуд-ограничением).
+    """
+    global _poll_cursor
+    members = get_members()
+    for _ in range(len(members)):
+        member = members[_poll_cursor % len(members)]
+        _poll_cursor += 1
+        if member.is_available():
+            return member
+    return None
+
+
+def select_purchase_member(
+    amount: int,
+    reserve: bool = True,
+    prefer: Optional[Callable[[PoolMember], bool]] = None
+) -> Optional[PoolMember]:
+    """
+    Выбирает сессию для покупки: готовую, не под флуд-ограничением, со свободным балансом не меньше amount,
+    с самым давним флуд-штрафом (при равенстве — с наибольшим балансом).
+
+    :param amount: Стоимость покупки
+    :param reserve: Зарезервировать amount в балансе выбранной сессии
+    :param prefer: Сессии, для которых prefer(member) истинно, выбираются в первую очередь
+                   (например, те, для которых уже получены формы оплаты)
+    :return: PoolMember или None, если подходящей сессии нет
+    """
+    candidates = [m for m in _members.values() if m.is_available() and m.can_afford(amount)]
+    candidates.sort(key=lambda m: (not prefer(m) if prefer else False, m.last_flood, -m.ledger.available))
+    for member in candidates:
+        if not reserve or member.reserve(amount):
+            return member
+    return None
+
+
+async def refresh_pool_balances() -> int:
+    """
+    Запрашивает баланс звёзд каждой сессии пула и сверяет балансы в памяти.
+    Для неготовых сессий и сессий, баланс которых получить не удалось, в сумму входит
+    последний известный баланс: звёзды аккаунта не пропадают, пока он переподключается.
+
+    :return: Суммарный баланс всех сессий
+    """
+    total = 0
+    for member in get_members():
+        if not member.ready:
+            total += member.ledger.balance or 0
+            continue
+        commits_before = member.ledger.commits
+        try:
+            stars = await member.client.get_stars_balance()
+        except Exception as e:
+            logger.error(f"Ошибка при получении баланса юзербота {member.name}: {e}")
+            total += member.ledger.balance or 0
+            continue
+        member.ledger.reconcile(stars, commits_before)
+        total += stars
+    return total
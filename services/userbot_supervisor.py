@@ -0,0 +1,99 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+import random
+import time
+
+# --- Сторонние библиотеки ---
+from pyrogram import raw
+from pyrogram.errors import AuthKeyUnregistered, FloodWait
+
+# --- Внутренние модули ---
+from services.config import (
+    USERBOT_PING_INTERVAL,
+    USERBOT_PING_TIMEOUT,
+    USERBOT_RECONNECT_MIN_DELAY,
+    USERBOT_RECONNECT_MAX_DELAY
+)
+from services.userbot_pool import PoolMember, get_members, is_pool_ready
+from services.userbot import forget_userbot_client
+from services.catalog import set_source_ready
+from services.polling import in_drop_window
+
+logger = logging.getLogger(__name__)
+
+
+async def ping_member(member: PoolMember) -> float:
+    """
+    Отправляет ping (MTProto Ping) через сессию и возвращает время отклика в секундах.
+    """
+    started = time.monotonic()
+    await asyncio.wait_for(
+        member.client.invoke(raw.functions.Ping(ping_id=random.getrandbits(63))),
+        timeout=USERBOT_PING_TIMEOUT
+    )
+    return time.monotonic() - started
+
+
+async def reconnect_member(member: PoolMember):
+    """
+    Перезапускает клиент сессии. При неудаче следующая попытка откладывается
+    с экспоненциально растущей паузой (от USERBOT_RECONNECT_MIN_DELAY до USERBOT_RECONNECT_MAX_DELAY).
+    """
+    member.failures += 1
+    delay = min(USERBOT_RECONNECT_MAX_DELAY, USERBOT_RECONNECT_MIN_DELAY * 2 ** (member.failures - 1))
+    member.next_check = time.monotonic() + delay
+    try:
+        await member.client.restart()
+        member.rtt = await ping_member(member)
+    except Exception as e:
+        logger.warning(f"Сессия {member.name}: переподключение не удалось ({e}), следующая попытка через {delay} сек")
+        return
+    member.ready = True
+    member.failures = 0
+    member.next_check = 0.0
+    logger.info(f"Сессия {member.name} переподключена (RTT {member.rtt * 1000:.0f} мс)")
+
+
+async def check_member(member: PoolMember):
+    """
+    Проверяет соединение сессии: при успехе обновляет RTT и отмечает сессию готовой,
+    при ошибке отмечает неготовой и переподключает.
+    """
+    if time.monotonic() < member.next_check:
+        return
+    try:
+        member.rtt = await ping_member(member)
+        member.ready = True
+        member.failures = 0
+        return
+    except FloodWait:
+        return  # Соединение живо, ограничение учитывается при покупках и опросах
+    except AuthKeyUnregistered:
+        logger.error(f"Сессия {member.name} больше не авторизована и удалена из пула")
+        member.ready = False
+        forget_userbot_client(member.name)
+        return
+    except Exception as e:
+        if member.ready:
+            logger.warning(f"Сессия {member.name} не отвечает на ping: {e!r}")
+        member.ready = False
+    await reconnect_member(member)
+
+
+async def userbot_supervisor():
+    """
+    Фоновая задача: периодически проверяет все сессии пула юзерботов, переподключает
+    неготовые и сообщает общему каталогу, готов ли источник "userbot".
+    В окнах DROP_WINDOWS проверки выполняются втрое чаще, чтобы мёртвое соединение
+    заменялось до выхода подарков.
+    """
+    while True:
+        members = get_members()
+        if members:
+            await asyncio.gather(*(check_member(m) for m in members), return_exceptions=True)
+            set_source_ready("userbot", is_pool_ready())
+        else:
+            set_source_ready("userbot", False)
+        interval = USERBOT_PING_INTERVAL / 3 if in_drop_window() else USERBOT_PING_INTERVAL
+        await asyncio.sleep(interval)
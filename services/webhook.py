@@ -0,0 +1,142 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlparse
+
+# --- Сторонние библиотеки ---
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from pydantic import ValidationError
+
+# --- Внутренние модули ---
+from services.config import (
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+    WEBHOOK_MAX_BODY,
+    WEBHOOK_READ_CHUNK,
+    WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def _read_body(request: web.Request) -> Optional[bytes]:
+    """
+    Читает тело запроса порциями по WEBHOOK_READ_CHUNK, не дожидаясь и не буферизуя больше WEBHOOK_MAX_BODY.
+
+    :return: Тело запроса или None, если оно превышает лимит
+    """
+    if request.content_length and request.content_length > WEBHOOK_MAX_BODY:
+        return None
+    body = bytearray()
+    async for chunk in request.content.iter_chunked(WEBHOOK_READ_CHUNK):
+        body.extend(chunk)
+        if len(body) > WEBHOOK_MAX_BODY:
+            return None
+    return bytes(body)
+
+
+def create_webhook_app(bot: Bot, queue: asyncio.Queue, path: str, secret: Optional[str]) -> web.Application:
+    """
+    Создаёт aiohttp-приложение, которое принимает обновления Telegram и кладёт их в очередь.
+    Ответ отправляется сразу после постановки в очередь, не дожидаясь обработки.
+
+    - 401 — неверный секрет, 413 — слишком большое тело, 400 — некорректное обновление
+    - 503 — очередь заполнена (Telegram повторит доставку позже)
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        body = await _read_body(request)
+        if body is None:
+            logger.warning("Webhook: тело запроса превышает лимит, обновление отклонено")
+            return web.Response(status=413)
+        try:
+            update = Update.model_validate_json(body, context={"bot": bot})
+        except ValidationError as e:
+            logger.error(f"Webhook: некорректное обновление: {e}")
+            return web.Response(status=400)
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning(f"Webhook: очередь обновлений заполнена ({queue.maxsize}), update_id={update.update_id} отложен")
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application(client_max_size=WEBHOOK_MAX_BODY)
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def _update_worker(dp: Dispatcher, bot: Bot, queue: asyncio.Queue, workflow_data: dict):
+    """
+    Обрабатывает обновления из очереди через Dispatcher.
+    """
+    while True:
+        update = await queue.get()
+        try:
+            await dp.feed_update(bot, update, **workflow_data)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            queue.task_done()
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    secret: Optional[str] = None
+):
+    """
+    Принимает обновления через webhook вместо long polling.
+    HTTP-сервер, очередь обновлений и её обработчики работают в том же event loop,
+    что и воркер покупок. Выполняется до отмены задачи.
+
+    :param url: Публичный HTTPS-адрес webhook (путь берётся из него же)
+    :param host: Адрес, на котором слушает HTTP-сервер
+    :param port: Порт HTTP-сервера
+    :param secret: Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+    """
+    path = urlparse(url).path or "/"
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    workflow_data.pop("bot", None)
+
+    runner = web.AppRunner(create_webhook_app(bot, queue, path, secret))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    workers = [
+        asyncio.create_task(_update_worker(dp, bot, queue, workflow_data))
+        for _ in range(WEBHOOK_WORKERS)
+    ]
+
+    await dp.emit_startup(bot=bot, **workflow_data)
+    try:
+        await bot.set_webhook(
+            url=url,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook установлен: {url} (слушаем {host}:{port}{path})")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        # Обновления из очереди Telegram уже считает доставленными — дообрабатываем их перед остановкой
+        try:
+            await asyncio.wait_for(queue.join(), timeout=WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Webhook: необработанных обновлений при остановке: {queue.qsize()}")
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        try:
+            await dp.emit_shutdown(bot=bot, **workflow_data)
+        finally:
+            await bot.session.close()
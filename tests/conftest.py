@@ -0,0 +1,45 @@
+# --- Стандартные библиотеки ---
+import os
+import sys
+
+# --- Сторонние библиотеки ---
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# --- Внутренние модули ---
+from services import config
+
+
+@pytest.fixture
+def config_store(tmp_path, monkeypatch):
+    """
+    Чистое хранилище конфига в памяти; относительные пути (config.json, ledger.bin) — во временной папке.
+    """
+    monkeypatch.chdir(tmp_path)
+    for state in (
+        config._config_cache,
+        config._validated_paths,
+        config._config_versions,
+        config._flush_tasks,
+        config._dirty_paths,
+        config._write_locks,
+        config._ledger_records,
+        config._ledger_compacted_seq,
+        config.config_changed,
+    ):
+        state.clear()
+    monkeypatch.setattr(config, "CONFIG_FLUSH_DELAY", 0.01)
+    yield config
+
+
+@pytest.fixture
+def ledger(config_store, monkeypatch):
+    """
+    Журнал покупок с пустым буфером поверх чистого хранилища конфига.
+    """
+    from services import ledger as ledger_module
+    ledger_module._buffer.clear()
+    monkeypatch.setattr(ledger_module, "_sync_task", None)
+    monkeypatch.setattr(ledger_module, "_records_since_compact", 0)
+    yield ledger_module
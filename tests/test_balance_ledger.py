@@ -0,0 +1,32 @@
+# --- Внутренние модули ---
+from services.balance_ledger import BalanceLedger
+
+
+def _ledger(balance: int) -> BalanceLedger:
+    ledger = BalanceLedger("test")
+    ledger.reconcile(balance)
+    return ledger
+
+
+def test_reconcile_skipped_while_purchase_in_flight():
+    ledger = _ledger(100)
+    assert ledger.reserve(30)
+    # Покупка уже прошла на сервере, но commit() ещё не вызван
+    assert not ledger.reconcile(70)
+    assert ledger.commit(30) == 70
+
+
+def test_reconcile_skipped_if_purchase_committed_during_request():
+    ledger = _ledger(100)
+    commits_before = ledger.commits
+    assert ledger.reserve(30)
+    ledger.commit(30)
+    # Ответ API получен до списания и его не учитывает
+    assert not ledger.reconcile(100, commits_before)
+    assert ledger.balance == 70
+
+
+def test_reconcile_applies_when_idle():
+    ledger = _ledger(100)
+    assert ledger.reconcile(120, ledger.commits)
+    assert ledger.balance == 120
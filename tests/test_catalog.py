@@ -0,0 +1,29 @@
+# --- Стандартные библиотеки ---
+import time
+
+# --- Внутренние модули ---
+from services import catalog
+from services.catalog import CatalogSnapshot, merge_catalog
+from services.catalog_events import GiftAdded, catalog_events
+
+GIFTS = [{"id": 1, "price": 10, "left": 5}]
+
+
+def _drain() -> list:
+    events = []
+    while not catalog_events.empty():
+        events.append(catalog_events.get_nowait())
+    return events
+
+
+def test_stale_gift_is_announced_again(monkeypatch):
+    monkeypatch.setattr(catalog, "_merged_gifts", {})
+    monkeypatch.setattr(catalog, "_source_updated_at", {"bot": 0.0, "userbot": 0.0})
+    _drain()
+    merge_catalog(CatalogSnapshot.from_gifts(GIFTS, source="bot", fetched_at=time.time() - catalog.CATALOG_MAX_AGE - 1))
+    _drain()
+    assert catalog.get_merged_catalog().gifts == ()
+
+    # Бот снова включён: тот же подарок с тем же остатком
+    merge_catalog(CatalogSnapshot.from_gifts(GIFTS, source="bot"))
+    assert [type(e) for e in _drain()] == [GiftAdded]
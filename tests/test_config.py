@@ -0,0 +1,73 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import json
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_delayed_flush_writes_latest_config(config_store):
+    async def scenario():
+        await config_store.save_config({"BALANCE": 1}, "config.json")
+        await config_store.save_config({"BALANCE": 2}, "config.json")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert _read("config.json") == {"BALANCE": 2}
+    assert not config_store._flush_tasks
+
+
+def test_failed_write_is_retried(config_store, monkeypatch):
+    real_write = config_store._write_config
+    calls = []
+
+    async def flaky_write(path):
+        calls.append(path)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        await real_write(path)
+
+    monkeypatch.setattr(config_store, "_write_config", flaky_write)
+
+    async def scenario():
+        await config_store.save_config({"BALANCE": 5}, "config.json")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert _read("config.json") == {"BALANCE": 5}
+
+
+def test_flush_waits_for_write_in_progress(config_store, monkeypatch):
+    real_write = config_store._write_config
+    started = []
+
+    async def slow_write(path):
+        started.append(path)
+        await asyncio.sleep(0.05)
+        await real_write(path)
+
+    monkeypatch.setattr(config_store, "_write_config", slow_write)
+
+    async def scenario():
+        await config_store.save_config({"BALANCE": 1}, "config.json")
+        while not started:
+            await asyncio.sleep(0.001)
+        # Изменение во время записи и немедленная остановка
+        await config_store.save_config({"BALANCE": 2}, "config.json")
+        await config_store.flush_config()
+
+    asyncio.run(scenario())
+    assert _read("config.json") == {"BALANCE": 2}
+
+
+def test_only_user_edits_wake_worker(config_store):
+    async def scenario():
+        await config_store.save_config({"BALANCE": 1}, "config.json")
+        internal = config_store.config_changed.is_set()
+        await config_store.save_config({"BALANCE": 2}, "config.json", notify=True)
+        return internal, config_store.config_changed.is_set()
+
+    assert asyncio.run(scenario()) == (False, True)
@@ -0,0 +1,31 @@
+# --- Стандартные библиотеки ---
+import asyncio
+
+# --- Внутренние модули ---
+from services import gifts_manager
+from services.catalog import CatalogSnapshot
+
+
+def test_hedged_catalog_does_not_wait_for_slow_userbot(monkeypatch):
+    userbot_done = []
+
+    async def bot_catalog(bot):
+        return CatalogSnapshot.from_gifts([{"id": 1, "price": 10}], source="bot")
+
+    async def slow_userbot():
+        await asyncio.sleep(0.2)
+        userbot_done.append(True)
+        return CatalogSnapshot.from_gifts([{"id": 2, "price": 10}], source="userbot")
+
+    async def scenario():
+        userbot_task = asyncio.create_task(slow_userbot())
+        monkeypatch.setattr(gifts_manager, "get_bot_catalog", bot_catalog)
+        monkeypatch.setattr(gifts_manager, "_start_userbot_fetch", lambda user_id: userbot_task)
+        monkeypatch.setattr(gifts_manager, "_known_gift_ids", {"1"})
+        await gifts_manager.get_hedged_catalog(None, 1)
+        returned_early = not userbot_done
+        await userbot_task
+        await asyncio.sleep(0)
+        return returned_early, "2" in gifts_manager._known_gift_ids
+
+    assert asyncio.run(scenario()) == (True, True)
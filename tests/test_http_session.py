@@ -0,0 +1,45 @@
+# --- Стандартные библиотеки ---
+import asyncio
+
+# --- Внутренние модули ---
+from services.http_session import PooledAiohttpSession
+
+POOL_SETTINGS = {"limit": 7, "keepalive_timeout": 42, "use_dns_cache": True, "ttl_dns_cache": 99}
+
+
+def _session(proxy=None) -> PooledAiohttpSession:
+    return PooledAiohttpSession(proxy=proxy, limit=7, keepalive_timeout=42, dns_ttl=99)
+
+
+def _assert_pool_settings(session: PooledAiohttpSession):
+    for key, value in POOL_SETTINGS.items():
+        assert session._connector_init[key] == value
+    assert session._connector_init["ssl"] is session._ssl_context
+
+
+def test_direct_connector_has_pool_settings():
+    _assert_pool_settings(_session())
+
+
+def test_proxy_connector_has_pool_settings():
+    session = _session("socks5://127.0.0.1:1080")
+    _assert_pool_settings(session)
+    assert session._connector_init["port"] == 1080
+
+
+def test_proxy_switch_keeps_pool_settings_and_drains_old_session():
+    async def scenario():
+        session = _session("socks5://127.0.0.1:1080")
+        old = await session.create_session()
+        session._in_flight[old] = 1  # Покупка ещё выполняется через старый прокси
+        session.proxy = "socks5://127.0.0.1:1081"
+        _assert_pool_settings(session)
+        assert session._connector_init["port"] == 1081
+        new = await session.create_session()
+        await asyncio.sleep(0.15)
+        kept_open = not old.closed
+        del session._in_flight[old]
+        await session.close()
+        return new is not old, kept_open, old.closed
+
+    assert asyncio.run(scenario()) == (True, True, True)
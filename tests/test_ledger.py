@@ -0,0 +1,137 @@
+# --- Стандартные библиотеки ---
+import asyncio
+
+# --- Сторонние библиотеки ---
+import pytest
+
+USER_ID = 1
+
+
+def _crash(config_store):
+    """
+    Имитирует перезапуск: состояние в памяти теряется, остаются только файлы.
+    """
+    for state in (config_store._config_cache, config_store._validated_paths, config_store._dirty_paths):
+        state.clear()
+    for task in config_store._flush_tasks.values():
+        task.cancel()
+    config_store._flush_tasks.clear()
+    config_store._ledger_records.clear()
+    config_store._ledger_compacted_seq.clear()
+
+
+def test_replay_restores_unflushed_records(config_store, ledger):
+    async def before_crash():
+        await config_store.ensure_config(USER_ID)
+        profile_id = (await config_store.get_valid_config(USER_ID))["PROFILES"][0]["ID"]
+        await ledger.record_purchase(profile_id, 100)
+        await ledger.record_purchase(profile_id, 100)
+        await ledger.record_balance_change(50)
+        await ledger.sync_ledger()
+
+    async def after_crash():
+        await ledger.replay_ledger(USER_ID)
+        return await config_store.get_valid_config(USER_ID)
+
+    asyncio.run(before_crash())
+    _crash(config_store)
+    ledger._buffer.clear()
+    config = asyncio.run(after_crash())
+
+    profile = config["PROFILES"][0]
+    assert (profile["BOUGHT"], profile["SPENT"]) == (2, 200)
+    assert config["BALANCE"] == 50
+    assert config["LEDGER_SEQ"] == 3
+
+
+def test_stale_save_keeps_concurrent_purchase(config_store, ledger):
+    async def scenario():
+        await config_store.ensure_config(USER_ID)
+        stale = await config_store.get_valid_config(USER_ID)
+        # Пока вызывающий код ждёт, воркер записывает покупку
+        await ledger.record_purchase(stale["PROFILES"][0]["ID"], 100)
+        stale["ACTIVE"] = True
+        await config_store.save_config(stale)
+        return await config_store.get_valid_config(USER_ID)
+
+    config = asyncio.run(scenario())
+    profile = config["PROFILES"][0]
+    assert (profile["BOUGHT"], profile["SPENT"]) == (1, 100)
+    assert config["ACTIVE"] is True
+    assert config["LEDGER_SEQ"] == 1
+
+
+def test_stale_save_survives_restart(config_store, ledger):
+    async def before_crash():
+        await config_store.ensure_config(USER_ID)
+        stale = await config_store.get_valid_config(USER_ID)
+        await ledger.record_purchase(stale["PROFILES"][0]["ID"], 100)
+        stale["ACTIVE"] = True
+        await config_store.save_config(stale)
+        await config_store.flush_config()
+        await ledger.sync_ledger()
+
+    async def after_crash():
+        await ledger.replay_ledger(USER_ID)
+        return await config_store.get_valid_config(USER_ID)
+
+    asyncio.run(before_crash())
+    _crash(config_store)
+    config = asyncio.run(after_crash())
+    # Покупка не потеряна и не применена дважды
+    assert config["PROFILES"][0]["BOUGHT"] == 1
+    assert config["ACTIVE"] is True
+
+
+def test_save_rejected_when_records_forgotten(config_store, ledger):
+    async def scenario():
+        await config_store.ensure_config(USER_ID)
+        stale = await config_store.get_valid_config(USER_ID)
+        profile_id = stale["PROFILES"][0]["ID"]
+        await ledger.record_purchase(profile_id, 100)
+        await ledger.compact_ledger()
+        await ledger.record_purchase(profile_id, 100)
+        await ledger.compact_ledger()
+        await config_store.save_config(stale)
+
+    with pytest.raises(config_store.StaleConfigError):
+        asyncio.run(scenario())
+
+
+def test_stale_save_follows_profile_after_removal(config_store, ledger):
+    async def scenario():
+        await config_store.ensure_config(USER_ID)
+        config = await config_store.get_valid_config(USER_ID)
+        await config_store.add_profile(config, config_store.DEFAULT_PROFILE(USER_ID))
+        stale = await config_store.get_valid_config(USER_ID)
+        first_id, second_id = (p["ID"] for p in stale["PROFILES"])
+        await ledger.record_purchase(first_id, 100)
+        await ledger.record_purchase(second_id, 200)
+        # Удаление первого профиля сдвигает индексы: покупка второго не должна
+        # попасть на чужой профиль, покупка удалённого — отбрасывается
+        await config_store.remove_profile(stale, 0, USER_ID)
+        return await config_store.get_valid_config(USER_ID)
+
+    config = asyncio.run(scenario())
+    assert len(config["PROFILES"]) == 1
+    profile = config["PROFILES"][0]
+    assert (profile["BOUGHT"], profile["SPENT"]) == (1, 200)
+
+
+def test_reset_is_not_overridden_by_earlier_purchase(config_store, ledger):
+    async def scenario():
+        await config_store.ensure_config(USER_ID)
+        stale = await config_store.get_valid_config(USER_ID)
+        await ledger.record_purchase(stale["PROFILES"][0]["ID"], 100)
+        # Сброс счётчиков, как в reset_bought_callback
+        for profile in stale["PROFILES"]:
+            profile["ID"] = config_store.new_profile_id()
+            profile["BOUGHT"] = 0
+            profile["SPENT"] = 0
+        await config_store.save_config(stale)
+        return await config_store.get_valid_config(USER_ID)
+
+    config = asyncio.run(scenario())
+    profile = config["PROFILES"][0]
+    assert (profile["BOUGHT"], profile["SPENT"]) == (0, 0)
+    assert config["LEDGER_SEQ"] == 1
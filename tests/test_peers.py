@@ -0,0 +1,49 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+# --- Внутренние модули ---
+from services import peers
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_chat(self, chat_id):
+        self.calls += 1
+        return SimpleNamespace(id=100 + self.calls, type="channel", is_bot=False)
+
+
+def test_stale_entry_is_served_and_refreshed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(peers, "_peers", None)
+    stale = {"id": 1, "type": "channel", "is_bot": False, "resolved_at": time.time() - peers.PEER_CACHE_TTL - 1}
+    with open(peers.PEER_CACHE_PATH, "w", encoding="utf-8") as f:
+        json.dump({"bot:@chan": stale}, f)
+    bot = FakeBot()
+
+    async def scenario():
+        served = await peers.get_cached_bot_chat_id(bot, "@chan")
+        await asyncio.gather(*peers._refresh_tasks.values())
+        return served, await peers.get_cached_bot_chat_id(bot, "@chan")
+
+    assert asyncio.run(scenario()) == (1, 101)
+    assert bot.calls == 1
+
+
+def test_saved_profile_recipient_is_warmed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(peers, "_peers", None)
+    bot = FakeBot()
+    profile = {"TARGET_USER_ID": None, "TARGET_CHAT_ID": "@Chan", "SENDER": "bot"}
+
+    async def scenario():
+        peers.schedule_profile_warmup(bot, profile)
+        await asyncio.gather(*peers._warmup_tasks)
+        return await peers.get_cached_bot_chat_id(bot, "@chan")
+
+    assert asyncio.run(scenario()) == 101
+    assert bot.calls == 1
@@ -0,0 +1,21 @@
+# --- Стандартные библиотеки ---
+import time
+
+# --- Внутренние модули ---
+from services import polling
+from services.polling import PollScheduler
+
+
+def test_due_follows_adaptive_interval(monkeypatch):
+    monkeypatch.setattr(polling, "in_drop_window", lambda: False)
+    scheduler = PollScheduler("test", 2, 50, 60)
+    assert scheduler.due()
+    scheduler.on_result(changed=False)
+    scheduler.last_change -= polling.POLL_HOT_WINDOW + 1
+    scheduler.on_result(changed=False)
+    # Минимальный интервал прошёл, а адаптивный — нет
+    scheduler.last_poll = time.monotonic() - 3
+    assert not scheduler.due()
+    assert 0 < scheduler.until_due() <= scheduler.interval
+    scheduler.last_poll -= scheduler.interval
+    assert scheduler.due() and scheduler.until_due() == 0
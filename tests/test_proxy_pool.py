@@ -0,0 +1,52 @@
+# --- Стандартные библиотеки ---
+import asyncio
+import time
+from types import SimpleNamespace
+
+# --- Внутренние модули ---
+from services import proxy_pool
+from services.proxy_pool import ProxyState
+
+
+def _proxy(port: int, latency: float) -> ProxyState:
+    proxy = ProxyState({"hostname": "127.0.0.1", "port": port})
+    proxy.latency = latency
+    return proxy
+
+
+def test_faster_proxy_waits_for_cooldown(monkeypatch):
+    current, faster = _proxy(1080, 1.0), _proxy(1081, 0.1)
+    monkeypatch.setattr(proxy_pool, "_proxies", [current, faster])
+    monkeypatch.setattr(proxy_pool, "_current", current)
+    monkeypatch.setattr(proxy_pool, "_switched_at", time.monotonic())
+    assert proxy_pool._pick_best() is current
+
+    # Отказ текущего прокси переключает сразу, без ожидания
+    current.failures = proxy_pool.PROXY_MAX_FAILURES
+    assert proxy_pool._pick_best() is faster
+
+
+def test_userbot_restart_waits_for_purchases(monkeypatch):
+    events = []
+
+    class Client:
+        proxy = None
+
+        async def restart(self):
+            events.append("restart")
+
+    member = SimpleNamespace(name="s1", client=Client(), ready=True, in_flight=1, next_check=0.0)
+    bot = SimpleNamespace(session=SimpleNamespace(proxy=None))
+    monkeypatch.setattr(proxy_pool, "get_members", lambda: [member])
+
+    async def purchase():
+        await asyncio.sleep(0.15)
+        events.append("purchase done")
+        member.in_flight = 0
+
+    async def scenario():
+        await asyncio.gather(purchase(), proxy_pool._switch_clients(_proxy(1081, 0.1), bot))
+
+    asyncio.run(scenario())
+    assert events == ["purchase done", "restart"]
+    assert member.ready and member.next_check == 0.0
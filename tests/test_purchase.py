@@ -0,0 +1,38 @@
+# --- Стандартные библиотеки ---
+import asyncio
+
+# --- Внутренние модули ---
+from services import purchase
+from services.catalog import CatalogSnapshot
+from services.catalog_events import GiftAdded, SoldOut
+
+PROFILE = {
+    "SENDER": "userbot", "COUNT": 5, "BOUGHT": 1, "DONE": False,
+    "MIN_PRICE": 1, "MAX_PRICE": 100, "MIN_SUPPLY": 1, "MAX_SUPPLY": 1000,
+    "TARGET_USER_ID": 1, "TARGET_CHAT_ID": None
+}
+
+
+def test_catalog_events_prefetch_matching_forms(monkeypatch):
+    prefetched = []
+
+    async def load_config():
+        return {"ACTIVE": True, "PROFILES": [PROFILE, dict(PROFILE, SENDER="bot")]}
+
+    async def get_prefetcher(profile):
+        if profile["SENDER"] != "userbot":
+            return None
+        return lambda gift, count: prefetched.append((gift["id"], count))
+
+    gifts = [
+        {"id": "1", "price": 50, "supply": 100, "left": 10},
+        {"id": "2", "price": 500, "supply": 100, "left": 10},  # Дороже MAX_PRICE
+        {"id": "3", "price": 50, "supply": 100, "left": 0},
+    ]
+    monkeypatch.setattr(purchase, "load_config", load_config)
+    monkeypatch.setattr(purchase, "_get_form_prefetcher", get_prefetcher)
+    monkeypatch.setattr(purchase, "get_merged_catalog", lambda: CatalogSnapshot.from_gifts(gifts, source="merged"))
+
+    events = [GiftAdded("1", "bot", 50, 100, 10), GiftAdded("2", "bot", 500, 100, 10), SoldOut("3", "bot")]
+    asyncio.run(purchase.prefetch_forms_for_events(events))
+    assert prefetched == [("1", min(4, purchase.PURCHASE_CONCURRENCY))]
@@ -0,0 +1,77 @@
+# --- Стандартные библиотеки ---
+import random
+from itertools import combinations
+
+# --- Внутренние модули ---
+from services import refund_planner
+from services.refund_planner import plan_refund
+
+
+def _best_sum(amounts: list[int], capacity: int) -> int:
+    """
+    Максимальная сумма подмножества не больше capacity (полным перебором).
+    """
+    best = 0
+    for size in range(len(amounts) + 1):
+        for combo in combinations(amounts, size):
+            total = sum(combo)
+            if best < total <= capacity:
+                best = total
+    return best
+
+
+def _check_plan(amounts: list[int], capacity: int, chosen: list[int]) -> int:
+    assert chosen == sorted(set(chosen))
+    total = sum(amounts[i] for i in chosen)
+    assert total <= capacity
+    return total
+
+
+def test_dp_path_is_exact():
+    rng = random.Random(1)
+    for _ in range(50):
+        amounts = [rng.randint(1, 500) for _ in range(rng.randint(1, 12))]
+        capacity = rng.randint(1, sum(amounts))
+        chosen = plan_refund(amounts, capacity)
+        assert _check_plan(amounts, capacity, chosen) == _best_sum(amounts, capacity)
+
+
+def test_dp_path_handles_many_deposits():
+    rng = random.Random(2)
+    amounts = [rng.randint(50, 5000) for _ in range(500)]
+    capacity = sum(amounts) // 3
+    chosen = plan_refund(amounts, capacity)
+    # Среди 500 депозитов набирается ровно capacity
+    assert _check_plan(amounts, capacity, chosen) == capacity
+
+
+def test_mitm_path_is_exact(monkeypatch):
+    monkeypatch.setattr(refund_planner, "REFUND_DP_MAX_BITS", 0)
+    rng = random.Random(3)
+    for _ in range(30):
+        amounts = [rng.randint(1, 10**9) for _ in range(rng.randint(2, 12))]
+        capacity = rng.randint(1, sum(amounts))
+        chosen = plan_refund(amounts, capacity)
+        assert _check_plan(amounts, capacity, chosen) == _best_sum(amounts, capacity)
+
+
+def test_scaled_fallback_is_feasible(monkeypatch):
+    monkeypatch.setattr(refund_planner, "REFUND_DP_MAX_BITS", 1 << 12)
+    monkeypatch.setattr(refund_planner, "REFUND_MITM_MAX_ITEMS", 4)
+    rng = random.Random(4)
+    for _ in range(30):
+        amounts = [rng.randint(1, 10**6) for _ in range(rng.randint(8, 14))]
+        capacity = rng.randint(max(amounts), sum(amounts))
+        chosen = plan_refund(amounts, capacity)
+        total = _check_plan(amounts, capacity, chosen)
+        # Жадное дозаполнение: ни один невыбранный депозит уже не помещается в остаток
+        left = capacity - total
+        assert all(amounts[i] > left for i in range(len(amounts)) if i not in chosen)
+
+
+def test_trivial_cases():
+    assert plan_refund([], 100) == []
+    assert plan_refund([200, 300], 100) == []
+    assert plan_refund([10, 20, 30], 100) == [0, 1, 2]
+    # Общий делитель сокращается
+    assert plan_refund([1000, 2000, 3000], 5000) in ([0, 2], [1, 2])
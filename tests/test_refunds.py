@@ -0,0 +1,65 @@
+# --- Стандартные библиотеки ---
+import asyncio
+
+# --- Сторонние библиотеки ---
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.methods import RefundStarPayment
+
+# --- Внутренние модули ---
+from services import refunds
+from services.star_transactions import StarTxn
+
+TXN = StarTxn(id="charge-1", amount=100, date=0, incoming=True, user_id=1)
+METHOD = RefundStarPayment(user_id=1, telegram_payment_charge_id=TXN.id)
+
+
+class FakeBot:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def refund_star_payment(self, user_id, telegram_payment_charge_id):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return True
+
+
+class FakeLimiter:
+    async def acquire(self):
+        pass
+
+    def on_success(self):
+        pass
+
+    def on_flood(self, retry_after):
+        pass
+
+
+def _no_sleep(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(refunds, "get_purchase_limiter", lambda kind: FakeLimiter())
+    monkeypatch.setattr(refunds.asyncio, "sleep", fake_sleep)
+    return sleeps
+
+
+def test_already_refunded_after_timeout_is_ok(monkeypatch):
+    _no_sleep(monkeypatch)
+    bot = FakeBot(
+        TelegramNetworkError(METHOD, "timeout"),
+        TelegramBadRequest(METHOD, "Bad Request: CHARGE_ALREADY_REFUNDED")
+    )
+    result = asyncio.run(refunds.refund_one(bot, 1, TXN, retries=3))
+    assert result.ok and result.attempts == 2
+
+
+def test_no_sleep_after_last_attempt(monkeypatch):
+    sleeps = _no_sleep(monkeypatch)
+    bot = FakeBot(*(TelegramNetworkError(METHOD, "timeout") for _ in range(3)))
+    result = asyncio.run(refunds.refund_one(bot, 1, TXN, retries=3))
+    assert not result.ok and bot.calls == 3
+    assert sleeps == [2, 4]
@@ -0,0 +1,105 @@
+# --- Стандартные библиотеки ---
+import asyncio
+from types import SimpleNamespace
+
+# --- Внутренние модули ---
+from services import star_transactions
+from services.star_transactions import StarTransactionStore
+
+PAGE_SIZE = 3
+
+
+def _txn(n: int, user_id: int = 1, incoming: bool = True):
+    source = SimpleNamespace(user=SimpleNamespace(id=user_id, username=f"user{user_id}")) if incoming else None
+    return SimpleNamespace(id=f"txn-{n}", amount=10 * n, date=1000 + n, source=source)
+
+
+class FakeBot:
+    """
+    История транзакций на «сервере» и журнал запросов get_star_transactions.
+    """
+    def __init__(self, transactions, bot_id: int = 42):
+        self.id = bot_id
+        self.transactions = list(transactions)
+        self.requests = []
+
+    async def get_star_transactions(self, offset, limit):
+        self.requests.append((offset, limit))
+        return SimpleNamespace(transactions=self.transactions[offset:offset + limit])
+
+
+def _store(tmp_path, monkeypatch) -> StarTransactionStore:
+    monkeypatch.setattr(star_transactions, "STAR_TXN_PAGE_SIZE", PAGE_SIZE)
+    return StarTransactionStore(str(tmp_path / "star_transactions.json"))
+
+
+def test_sync_resumes_from_cursor(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+    bot = FakeBot([_txn(n) for n in range(1, 5)])
+
+    async def scenario():
+        first = await store.sync(bot)
+        bot.requests.clear()
+        bot.transactions += [_txn(5), _txn(6, incoming=False)]
+        second = await store.sync(bot)
+        return first, second
+
+    assert asyncio.run(scenario()) == (4, 2)
+    # Повторно запрашивается только последняя сохранённая транзакция (перекрытие)
+    assert bot.requests == [(3, PAGE_SIZE), (6, PAGE_SIZE)]
+    assert [t.id for t in store.transactions] == [f"txn-{n}" for n in range(1, 7)]
+    assert store.balance == 10 + 20 + 30 + 40 + 50 - 60
+
+
+def test_sync_reloads_when_server_history_changed(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+    bot = FakeBot([_txn(n) for n in range(1, 5)])
+
+    async def scenario():
+        await store.sync(bot)
+        # Последняя сохранённая транзакция на сервере уже другая
+        bot.transactions = [_txn(n) for n in (1, 2, 3, 7, 8)]
+        bot.requests.clear()
+        return await store.sync(bot)
+
+    assert asyncio.run(scenario()) == 5
+    assert bot.requests[0] == (3, PAGE_SIZE)
+    assert bot.requests[1] == (0, PAGE_SIZE)
+    assert [t.id for t in store.transactions] == ["txn-1", "txn-2", "txn-3", "txn-7", "txn-8"]
+    assert store.balance == 10 + 20 + 30 + 70 + 80
+
+
+def test_history_persists_across_reload(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+    bot = FakeBot([_txn(1, user_id=7), _txn(2, user_id=7), _txn(3, user_id=8)])
+
+    async def scenario():
+        await store.sync(bot)
+        reloaded = StarTransactionStore(store.path)
+        bot.requests.clear()
+        added = await reloaded.sync(bot)
+        return reloaded, added
+
+    reloaded, added = asyncio.run(scenario())
+    # После перезапуска курсор берётся из файла: история не загружается заново
+    assert added == 0
+    assert bot.requests == [(2, PAGE_SIZE)]
+    assert reloaded.transactions == store.transactions
+    assert [t.id for t in reloaded.unrefunded_deposits(user_id=7)] == ["txn-1", "txn-2"]
+    assert [t.id for t in reloaded.deposits_by_user(username="USER8")] == ["txn-3"]
+
+
+def test_history_of_another_bot_is_reloaded(tmp_path, monkeypatch):
+    store = _store(tmp_path, monkeypatch)
+
+    async def scenario():
+        await store.sync(FakeBot([_txn(1), _txn(2)], bot_id=1))
+        other = FakeBot([_txn(3)], bot_id=2)
+        reloaded = StarTransactionStore(store.path)
+        added = await reloaded.sync(other)
+        return reloaded, other, added
+
+    reloaded, other, added = asyncio.run(scenario())
+    assert added == 1
+    assert other.requests == [(0, PAGE_SIZE)]
+    assert [t.id for t in reloaded.transactions] == ["txn-3"]
@@ -0,0 +1,25 @@
+# --- Стандартные библиотеки ---
+import asyncio
+
+# --- Внутренние модули ---
+from services import userbot_pool
+from services.userbot_pool import PoolMember, refresh_pool_balances
+
+
+class FakeClient:
+    def __init__(self, stars: int):
+        self.stars = stars
+
+    async def get_stars_balance(self):
+        return self.stars
+
+
+def test_pool_total_keeps_unready_member_balance(monkeypatch):
+    online = PoolMember("a", FakeClient(100), primary=True)
+    offline = PoolMember("b", FakeClient(0))
+    offline.ledger.reconcile(50)
+    offline.ready = False
+    monkeypatch.setattr(userbot_pool, "_members", {"a": online, "b": offline})
+
+    assert asyncio.run(refresh_pool_balances()) == 150
+    assert online.ledger.balance == 100
@@ -1,10 +1,21 @@
+def get_proxy_url(db_proxy):
+    """
+    Собирает URL SOCKS5-прокси (socks5://[username:password@]hostname:port) для aiohttp и проверок задержки.
+    """
+    credentials = ""
+    if db_proxy.get("username"):
+        credentials = f"{db_proxy.get('username')}:{db_proxy.get('password') or ''}@"
+    return f"socks5://{credentials}{db_proxy.get('hostname')}:{db_proxy.get('port')}"
+
+
 def get_userbot_proxy(db_proxy):
-    proxy_url = f"socks5://{db_proxy.get('username')}:{db_proxy.get('password')}@{db_proxy.get('hostname')}:{db_proxy.get('port')}"
+    """
+    Собирает описание SOCKS5-прокси в формате Pyrogram (Client(proxy=...)).
+    """
     return {
-        "proxy_type": "socks5",
-        "addr": db_proxy.get("hostname"),
+        "scheme": "socks5",
+        "hostname": db_proxy.get("hostname"),
         "port": int(db_proxy.get("port")),
         "username": db_proxy.get("username"),
-        "password": db_proxy.get("password"),
-        "url": proxy_url
+        "password": db_proxy.get("password")
     }